@@ -0,0 +1,116 @@
+import os
+import random
+from dataclasses import dataclass
+from typing import List
+
+VOCABULARY = (
+    "graph neural network node embedding spectral convolution attention transformer layer training loss "
+    "optimization gradient descent convergence theorem lemma proof bound generalization dataset benchmark "
+    "accuracy baseline ablation hyperparameter regularization variance robustness sample complexity "
+    "representation learning objective inference posterior sampling distribution kernel feature encoder"
+).split()
+FILLER = "we the of and to in a is that for this our with as on are by be which".split()
+
+SECTIONS = ["Introduction", "Related Work", "Method", "Experiments", "Conclusion"]
+LINES_PER_PAGE = 45
+WORDS_PER_LINE = 12
+
+
+@dataclass
+class SyntheticPaper:
+    pdf_path: str
+    text: str
+    reviews: List[str]
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(VOCABULARY if rng.random() < 0.5 else FILLER) for _ in range(words)).capitalize() + "."
+
+
+def synthetic_paper_text(rng: random.Random, pages: int) -> str:
+    """
+    Paper-like text of about `pages` pages with an abstract, numbered sections and references
+    """
+    total_lines = pages * LINES_PER_PAGE
+    lines = ["A Synthetic Study of " + " ".join(rng.choice(VOCABULARY) for _ in range(4)).title(), "Abstract"]
+    lines += [_sentence(rng, WORDS_PER_LINE) for _ in range(8)]
+    body_lines = (total_lines - len(lines)) * 4 // 5
+    for number, section in enumerate(SECTIONS, start=1):
+        lines.append(f"{number} {section}")
+        lines += [_sentence(rng, WORDS_PER_LINE) for _ in range(body_lines // len(SECTIONS))]
+    lines.append("References")
+    while len(lines) < total_lines:
+        lines.append(f"[{len(lines)}] A. Author. " + _sentence(rng, 8))
+    return "\n".join(lines)
+
+
+def synthetic_review(rng: random.Random, comments: int = 4) -> str:
+    """
+    Review in the format returned by format_review_content, with `comments` weaknesses and questions
+    """
+    weaknesses = "\n".join(f"- {_sentence(rng, rng.randint(10, 25))}" for _ in range(comments))
+    questions = "\n".join(f"- {_sentence(rng, rng.randint(8, 16))}" for _ in range(comments))
+    return (
+        f"**Summary**: {_sentence(rng, 30)}\n\n"
+        f"**Strengths**: {_sentence(rng, 20)}\n\n"
+        f"**Weaknesses**: {weaknesses}\n\n"
+        f"**Questions**: {questions}"
+    )
+
+
+def write_pdf(path: str, text: str) -> None:
+    """
+    Write text to a minimal PDF, LINES_PER_PAGE lines per page, readable by pypdf
+    """
+    lines = text.split("\n")
+    pages = [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)]
+    # Objects: 1 catalog, 2 page tree, 3 font, then a page and its content stream per page
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages)))
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, page in enumerate(pages):
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in page)
+        content = "BT /F1 9 Tf 16 TL 40 760 Td " + " ".join(f"({line}) Tj T*" for line in escaped) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+
+    pdf, offsets = "%PDF-1.4\n", []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{obj}\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n" + "".join(f"{o:010d} 00000 n \n" for o in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    with open(path, "w", encoding="latin-1") as f:
+        f.write(pdf)
+
+
+def make_corpus(directory: str, papers: int = 4, pages: int = 12, reviews_per_paper: int = 3, seed: int = 0) -> List[SyntheticPaper]:
+    """
+    Write a reproducible corpus of synthetic paper PDFs to `directory`, each with synthetic reviews
+
+    Params:
+        directory: directory the PDFs are written to
+        papers: number of papers
+        pages: number of pages per paper
+        reviews_per_paper: number of reviews per paper
+        seed: seed of the corpus
+
+    Returns:
+        papers: list of papers with their PDF path, text and reviews
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(papers):
+        text = synthetic_paper_text(rng, pages)
+        pdf_path = os.path.join(directory, f"paper-{seed}-{i}.pdf")
+        write_pdf(pdf_path, text)
+        corpus.append(SyntheticPaper(pdf_path, text, [synthetic_review(rng) for _ in range(reviews_per_paper)]))
+    return corpus
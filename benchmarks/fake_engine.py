@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+from review_feedback_agent.apis import tracing
+from review_feedback_agent.reliability.reliability_tests import ReliabilityRegistry
+
+WORDS = (
+    "the model method results experiments baseline dataset ablation theorem proof convergence training "
+    "evaluation metric accuracy section figure table claim assumption analysis comparison variance "
+    "clarify specify which how why provide report justify explain reviewer authors paper"
+).split()
+
+
+class FakeEngineError(Exception):
+    # Reported as the provider's "overloaded" status, so that schedulers retry it
+    status_code = 529
+
+
+@dataclass
+class FakeCall:
+    system_prompt: str
+    input_tokens: int
+    output_tokens: int
+    cache_read_tokens: int
+    cache_write_tokens: int
+    failed: bool
+
+
+class FakeEngine:
+    # Overridden per instance, see prompt_cache
+    supports_cache_control = False
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        tokens_per_second: Optional[float] = None,
+        output_tokens: int = 300,
+        failure_rate: float = 0.0,
+        prompt_cache: bool = False,
+        seed: int = 0,
+    ):
+        """
+        Deterministic local stand-in for an LLM engine, for benchmarking the pipeline without calling a model
+
+        Outputs are derived from a hash of the prompt, so the same prompt always gets the same output.
+        Pipeline stages get feedback in the Formatter's output format, and reliability verifiers get the
+        verdict that passes their test. Calls sleep for `latency` seconds plus the time to generate the
+        output at `tokens_per_second`.
+
+        Params:
+            latency: seconds before the first output token
+            tokens_per_second: output token rate, instantaneous if None
+            output_tokens: approximate number of tokens of each pipeline stage output
+            failure_rate: probability that a call raises FakeEngineError, drawn from the prompt and the
+                number of times it was sent so that a retried prompt can succeed
+            prompt_cache: whether to accept content blocks with cache_control breakpoints and simulate a
+                provider prompt cache, reporting cache read and write tokens. As with the provider's cache, the
+                prompt up to each breakpoint is cached once the call completes, and a call reads the longest
+                cached prefix ending at one of its breakpoints
+            seed: seed of the outputs and failures
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.failure_rate = failure_rate
+        self.supports_cache_control = prompt_cache
+        self.seed = seed
+        self.calls: List[FakeCall] = []
+        self._attempts = Counter()
+        self._cached_prefixes = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, message: Union[List[Dict[str, Any]], str], system_prompt: str, **kwargs) -> str:
+        output, prefixes = self._respond(message, system_prompt)
+        time.sleep(self._duration(output))
+        self._cache_prefixes(prefixes)
+        return output
+
+    async def acall(self, message: Union[List[Dict[str, Any]], str], system_prompt: str, **kwargs) -> str:
+        output, prefixes = self._respond(message, system_prompt)
+        await asyncio.sleep(self._duration(output))
+        self._cache_prefixes(prefixes)
+        return output
+
+    def stream(self, message: Union[List[Dict[str, Any]], str], system_prompt: str, **kwargs) -> Iterator[str]:
+        output, prefixes = self._respond(message, system_prompt)
+        time.sleep(self.latency)
+        words = output.split(" ")
+        for i, word in enumerate(words):
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield word if i == len(words) - 1 else word + " "
+        self._cache_prefixes(prefixes)
+
+    def with_model(self, model_name: str) -> "FakeEngine":
+        # The outputs do not depend on the model, but each model has its own prompt cache and calls
+        return FakeEngine(
+            self.latency, self.tokens_per_second, self.output_tokens, self.failure_rate, self.supports_cache_control, self.seed
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls.clear()
+            self._attempts.clear()
+            self._cached_prefixes.clear()
+
+    def _duration(self, output: str) -> float:
+        if not self.tokens_per_second:
+            return self.latency
+        return self.latency + len(output.split()) / self.tokens_per_second
+
+    def _prefixes(self, message: List[Dict[str, Any]], system_prompt: str) -> List[Tuple[str, int]]:
+        # (digest, tokens) of the prompt up to each cache breakpoint, system prompt included, in order. Prefixes
+        # are kept as digests so that the simulated cache does not weigh on memory benchmarks.
+        digest = hashlib.sha256(f"{system_prompt}\0".encode("utf-8"))
+        length, prefixes = len(system_prompt), []
+        for block in message:
+            digest.update(block["text"].encode("utf-8"))
+            length += len(block["text"])
+            if "cache_control" in block:
+                prefixes.append((digest.copy().hexdigest(), length // 4))
+        return prefixes
+
+    def _cache_prefixes(self, prefixes: List[Tuple[str, int]]) -> None:
+        # Like the provider's cache, a prefix can only be read by calls sent after the call writing it has completed
+        with self._lock:
+            self._cached_prefixes.update(digest for digest, _ in prefixes)
+
+    def _respond(self, message: Union[List[Dict[str, Any]], str], system_prompt: str) -> Tuple[str, List[Tuple[str, int]]]:
+        # Output of the call, and the prefixes to add to the simulated prompt cache once the call has completed
+        if isinstance(message, list):
+            text = "".join(block["text"] for block in message)
+            prefixes = self._prefixes(message, system_prompt)
+        else:
+            text, prefixes = message, []
+
+        digest = hashlib.sha256(f"{self.seed}\0{system_prompt}\0{text}".encode("utf-8")).hexdigest()
+        with self._lock:
+            attempt = self._attempts[digest]
+            self._attempts[digest] += 1
+            # The cache is read from the longest cached prefix, the rest of the prompt up to the last breakpoint is written
+            read_tokens = max((tokens for prefix, tokens in prefixes if prefix in self._cached_prefixes), default=0)
+
+        failed = random.Random(f"{digest}:{attempt}").random() < self.failure_rate
+        prefix_tokens = prefixes[-1][1] if prefixes else 0
+        output = "" if failed else self._output(digest, system_prompt)
+        call = FakeCall(
+            system_prompt=system_prompt,
+            input_tokens=(len(system_prompt) + len(text)) // 4 - prefix_tokens,
+            output_tokens=len(output) // 4,
+            cache_read_tokens=read_tokens,
+            cache_write_tokens=prefix_tokens - read_tokens,
+            failed=failed,
+        )
+        with self._lock:
+            self.calls.append(call)
+        if failed:
+            raise FakeEngineError("Simulated engine failure")
+
+        tracing.record_usage(call.input_tokens, call.output_tokens, call.cache_read_tokens, call.cache_write_tokens)
+        return output, prefixes
+
+    def _output(self, digest: str, system_prompt: str) -> str:
+        if "<TEST name=" in system_prompt:
+            return "".join(
+                f'<OUTPUT name="{name}"> {test.expected_output.upper()} </OUTPUT>\n'
+                for name, test in ReliabilityRegistry.properties.items()
+                if f'<TEST name="{name}">' in system_prompt
+            )
+        for test in ReliabilityRegistry.properties.values():
+            if test.verifier_instruction in system_prompt:
+                return f"<REASONING> Checked every comment. </REASONING> <OUTPUT> {test.expected_output.upper()} </OUTPUT>"
+
+        rng = random.Random(digest)
+        items, tokens = [], 0
+        while tokens < self.output_tokens:
+            comment = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20)))
+            feedback = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 50)))
+            items.append(f"- **Reviewer comment:** {comment}\n- **Feedback to the reviewer:** {feedback}")
+            tokens += (len(items[-1]) + 2) // 4
+        return "\n\n".join(items)
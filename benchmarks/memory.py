@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import random
+import resource
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict
+from benchmarks.corpus import synthetic_paper_text, synthetic_review
+from benchmarks.fake_engine import FakeEngine
+from benchmarks.run import _format_table
+from review_feedback_agent.agents import FeedbackAgent
+from review_feedback_agent.agents.paper import Paper
+from review_feedback_agent.apis import LLM
+
+MODES = ["eager", "lazy"]
+
+
+def _peak_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _format_eagerly(template: str, **values: Any) -> str:
+    return template.format(**{key: str(value) for key, value in values.items()})
+
+
+def _copy_paper(paper: Any) -> Paper:
+    # Handle on a private copy of the text, as each run held its own copy of the paper before Paper.intern
+    if isinstance(paper, Paper):
+        return paper
+    text = paper.encode("utf-8").decode("utf-8")
+    return Paper(text, hashlib.sha256(paper.encode("utf-8")).hexdigest())
+
+
+def bench_memory(
+    mode: str,
+    architecture: str,
+    papers: int,
+    pages: int,
+    reviews_per_paper: int,
+    max_concurrency: int,
+    latency: float,
+    shared_prefix: bool,
+    seed: int,
+) -> Dict[str, Any]:
+    """
+    Run every review at once with the engine calls limited to max_concurrency, so that most reviews wait for a
+    call slot, and measure the peak resident memory of the process. Meant to run in a fresh process per mode.
+
+    Params:
+        mode: "lazy" formats prompts when they are sent, "eager" formats them when they are built and gives each
+            run its own copy of the paper text, as before runs shared an interned paper handle
+        architecture: architecture string of the agent
+        papers: number of papers
+        pages: number of pages per paper
+        reviews_per_paper: number of reviews per paper, each paper is shared by its reviews
+        max_concurrency: maximum number of engine calls in flight
+        latency: seconds per fake engine call
+        shared_prefix: whether to run the agent with shared_prefix=True
+        seed: seed of the corpus
+
+    Returns:
+        dict: peak resident memory of the run beyond the memory used before it, in total and per in-flight review
+    """
+    if mode == "eager":
+        from review_feedback_agent.agents import base, components
+
+        base.LazyPrompt = components.LazyPrompt = _format_eagerly
+        Paper.intern = staticmethod(_copy_paper)
+
+    rng = random.Random(seed)
+    corpus = [(synthetic_paper_text(rng, pages), [synthetic_review(rng) for _ in range(reviews_per_paper)]) for _ in range(papers)]
+    agent = FeedbackAgent(
+        LLM("sonnet-3.5", engine=FakeEngine(latency=latency, prompt_cache=shared_prefix, seed=seed), max_concurrency=max_concurrency),
+        architecture=architecture,
+        shared_prefix=shared_prefix,
+    )
+
+    async def run() -> None:
+        await asyncio.gather(*(agent.acall(paper, review) for paper, reviews in corpus for review in reviews))
+
+    before = _peak_rss_bytes()
+    asyncio.run(run())
+    peak = _peak_rss_bytes() - before
+    reviews = papers * reviews_per_paper
+    return {
+        "mode": mode,
+        "architecture": architecture,
+        "reviews in flight": reviews,
+        "paper MB": sum(len(paper) for paper, _ in corpus) / papers / 2**20,
+        "peak RSS MB": peak / 2**20,
+        "peak RSS per review MB": peak / reviews / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the peak resident memory per in-flight review with a fake engine")
+    parser.add_argument("--architecture", default="Actor(2)->Aggregator->FeedbackCritic->Formatter")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--papers", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--reviews-per-paper", type=int, default=3)
+    parser.add_argument("--max-concurrency", type=int, default=8, help="Maximum number of engine calls in flight")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per fake engine call")
+    parser.add_argument("--shared-prefix", action="store_true", help="Run the agent with shared_prefix=True")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes:
+        # Each mode runs in a fresh process, as the peak resident memory of a process cannot be reset
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results.append(
+                executor.submit(
+                    bench_memory,
+                    mode,
+                    args.architecture,
+                    args.papers,
+                    args.pages,
+                    args.reviews_per_paper,
+                    args.max_concurrency,
+                    args.latency,
+                    args.shared_prefix,
+                    args.seed,
+                ).result()
+            )
+
+    print(_format_table(results, list(results[0])))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"options": vars(args), "memory": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import json
+import math
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from benchmarks.corpus import make_corpus
+from benchmarks.fake_engine import FakeEngine
+from review_feedback_agent.agents import FeedbackAgent
+from review_feedback_agent.apis import LLM, Scheduler
+from review_feedback_agent.reliability.run_reliability_tests import run_reliability_tests
+from review_feedback_agent.utils.utils import pdf_to_text
+
+DEFAULT_ARCHITECTURES = [
+    "Actor->FeedbackCritic->Formatter",
+    "Actor(2)->Aggregator->FeedbackCritic->Formatter",
+    "Actor(4)->Aggregator->FeedbackCritic->Formatter",
+    "Actor(2)[pruned]->Aggregator[pruned]->FeedbackCritic[pruned]->Formatter",
+]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of `values`, q between 0 and 100, None if there are no values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def bench_pdf(pdf_paths: List[str], num_workers: int) -> Dict[str, Any]:
+    latencies, characters = [], 0
+    start = time.perf_counter()
+    for pdf_path in pdf_paths:
+        call_start = time.perf_counter()
+        characters += len(pdf_to_text(pdf_path, num_workers=num_workers))
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    return {
+        "papers": len(pdf_paths),
+        "papers per second": len(pdf_paths) / elapsed,
+        "p50 seconds": percentile(latencies, 50),
+        "p99 seconds": percentile(latencies, 99),
+        "characters": characters,
+    }
+
+
+def _run_review(agent: FeedbackAgent, paper: str, review: str, mode: str) -> Tuple[Dict[str, Any], Optional[float]]:
+    # Returns the agent's result and, when streaming, the time to the first Formatter token
+    if mode != "stream":
+        return agent(paper, review), None
+    start, first_token = time.perf_counter(), None
+    for event in agent.stream(paper, review):
+        if event["event"] == "token" and first_token is None:
+            first_token = time.perf_counter() - start
+        elif event["event"] == "result":
+            return event["result"], first_token
+
+
+def bench_agent(
+    pairs: List[Tuple[str, str]],
+    architecture: str,
+    engine_options: Dict[str, Any],
+    mode: str = "sync",
+    concurrency: int = 4,
+    cache_dir: Optional[str] = None,
+    run_tests: bool = True,
+    test_options: Optional[Dict[str, Any]] = None,
+    measure_memory: bool = True,
+    shared_prefix: bool = False,
+    scheduler_options: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Generate (and verify) feedback for every (paper, review) pair with a fake engine
+
+    Params:
+        pairs: (paper text, review text) pairs
+        architecture: architecture string of the agent
+        engine_options: keyword arguments of FakeEngine
+        mode: "sync" runs reviews in a thread pool, "async" with FeedbackAgent.acall, and "stream" with FeedbackAgent.stream
+        concurrency: number of reviews processed at once
+        cache_dir: directory of the LLM completion cache, disabled if None
+        run_tests: whether to run the reliability tests on each generated feedback
+        test_options: keyword arguments of run_reliability_tests
+        measure_memory: whether to trace Python allocations for the peak memory, which slows the run down
+        shared_prefix: whether to run the agent with shared_prefix=True
+        scheduler_options: keyword arguments of the Scheduler of the engine calls, calls are not scheduled if None
+
+    Returns:
+        dict: throughput of successful reviews, latency percentiles, peak memory and LLM calls per review
+    """
+    engine = FakeEngine(**engine_options)
+    verifier_engine = FakeEngine(**engine_options)
+    scheduler = Scheduler(**scheduler_options) if scheduler_options is not None else None
+    agent = FeedbackAgent(
+        LLM("sonnet-3.5", engine=engine, cache_dir=cache_dir, scheduler=scheduler),
+        architecture=architecture,
+        shared_prefix=shared_prefix,
+    )
+    verifier_llm = LLM("sonnet-3.5", engine=verifier_engine, scheduler=scheduler)
+
+    latencies, first_tokens, errors = [], [], 0
+
+    def process(pair: Tuple[str, str]) -> None:
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            result, first_token = _run_review(agent, *pair, mode)
+            if run_tests:
+                run_reliability_tests(
+                    result["formatted feedback"], pair[1], verifier_llm=verifier_llm, **(test_options or {})
+                )
+        except Exception:
+            errors += 1
+            return
+        latencies.append(time.perf_counter() - start)
+        if first_token is not None:
+            first_tokens.append(first_token)
+
+    async def aprocess(pair: Tuple[str, str], semaphore: asyncio.Semaphore) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await agent.acall(*pair)
+                if run_tests:
+                    await asyncio.to_thread(
+                        run_reliability_tests,
+                        result["formatted feedback"],
+                        pair[1],
+                        verifier_llm=verifier_llm,
+                        **(test_options or {}),
+                    )
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    async def arun() -> None:
+        semaphore = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*(aprocess(pair, semaphore) for pair in pairs))
+
+    if measure_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if mode == "async":
+        asyncio.run(arun())
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(process, pairs))
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if measure_memory else None
+    if measure_memory:
+        tracemalloc.stop()
+
+    # Time a review would take if the pipeline added nothing to the engine calls on its critical path
+    critical_path = len(agent.plan.levels) * engine_options.get("latency", 0.0)
+    return {
+        "architecture": architecture,
+        "mode": mode,
+        "reviews": len(pairs),
+        "errors": errors,
+        "reviews per second": len(latencies) / elapsed,
+        "p50 seconds": percentile(latencies, 50),
+        "p99 seconds": percentile(latencies, 99),
+        "p50 first token seconds": percentile(first_tokens, 50),
+        # Only meaningful when every step calls the engine
+        "mean overhead seconds": (
+            sum(latencies) / len(latencies) - critical_path if latencies and not run_tests and cache_dir is None else None
+        ),
+        "peak memory MB": peak / 2**20 if peak is not None else None,
+        "calls per review": len(engine.calls) / len(pairs),
+        "failed calls per review": sum(call.failed for call in engine.calls) / len(pairs),
+        "verifier calls per review": len(verifier_engine.calls) / len(pairs),
+        "input tokens per review": sum(call.input_tokens for call in engine.calls) / len(pairs),
+        "prompt cache read tokens per review": sum(call.cache_read_tokens for call in engine.calls) / len(pairs),
+    }
+
+
+def _format_table(rows: List[Dict[str, Any]], columns: List[str]) -> str:
+    def cell(value):
+        if isinstance(value, float):
+            return f"{value:.4g}"
+        return "-" if value is None else str(value)
+
+    cells = [[cell(row.get(column)) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(r[i]) for r in cells)) for i, column in enumerate(columns)]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths))]
+    lines += ["  ".join(value.ljust(width) for value, width in zip(r, widths)) for r in cells]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the feedback pipeline offline with a deterministic fake engine")
+    parser.add_argument("--architectures", nargs="+", default=DEFAULT_ARCHITECTURES)
+    parser.add_argument("--papers", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=12)
+    parser.add_argument("--reviews-per-paper", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=["sync", "async", "stream"], default="sync")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per fake engine call before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="Fake output token rate, instantaneous if not given")
+    parser.add_argument("--output-tokens", type=int, default=300)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--prompt-cache", action="store_true", help="Simulate a provider prompt cache")
+    parser.add_argument("--max-retries", type=int, default=None, help="Retry failed calls with a Scheduler")
+    parser.add_argument("--requests-per-minute", type=float, default=None, help="Rate limit calls with a Scheduler")
+    parser.add_argument("--tokens-per-minute", type=float, default=None, help="Rate limit tokens with a Scheduler")
+    parser.add_argument("--shared-prefix", action="store_true", help="Run the agent with shared_prefix=True")
+    parser.add_argument("--completion-cache", action="store_true", help="Run each architecture twice with an LLM completion cache")
+    parser.add_argument("--skip-tests", action="store_true", help="Do not run the reliability tests")
+    parser.add_argument("--combined-verification", action="store_true")
+    parser.add_argument("--precheck", action="store_true")
+    parser.add_argument("--pdf-workers", type=int, default=1, help="Extract PDF pages with a pool of this many processes")
+    parser.add_argument("--no-memory", action="store_true", help="Do not trace allocations for the peak memory")
+    parser.add_argument("--json", default=None, help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        corpus = make_corpus(directory, args.papers, args.pages, args.reviews_per_paper, args.seed)
+        pdf_result = bench_pdf([paper.pdf_path for paper in corpus], args.pdf_workers)
+        pairs = [(pdf_to_text(paper.pdf_path, num_workers=1), review) for paper in corpus for review in paper.reviews]
+
+        engine_options = {
+            "latency": args.latency,
+            "tokens_per_second": args.tokens_per_second,
+            "output_tokens": args.output_tokens,
+            "failure_rate": args.failure_rate,
+            "prompt_cache": args.prompt_cache,
+            "seed": args.seed,
+        }
+        test_options = {"combined": args.combined_verification, "precheck": args.precheck}
+        scheduler_options = None
+        if args.max_retries is not None or args.requests_per_minute or args.tokens_per_minute:
+            scheduler_options = {
+                "requests_per_minute": args.requests_per_minute,
+                "tokens_per_minute": args.tokens_per_minute,
+                "max_retries": args.max_retries if args.max_retries is not None else 5,
+                "initial_backoff": args.latency,
+            }
+
+        results = []
+        for architecture in args.architectures:
+            passes = ["cold", "warm"] if args.completion_cache else [None]
+            cache_dir = tempfile.mkdtemp(dir=directory) if args.completion_cache else None
+            for cache_pass in passes:
+                result = bench_agent(
+                    pairs,
+                    architecture,
+                    engine_options,
+                    mode=args.mode,
+                    concurrency=args.concurrency,
+                    cache_dir=cache_dir,
+                    run_tests=not args.skip_tests,
+                    test_options=test_options,
+                    measure_memory=not args.no_memory,
+                    shared_prefix=args.shared_prefix,
+                    scheduler_options=scheduler_options,
+                )
+                if cache_pass:
+                    result["cache"] = cache_pass
+                results.append(result)
+
+    print(f"pdf_to_text: {_format_table([pdf_result], list(pdf_result))}\n")
+    columns = [
+        "architecture", "cache", "errors", "reviews per second", "p50 seconds", "p99 seconds",
+        "p50 first token seconds", "mean overhead seconds", "peak memory MB", "calls per review", "failed calls per review", "verifier calls per review",
+    ]
+    print(_format_table(results, [column for column in columns if any(column in r for r in results)]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"options": vars(args), "pdf_to_text": pdf_result, "agent": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
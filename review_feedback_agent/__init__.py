@@ -1,3 +1,3 @@
-from .apis import LLM
+from .apis import LLM, AnthropicEngine, Scheduler
 from .agents import Component, FeedbackAgent
 from .agents.components import FeedbackActor, Aggregator, FeedbackCritic, Formatter
@@ -1,3 +1,4 @@
 from .base import Component
 from .components import FeedbackActor, Aggregator, FeedbackCritic, Formatter
 from .feedback_agent import FeedbackAgent
+from .session import PaperSession
@@ -1,13 +1,100 @@
 from abc import ABC, abstractmethod
+from typing import List, Dict, Any, FrozenSet, Optional, Union
+from review_feedback_agent.agents.paper import LazyPrompt, Paper
+from review_feedback_agent.agents.prompts import PAPER_CONTEXT_PROMPT, REVIEW_CONTEXT_PROMPT
 from review_feedback_agent.apis import LLM
+from review_feedback_agent.utils.feedback_parsing import NO_FEEDBACK_MESSAGE, parse_feedback
 import textgrad as tg
 
 
 class Component(tg.autograd.Module):
-    def __init__(self, llm_api: LLM, system_prompt: str):
+    # Whether consecutive copies of this component only read the paper and review,
+    # so that they can be run concurrently (e.g. the Actor(n) replicas)
+    parallelizable: bool = False
+    # Whether the component takes the paper as input, and so can be given a pruned paper
+    uses_paper: bool = True
+    # Type of the component's output, and types of upstream outputs it accepts as input,
+    # checked when an architecture is compiled
+    output_type: str = "feedback"
+    input_types: FrozenSet[str] = frozenset()
+    # Number of upstream outputs the component takes, unbounded if max_inputs is None
+    min_inputs: int = 0
+    max_inputs: Optional[int] = 0
+
+    def __init__(self, llm_api: LLM, system_prompt: str, shared_prefix: bool = False):
         self.llm_api = llm_api
         self.system_prompt = system_prompt
+        self.shared_prefix = shared_prefix
 
     @abstractmethod
     def __call__(self, *args, **kwargs):
         pass
+
+    async def acall(self, *args, **kwargs):
+        return await self.aforward(*args, **kwargs)
+
+    @abstractmethod
+    async def aforward(self, *args, **kwargs):
+        pass
+
+    @abstractmethod
+    def inputs(self, feedbacks: List[str], paper: Union[str, Paper], review: str) -> Dict[str, Any]:
+        """
+        Keyword arguments of a call to the component
+
+        Params:
+            feedbacks: outputs of the upstream steps the component takes as input, in order
+            paper: paper text
+            review: review text
+        """
+        pass
+
+    def validate(self, output: str, review: str) -> bool:
+        """
+        Whether an output of the component is well formed, checked when the step is cascaded to
+        decide whether to rerun it on the larger model
+
+        Params:
+            output: output of the component
+            review: review text
+
+        Returns:
+            bool: True if the output is a list of reviewer comments each with feedback, or the message given when
+                there is no feedback
+        """
+        items = parse_feedback(output, review)
+        if not items:
+            return NO_FEEDBACK_MESSAGE in output
+        return all(item.feedback for item in items)
+
+    def _build_prefixed_message(self, paper: Union[str, Paper], review: str, suffix: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Build a structured message leading with the paper and then the review, with a cache breakpoint after
+        each. The provider's cache prefix includes the system prompt, which differs between stages, so a prefix
+        is only reused by later calls of the same stage: calls on other reviews of the same paper read it up
+        to the paper, and calls on the same review up to the review. The paper block is only formatted when
+        the message is sent.
+
+        Params:
+            paper: paper handle or text
+            review: review text
+            suffix: stage-specific part of the message, placed after the shared prefix
+
+        Returns:
+            list: content blocks of the message
+        """
+        blocks = [
+            {
+                "type": "text",
+                "text": LazyPrompt(PAPER_CONTEXT_PROMPT, paper=paper),
+                "cache_control": {"type": "ephemeral"},
+            },
+            {
+                "type": "text",
+                "text": REVIEW_CONTEXT_PROMPT.format(review=review),
+                "cache_control": {"type": "ephemeral"},
+            },
+        ]
+        if suffix:
+            blocks.append({"type": "text", "text": suffix})
+        return blocks
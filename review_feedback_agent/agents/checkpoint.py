@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+# Version of the checkpoint layout, checkpoints of other versions are ignored
+CHECKPOINT_VERSION = 3
+
+
+def checkpoint_key(paper: str, review: str, architecture: str, settings: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Key of the checkpoint of a run
+
+    Params:
+        paper: paper text
+        review: review text
+        architecture: architecture string of the agent
+        settings: other JSON-serializable settings of the agent the step outputs depend on, e.g. the model of each component
+
+    Returns:
+        sha256 hex digest of the paper, review, architecture and settings
+    """
+    digest = hashlib.sha256()
+    for part in (paper, review, architecture, json.dumps(settings or {}, sort_keys=True)):
+        data = part.encode("utf-8")
+        # Length-prefixed so that different splits of the same characters give different keys
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class CheckpointStore(ABC):
+    """
+    Store of the intermediate state of agent runs, so that a failed run can resume after its completed steps
+    """
+
+    @abstractmethod
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def save(self, key: str, checkpoint: Dict[str, Any]) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+    @staticmethod
+    def _decode(serialized: str) -> Optional[Dict[str, Any]]:
+        try:
+            checkpoint = json.loads(serialized)
+        except json.JSONDecodeError:
+            return None
+        return checkpoint if checkpoint.get("version") == CHECKPOINT_VERSION else None
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    def __init__(self, path: str):
+        """
+        Checkpoints in a local SQLite database, safe to share between threads and processes
+
+        Params:
+            path: path to the database file, created if it does not exist
+        """
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS checkpoints (key TEXT PRIMARY KEY, checkpoint TEXT NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads, so each thread opens its own
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = sqlite3.connect(self.path, timeout=30)
+        return self._local.connection
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT checkpoint FROM checkpoints WHERE key = ?", (key,)).fetchone()
+        return self._decode(row[0]) if row else None
+
+    def save(self, key: str, checkpoint: Dict[str, Any]) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO checkpoints (key, checkpoint) VALUES (?, ?)", (key, json.dumps(checkpoint))
+            )
+
+    def delete(self, key: str) -> None:
+        with self._connection() as connection:
+            connection.execute("DELETE FROM checkpoints WHERE key = ?", (key,))
+
+
+class DirectoryCheckpointStore(CheckpointStore):
+    def __init__(self, directory: str):
+        """
+        Checkpoints as JSON files in a directory, one per run
+
+        Params:
+            directory: directory of the checkpoints, created if it does not exist
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key)) as f:
+                return self._decode(f.read())
+        except FileNotFoundError:
+            return None
+
+    def save(self, key: str, checkpoint: Dict[str, Any]) -> None:
+        # Written to a temporary file first so that a crash never leaves a partial checkpoint
+        with tempfile.NamedTemporaryFile("w", dir=self.directory, delete=False, suffix=".tmp") as f:
+            json.dump(checkpoint, f)
+        os.replace(f.name, self._path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
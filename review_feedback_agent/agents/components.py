@@ -2,19 +2,27 @@ from .prompts import (
     ACTOR_PROMPT,
     ACTOR_SYSTEM_PROMPT,
     AGGREGATOR_PROMPT,
+    AGGREGATOR_SUFFIX_PROMPT,
     AGGREGATOR_SYSTEM_PROMPT,
     CRITIC_PROMPT,
+    CRITIC_SUFFIX_PROMPT,
     CRITIC_SYSTEM_PROMPT,
     FORMATTER_PROMPT,
     FORMATTER_SYSTEM_PROMPT,
 )
 from review_feedback_agent.agents.base import Component
+from review_feedback_agent.agents.paper import LazyPrompt, Paper
 from review_feedback_agent.apis import LLM
-from typing import List
+from review_feedback_agent.reliability.rule_checks import RULE_CHECKS, run_rule_checks
+from review_feedback_agent.utils.feedback_parsing import parse_feedback
+from typing import List, Dict, Any, Iterator, Union
 
 
 class FeedbackActor(Component):
-    def __init__(self, llm_api: LLM, system_prompt: str = ACTOR_SYSTEM_PROMPT):
+    parallelizable = True
+    output_type = "feedback"
+
+    def __init__(self, llm_api: LLM, system_prompt: str = ACTOR_SYSTEM_PROMPT, shared_prefix: bool = False):
         """Component to generate feedback
 
         Params:
@@ -22,21 +30,46 @@ class FeedbackActor(Component):
                 type llm_api: LLM        
             system_prompt: Actor system prompt
                 type system_prompt: str
+            shared_prefix: Whether to send the paper and review as a cacheable shared prefix
+                type shared_prefix: bool
         """
-        super().__init__(llm_api, system_prompt)
+        super().__init__(llm_api, system_prompt, shared_prefix)
 
-    def __call__(self, paper: str, review: str) -> str:
-        return self.forward(paper, review)
+    def __call__(self, paper: Union[str, Paper], review: str, replica: int = 0) -> str:
+        return self.forward(paper, review, replica)
 
-    def forward(self, paper: str, review: str) -> str:
+    # Replicas of the actor are meant to give diverse feedback, so each replica
+    # index gets its own entry in the LLM cache
+    def forward(self, paper: Union[str, Paper], review: str, replica: int = 0) -> str:
         return self.llm_api(
-            message=ACTOR_PROMPT.format(review=review, paper=paper),
+            message=self._build_message(paper, review),
+            system_prompt=self.system_prompt,
+            cache_salt=f"replica-{replica}",
+        )
+
+    async def aforward(self, paper: Union[str, Paper], review: str, replica: int = 0) -> str:
+        return await self.llm_api.acall(
+            message=self._build_message(paper, review),
             system_prompt=self.system_prompt,
+            cache_salt=f"replica-{replica}",
         )
 
+    def inputs(self, feedbacks: List[str], paper: Union[str, Paper], review: str) -> Dict[str, Any]:
+        return {"paper": paper, "review": review}
+
+    def _build_message(self, paper: Union[str, Paper], review: str) -> Union[LazyPrompt, List[Dict[str, Any]]]:
+        if self.shared_prefix:
+            return self._build_prefixed_message(paper, review)
+        return LazyPrompt(ACTOR_PROMPT, review=review, paper=paper)
+
 
 class Aggregator(Component):
-    def __init__(self, llm_api: LLM, system_prompt: str = AGGREGATOR_SYSTEM_PROMPT):
+    output_type = "aggregated feedback"
+    input_types = frozenset({"feedback", "critiqued feedback"})
+    min_inputs = 2
+    max_inputs = None
+
+    def __init__(self, llm_api: LLM, system_prompt: str = AGGREGATOR_SYSTEM_PROMPT, shared_prefix: bool = False):
         """Component to aggregate feedback from multiple FeedbackActor components
 
         Params:
@@ -44,29 +77,48 @@ class Aggregator(Component):
                 type llm_api: LLM        
             system_prompt: Aggregator system prompt
                 type system_prompt: str
+            shared_prefix: Whether to send the paper and review as a cacheable shared prefix
+                type shared_prefix: bool
         """
-        super().__init__(llm_api, system_prompt)
+        super().__init__(llm_api, system_prompt, shared_prefix)
 
-    def __call__(self, feedbacks: List[str], paper: str, review: str) -> str:
+    def __call__(self, feedbacks: List[str], paper: Union[str, Paper], review: str) -> str:
         return self.forward(feedbacks, paper, review)
 
-    def forward(self, feedbacks: List[str], paper: str, review: str) -> str:
-        formatted_feedback_list = ""
-        for i in range(len(feedbacks)):
-            formatted_feedback_list += f"<feedback_list-{i}>"
-            formatted_feedback_list += feedbacks[i]
-            formatted_feedback_list += f"</feedback_list-{i}>\n"
-
+    def forward(self, feedbacks: List[str], paper: Union[str, Paper], review: str) -> str:
         return self.llm_api(
-            message=AGGREGATOR_PROMPT.format(
-                feedbacks=formatted_feedback_list, review=review, paper=paper
-            ),
+            message=self._build_message(feedbacks, paper, review),
             system_prompt=self.system_prompt,
         )
 
+    async def aforward(self, feedbacks: List[str], paper: Union[str, Paper], review: str) -> str:
+        return await self.llm_api.acall(
+            message=self._build_message(feedbacks, paper, review),
+            system_prompt=self.system_prompt,
+        )
+
+    def inputs(self, feedbacks: List[str], paper: Union[str, Paper], review: str) -> Dict[str, Any]:
+        return {"feedbacks": feedbacks, "paper": paper, "review": review}
+
+    def _build_message(self, feedbacks: List[str], paper: Union[str, Paper], review: str) -> Union[LazyPrompt, List[Dict[str, Any]]]:
+        formatted_feedback_list = "".join(
+            f"<feedback_list-{i}>{feedback}</feedback_list-{i}>\n" for i, feedback in enumerate(feedbacks)
+        )
+
+        if self.shared_prefix:
+            return self._build_prefixed_message(
+                paper, review, AGGREGATOR_SUFFIX_PROMPT.format(feedbacks=formatted_feedback_list)
+            )
+        return LazyPrompt(AGGREGATOR_PROMPT, feedbacks=formatted_feedback_list, review=review, paper=paper)
+
 
 class FeedbackCritic(Component):
-    def __init__(self, llm_api: LLM, system_prompt: str = CRITIC_SYSTEM_PROMPT):
+    output_type = "critiqued feedback"
+    input_types = frozenset({"feedback", "aggregated feedback", "critiqued feedback"})
+    min_inputs = 1
+    max_inputs = 1
+
+    def __init__(self, llm_api: LLM, system_prompt: str = CRITIC_SYSTEM_PROMPT, shared_prefix: bool = False):
         """Component to edit content of feedback
 
         Params:
@@ -74,22 +126,43 @@ class FeedbackCritic(Component):
                 type llm_api: LLM        
             system_prompt: Critic system prompt
                 type system_prompt: str
+            shared_prefix: Whether to send the paper and review as a cacheable shared prefix
+                type shared_prefix: bool
         """
-        super().__init__(llm_api, system_prompt)
+        super().__init__(llm_api, system_prompt, shared_prefix)
 
-    def __call__(self, paper: str, review: str, feedback: str) -> str:
+    def __call__(self, paper: Union[str, Paper], review: str, feedback: str) -> str:
         return self.forward(paper, review, feedback)
 
-    def forward(self, paper: str, review: str, feedback: str) -> str:
+    def forward(self, paper: Union[str, Paper], review: str, feedback: str) -> str:
         return self.llm_api(
-            message=CRITIC_PROMPT.format(feedback=feedback, review=review, paper=paper),
+            message=self._build_message(paper, review, feedback),
             system_prompt=self.system_prompt,
         )
 
+    async def aforward(self, paper: Union[str, Paper], review: str, feedback: str) -> str:
+        return await self.llm_api.acall(
+            message=self._build_message(paper, review, feedback),
+            system_prompt=self.system_prompt,
+        )
+
+    def inputs(self, feedbacks: List[str], paper: Union[str, Paper], review: str) -> Dict[str, Any]:
+        return {"paper": paper, "review": review, "feedback": feedbacks[0]}
+
+    def _build_message(self, paper: Union[str, Paper], review: str, feedback: str) -> Union[LazyPrompt, List[Dict[str, Any]]]:
+        if self.shared_prefix:
+            return self._build_prefixed_message(paper, review, CRITIC_SUFFIX_PROMPT.format(feedback=feedback))
+        return LazyPrompt(CRITIC_PROMPT, feedback=feedback, review=review, paper=paper)
+
 
 class Formatter(Component):
+    uses_paper = False
+    output_type = "formatted feedback"
+    input_types = frozenset({"aggregated feedback", "critiqued feedback"})
+    min_inputs = 1
+    max_inputs = 1
 
-    def __init__(self, llm_api: LLM, system_prompt: str = FORMATTER_SYSTEM_PROMPT):
+    def __init__(self, llm_api: LLM, system_prompt: str = FORMATTER_SYSTEM_PROMPT, shared_prefix: bool = False):
         """ Component to format final feedback
 
         Params:
@@ -97,8 +170,10 @@ class Formatter(Component):
                 type llm_api: LLM        
             system_prompt: Formatter system prompt
                 type system_prompt: str
+            shared_prefix: Unused, the Formatter does not see the paper or review
+                type shared_prefix: bool
         """
-        super().__init__(llm_api, system_prompt)
+        super().__init__(llm_api, system_prompt, shared_prefix)
 
     def __call__(self, feedback: str) -> str:
         return self.forward(feedback)
@@ -108,3 +183,26 @@ class Formatter(Component):
             message=FORMATTER_PROMPT.format(feedback=feedback),
             system_prompt=self.system_prompt,
         )
+
+    async def aforward(self, feedback: str) -> str:
+        return await self.llm_api.acall(
+            message=FORMATTER_PROMPT.format(feedback=feedback),
+            system_prompt=self.system_prompt,
+        )
+
+    def inputs(self, feedbacks: List[str], paper: Union[str, Paper], review: str) -> Dict[str, Any]:
+        return {"feedback": feedbacks[0]}
+
+    # Formatted feedback must also pass the reliability tests that rule checks can decide
+    def validate(self, output: str, review: str) -> bool:
+        items = parse_feedback(output, review)
+        if not items:
+            return super().validate(output, review)
+        verdicts = run_rule_checks(output, review, list(RULE_CHECKS), items=items)
+        return all(item.feedback for item in items) and all(verdicts.values())
+
+    def stream(self, feedback: str) -> Iterator[str]:
+        return self.llm_api.stream(
+            message=FORMATTER_PROMPT.format(feedback=feedback),
+            system_prompt=self.system_prompt,
+        )
@@ -0,0 +1,154 @@
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Tuple
+
+# Section headers, e.g. "3 Method" or "2.1 Proposed Approach", on a short line of their own
+SECTION_HEADER = re.compile(
+    r"^\s*(?:\d+(?:\.\d+)*\.?\s+|[A-Z]\.?\s+)?(abstract|introduction|related work|background|preliminaries|methods?|methodology|approach|proposed method|our method|model|framework|experiments?|experimental setup|results|evaluation|discussion|limitations|conclusions?|references|bibliography|acknowledge?ments|appendix|appendices|supplementary material)\b",
+    re.IGNORECASE,
+)
+ALWAYS_KEPT_SECTIONS = {"abstract"}
+METHOD_SECTIONS = {"method", "methods", "methodology", "approach", "proposed method", "our method", "model", "framework"}
+NEVER_KEPT_SECTIONS = {"references", "bibliography", "acknowledgments", "acknowledgements"}
+
+# Review sections whose comments the feedback is about
+REVIEW_COMMENT_SECTIONS = re.compile(r"\*\*(?:Weaknesses|Questions)\*\*:(.*?)(?=\n\*\*\w+\*\*:|\Z)", re.DOTALL)
+
+STOPWORDS = set(
+    "the and for are but not you all any can had her was one our out has have this that with from they will would there their what about which when make like time just know take into year your some could them than then look only come over think also back after use two how work first well way even want because these give most very".split()
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count of a text, about 4 characters per token for English
+    """
+    return len(text) // 4
+
+
+def _terms(text: str) -> List[str]:
+    return [word for word in re.findall(r"[a-z][a-z0-9\-]{2,}", text.lower()) if word not in STOPWORDS]
+
+
+@dataclass
+class PrunedPaper:
+    text: str
+    original_tokens: int
+    kept_tokens: int
+    kept_chunks: int
+    total_chunks: int
+
+
+class PaperPruner:
+    def __init__(self, token_budget: int = 8000, chunk_words: int = 200, k1: float = 1.5, b: float = 0.75):
+        """
+        Shrinks the paper to the parts relevant to a review, ranked with a local BM25 index
+
+        The paper is split into chunks of about `chunk_words` words that do not cross section headers.
+        The abstract (or the opening chunk) is always kept, references are dropped, and the other chunks are
+        kept by decreasing BM25 score against the review's weaknesses and questions, with a bonus for the
+        method sections, until the token budget is used. Kept chunks are joined in paper order.
+
+        Params:
+            token_budget: maximum number of tokens of the pruned paper
+            chunk_words: target number of words per chunk
+            k1: BM25 term frequency saturation
+            b: BM25 length normalization
+        """
+        self.token_budget = token_budget
+        self.chunk_words = chunk_words
+        self.k1 = k1
+        self.b = b
+
+    def chunk(self, paper: str) -> List[Tuple[str, str]]:
+        """
+        Split the paper into (section, text) chunks
+
+        Params:
+            paper: paper text
+
+        Returns:
+            list of chunks in paper order, with the lowercase name of the section each belongs to
+        """
+        chunks = []
+        section, lines, words = "", [], 0
+        for line in paper.splitlines(keepends=True):
+            header = SECTION_HEADER.match(line) if len(line.split()) <= 5 else None
+            if (header or words >= self.chunk_words) and lines:
+                chunks.append((section, "".join(lines)))
+                lines, words = [], 0
+            if header:
+                section = header.group(1).lower()
+            lines.append(line)
+            words += len(line.split())
+        if lines:
+            chunks.append((section, "".join(lines)))
+        return chunks
+
+    def _bm25_scores(self, chunks: List[str], query: List[str]) -> List[float]:
+        chunk_terms = [Counter(_terms(chunk)) for chunk in chunks]
+        lengths = [sum(terms.values()) for terms in chunk_terms]
+        average_length = sum(lengths) / len(lengths) or 1
+        document_frequency = Counter(term for terms in chunk_terms for term in terms)
+
+        scores = []
+        for terms, length in zip(chunk_terms, lengths):
+            score = 0.0
+            for term in set(query):
+                frequency = terms.get(term, 0)
+                if not frequency:
+                    continue
+                idf = math.log(1 + (len(chunks) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                score += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * (1 - self.b + self.b * length / average_length))
+            scores.append(score)
+        return scores
+
+    def __call__(self, paper: str, review: str) -> PrunedPaper:
+        """
+        Prune the paper to the parts relevant to the review
+
+        Params:
+            paper: paper text
+            review: review text
+
+        Returns:
+            the pruned paper, with its token count before and after pruning
+        """
+        original_tokens = estimate_tokens(paper)
+        chunks = self.chunk(paper)
+        if original_tokens <= self.token_budget or not chunks:
+            return PrunedPaper(paper, original_tokens, original_tokens, len(chunks), len(chunks))
+
+        comments = REVIEW_COMMENT_SECTIONS.findall(review)
+        scores = self._bm25_scores([text for _, text in chunks], _terms(" ".join(comments) if comments else review))
+        method_bonus = 0.5 * max(scores, default=0.0)
+
+        priorities = []
+        for i, ((section, _), score) in enumerate(zip(chunks, scores)):
+            if section in NEVER_KEPT_SECTIONS:
+                continue
+            if section in ALWAYS_KEPT_SECTIONS or i == 0:
+                priority = math.inf
+            else:
+                priority = score + (method_bonus if section in METHOD_SECTIONS else 0.0)
+            priorities.append((priority, i))
+
+        kept, kept_tokens = [], 0
+        for _, i in sorted(priorities, key=lambda p: (-p[0], p[1])):
+            tokens = estimate_tokens(chunks[i][1])
+            if kept_tokens + tokens <= self.token_budget:
+                kept.append(i)
+                kept_tokens += tokens
+
+        # Mark the places where text was left out
+        parts, previous = [], -1
+        for i in sorted(kept):
+            if i != previous + 1:
+                parts.append("\n[...]\n")
+            parts.append(chunks[i][1])
+            previous = i
+        text = "".join(parts)
+
+        return PrunedPaper(text, original_tokens, estimate_tokens(text), len(kept), len(chunks))
@@ -1,123 +1,614 @@
-from typing import List, Dict, Any, Callable
-import re
-from review_feedback_agent.agents.components import (
-    FeedbackActor,
-    Aggregator,
-    FeedbackCritic,
-    Formatter
-)
+from typing import List, Dict, Any, Generator, Iterable, Iterator, Optional, Sequence, Tuple, Union
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import asyncio
+import contextvars
+import threading
+from contextlib import nullcontext
+from review_feedback_agent.agents.base import Component
+from review_feedback_agent.agents.components import Formatter
+from review_feedback_agent.agents.checkpoint import CHECKPOINT_VERSION, CheckpointStore, checkpoint_key
+from review_feedback_agent.agents.context import PaperPruner
+from review_feedback_agent.agents.incremental import IncrementalMixin
+from review_feedback_agent.agents.paper import Paper
+from review_feedback_agent.agents.plan import COMPONENTS, Plan, PlanNode, compile_architecture
+from review_feedback_agent.agents.repair import RepairMixin
+from review_feedback_agent.agents.session import PaperSession, PrefixWarmup
+from review_feedback_agent.agents.sharding import ShardingMixin
+from review_feedback_agent.apis import LLM
+from review_feedback_agent.apis.tracing import Trace, step_span
+from review_feedback_agent.utils.feedback_parsing import parse_feedback
 from review_feedback_agent.utils.utils import logger
 
+QUOTE_TAGS = ("<quote>", "</quote>")
 
-class FeedbackAgent:
-    def __init__(self, llm_api: Any, architecture: str = "Actor(2)->Aggregator->FeedbackCritic->Formatter"):
+# Parts of the pipeline state saved in checkpoints, the paper and review are part of the checkpoint key
+CHECKPOINTED_STATE = ("outputs", "pruning_stats", "escalated_steps")
+
+
+class _QuoteReplacer:
+    """
+    Applies the Formatter's <quote> tag replacement to text arriving in chunks, holding back
+    the end of a chunk while it may be the start of a tag split across chunks
+    """
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, chunk: str) -> str:
+        text = self._pending + chunk
+        for tag in QUOTE_TAGS:
+            text = text.replace(tag, "'")
+        start = text.rfind("<")
+        if start != -1 and any(tag.startswith(text[start:]) for tag in QUOTE_TAGS):
+            text, self._pending = text[:start], text[start:]
+        else:
+            self._pending = ""
+        return text
+
+    def flush(self) -> str:
+        text, self._pending = self._pending, ""
+        return text
+
+
+class FeedbackAgent(RepairMixin, ShardingMixin, IncrementalMixin):
+    def __init__(
+        self,
+        llm_api: Any,
+        architecture: Union[str, Plan] = "Actor(2)->Aggregator->FeedbackCritic->Formatter",
+        max_workers: int = 4,
+        shared_prefix: bool = False,
+        context_token_budget: int = 8000,
+        tracing: bool = False,
+        trace_exporters: Sequence[Any] = (),
+        checkpoint_store: Optional[CheckpointStore] = None,
+        llms: Optional[Dict[str, Any]] = None,
+        models: Optional[Dict[str, str]] = None,
+        cascade_models: Optional[Dict[str, str]] = None,
+        repair_attempts: int = 0,
+        verifier_llm: Optional[LLM] = None,
+        verifier_llms: Optional[Dict[str, LLM]] = None,
+        reliability_tests: Optional[List[str]] = None,
+        shard_size: Optional[int] = None,
+    ):
         """
         Initialize FeedbackAgent with a string-based architecture and LLM API
 
         Params:
             llm_api: The LLM API to be used for initializing components
-            architecture: A string describing the architecture, set to the default: "Actor(2)->Aggregator->FeedbackCritic->Formatter"
+            architecture: A string describing the architecture, set to the default: "Actor(2)->Aggregator->FeedbackCritic->Formatter",
+                or a Plan compiled from one with compile_architecture. Steps separated by "->" run one after the other, and
+                steps separated by "|" or replicated with "(n)" run side by side, e.g. "Actor(2)->FeedbackCritic(2)->Aggregator->Formatter"
+                critiques each Actor's feedback separately. Components can take options in brackets: "Actor(2)[pruned]" gives the
+                Actor replicas only the parts of the paper relevant to the review, within context_token_budget tokens, and
+                "Actor(2)[pruned=4000]" sets the budget for that step, "Formatter[model=haiku-3.5]" runs the step on another model,
+                "FeedbackCritic[cascade=haiku-3.5]" runs the step on a cheaper model first (see cascade_models), and
+                "Actor(4)[concurrency=2]" runs at most 2 of the replicas at once. The architecture is compiled and checked
+                when the agent is created, and compiled plans are cached by architecture string.
+            max_workers: Maximum number of independent steps (e.g. Actor replicas) run concurrently
+            shared_prefix: Whether to lay out prompts with the paper and review as a shared leading prefix, sent with cache
+                breakpoints so that the calls of a stage on other reviews of the same paper (see session) hit the provider's prompt cache
+            context_token_budget: Default token budget of the paper for steps with the [pruned] option
+            tracing: Whether to record the wall time, token counts, completion cache hits, retries and estimated cost
+                of each step and LLM call, returned as a Trace under the "trace" key of the result
+            trace_exporters: Exporters each trace is passed to once a run finishes (e.g. JSONLExporter or
+                PrometheusExporter from review_feedback_agent.apis.tracing), enables tracing if given
+            checkpoint_store: Store the state of each run is saved to after every step (e.g. SQLiteCheckpointStore or
+                DirectoryCheckpointStore from review_feedback_agent.agents.checkpoint). A rerun on the same paper, review,
+                architecture, models, cascade_models, context_token_budget and shared_prefix after a failure resumes after
+                the completed steps. Checkpoints are deleted once a run succeeds.
+            llms: LLM API to use for each model named in [model=...] and [cascade=...] options, models and cascade_models.
+                Models missing from it get an LLM made with llm_api.with_model, with the same type of engine and settings.
+            models: Model of each component by name for steps without a [model] option, e.g. {"Formatter": "haiku-3.5"}
+                to format feedback with a smaller model. Other steps use llm_api.
+            cascade_models: Cheaper model each component by name first runs on, for steps without a [cascade] option, e.g.
+                {"Formatter": "haiku-3.5"}. The step is rerun on its own model only if the output fails the component's
+                validation: unparseable feedback, or formatted feedback failing the rule-checked reliability tests.
+                Steps rerun this way are listed under "escalated steps" in the result.
+            repair_attempts: Maximum number of times feedback failing the reliability tests is repaired, by rerunning only
+                the steps that can fix the failed tests (see repair). The outcome of the tests is reported under "reliability"
+                and each repair, with its tokens and cost, under "repairs" in the result. Tests are not run if 0.
+            verifier_llm: LLM used by the reliability tests when repair_attempts is set, defaults to LLM("sonnet-3.5")
+            verifier_llms: LLM used by each reliability test by name instead of verifier_llm
+            reliability_tests: Names of the reliability tests to run when repair_attempts is set, defaults to all of them
+            shard_size: Maximum number of comments of the Weaknesses and Questions sections per run. Longer reviews are split
+                into shards of consecutive comments, each keeping the other sections as context, and the whole architecture
+                runs on every shard concurrently. The feedback of the shards is then merged in review order, so that latency
+                follows the longest shard rather than the length of the review. Reviews are not split if None.
         """
         self.llm_api = llm_api
+        self.plan = architecture if isinstance(architecture, Plan) else compile_architecture(architecture)
+        self.architecture = self.plan.architecture
+        self.max_workers = max_workers
+        self.shared_prefix = shared_prefix
+        self.context_token_budget = context_token_budget
+        self.tracing = tracing or bool(trace_exporters)
+        self.trace_exporters = list(trace_exporters)
+        self.checkpoint_store = checkpoint_store
+        self.llms = dict(llms or {})
+        self.models = dict(models or {})
+        self.cascade_models = dict(cascade_models or {})
+        for name in (*self.models, *self.cascade_models):
+            if name not in COMPONENTS:
+                raise ValueError(f"Unknown component: {name}")
+        self.repair_attempts = repair_attempts
+        self.verifier_llm = verifier_llm
+        self.verifier_llms = verifier_llms
+        self.reliability_tests = reliability_tests
+        if shard_size is not None and shard_size < 1:
+            raise ValueError(f"shard_size must be at least 1, got {shard_size}")
+        self.shard_size = shard_size
         self.components = self._initialize_components()
-        self.sequence = self._parse_architecture(architecture)
+        # Components of the cascaded steps on their cheaper model, by step index
+        self.cascade_components = {
+            node.index: node.component(self._llm_for(model), shared_prefix=self.shared_prefix)
+            for node in self.plan.nodes
+            if (model := node.option("cascade", self.cascade_models.get(node.name))) is not None
+        }
 
-    def _initialize_components(self) -> Dict[str, Callable]:
+    def _initialize_components(self) -> List[Component]:
         """
-        Initialize all possible components with the LLM API
+        Initialize the component of each step of the plan with the LLM API of its model
 
         Returns:
-            dict: mapping component name (str) to initialized component
+            list: initialized component of each step, in plan order
         """
+        return [
+            node.component(self._llm_for(node.option("model", self.models.get(node.name))), shared_prefix=self.shared_prefix)
+            for node in self.plan.nodes
+        ]
+
+    def _llm_for(self, model: Optional[str]) -> Any:
+        if model is None:
+            return self.llm_api
+        if model not in self.llms:
+            self.llms[model] = self.llm_api.with_model(model)
+        return self.llms[model]
 
+    def _initial_state(self, pdf_text: Union[str, Paper], review_content: str) -> Dict[str, Any]:
+        paper = Paper.intern(pdf_text)
         return {
-            "Formatter": Formatter(self.llm_api),
-            "Aggregator": Aggregator(self.llm_api),
-            "FeedbackCritic": FeedbackCritic(self.llm_api),
-            "Actor": FeedbackActor(self.llm_api),
+            # Handle shared by all runs on the paper, only formatted into prompts when they are sent
+            "paper": paper,
+            "review": review_content,
+            # Output of each completed step, by step index
+            "outputs": {},
+            "pruned_papers": {},
+            "pruning_stats": [],
+            "escalated_steps": [],
+            # Components replacing those of the steps rerun by a repair, by step index
+            "repair_components": {},
+            # Ordering of the steps with the runs on other reviews of the paper, see PaperSession
+            "prefix_warmup": None,
+            "checkpoint_key": self._checkpoint_key(paper, review_content) if self.checkpoint_store is not None else None,
+        }
+
+    def _checkpoint_key(self, paper: Paper, review_content: str) -> str:
+        # Settings changing the prompts or models of the steps, so that a checkpoint is only resumed by the same pipeline
+        settings = {
+            "models": self.models,
+            "cascade_models": self.cascade_models,
+            "context_token_budget": self.context_token_budget,
+            "shared_prefix": self.shared_prefix,
+        }
+        return checkpoint_key(paper.text, review_content, self.architecture, settings)
+
+    def _outputs_of_type(self, state: Dict[str, Any], output_type: str) -> List[str]:
+        return [
+            state["outputs"][node.index]
+            for node in self.plan.nodes
+            if node.component.output_type == output_type and node.index in state["outputs"]
+        ]
+
+    def _result(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        # Architectures with several steps of a type report the output of the last one
+        aggregated, critiqued, formatted = (
+            (self._outputs_of_type(state, output_type) or [None])[-1]
+            for output_type in ("aggregated feedback", "critiqued feedback", "formatted feedback")
+        )
+        result = {
+            "initial feedback": self._outputs_of_type(state, "feedback"),
+            "aggregated feedback": aggregated,
+            "critiqued feedback": critiqued,
+            "formatted feedback": formatted,
+            "feedback items": parse_feedback(formatted, state["review"]) if formatted else [],
+            "pruning stats": state["pruning_stats"],
+            "escalated steps": sorted(state["escalated_steps"]),
+            # Output of each step by step number, from which a repair reruns only some of the steps
+            "step outputs": {index + 1: output for index, output in sorted(state["outputs"].items())},
         }
+        return result
+
+    def _finish(self, result: Dict[str, Any], trace: Optional[Trace]) -> Dict[str, Any]:
+        if trace is not None:
+            result["trace"] = trace
+            for exporter in self.trace_exporters:
+                exporter.export(trace)
+        return result
+
+    def _budget(self, node: PlanNode) -> Optional[int]:
+        pruned = node.option("pruned")
+        if pruned is None:
+            return None
+        return int(pruned or self.context_token_budget)
+
+    def _prune_context(self, nodes: List[PlanNode], state: Dict[str, Any]) -> None:
+        """
+        Prune the paper for the given steps with the [pruned] option, once per token budget and call
 
-    def _parse_architecture(self, arch_string: str) -> List[Callable]:
+        Params:
+            nodes: steps about to run
+            state: current pipeline state
+        """
+        for node in nodes:
+            budget = self._budget(node)
+            if budget is None:
+                continue
+            if budget not in state["pruned_papers"]:
+                pruned = PaperPruner(token_budget=budget)(state["paper"].text, state["review"])
+                logger.info(
+                    f"Pruned paper from {pruned.original_tokens} to {pruned.kept_tokens} tokens "
+                    f"({pruned.kept_chunks} of {pruned.total_chunks} chunks)"
+                )
+                state["pruned_papers"][budget] = pruned
+            pruned = state["pruned_papers"][budget]
+            state["pruning_stats"].append(
+                {
+                    "step": node.index + 1,
+                    "component": node.component.__name__,
+                    "original tokens": pruned.original_tokens,
+                    "kept tokens": pruned.kept_tokens,
+                    "saved tokens": pruned.original_tokens - pruned.kept_tokens,
+                }
+            )
+
+    def _step_paper(self, node: PlanNode, state: Dict[str, Any]) -> Union[str, Paper]:
+        budget = self._budget(node)
+        return state["paper"] if budget is None else state["pruned_papers"][budget].text
+
+    def _step_inputs(self, node: PlanNode, state: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Parse the architecture string into a list of callable components
+        Collect the inputs of a step from the outputs of the steps it depends on
 
         Params:
-            arch_string: string representing desired architecture
+            node: step to run
+            state: current pipeline state
 
         Returns:
-            list: list of components in desired order based on arch_string
+            dict: keyword arguments to call the step's component with
         """
+        logger.info(f"Running step {node.index + 1}: {node.component.__name__}")
+        component = self.components[node.index]
+        inputs = component.inputs(
+            [state["outputs"][i] for i in node.inputs], self._step_paper(node, state), state["review"]
+        )
+        if component.parallelizable:
+            inputs["replica"] = node.replica
+        return inputs
 
-        def parse_component(component_str):
-            match = re.match(r"(\w+)(?:\((\d+)\))?", component_str)
-            if not match:
-                raise ValueError(f"Invalid component specification: {component_str}")
-            name, count = match.groups()
-            count = int(count) if count else 1
-            if name not in self.components:
-                raise ValueError(f"Unknown component: {name}")
-            return [self.components[name]] * count
+    def _update_state(self, node: PlanNode, state: Dict[str, Any], output: str) -> None:
+        if issubclass(node.component, Formatter):
+            output = output.replace("<quote>", "'").replace("</quote>", "'")
+        state["outputs"][node.index] = output
+        if state["prefix_warmup"] is not None:
+            state["prefix_warmup"].done([node.index])
 
-        return [
-            comp
-            for part in arch_string.split("->")
-            for comp in parse_component(part.strip())
-        ]
+    def _prefix_event(self, node: PlanNode, state: Dict[str, Any]) -> Optional[Any]:
+        # Event to wait for before running a step that takes the paper, until the lead run on the paper has run it
+        warmup = state["prefix_warmup"]
+        if warmup is None or warmup.lead or not node.component.uses_paper or warmup.events[node.index].is_set():
+            return None
+        return warmup.events[node.index]
 
-    def __call__(self, pdf_text: str, review_content: str) -> Dict[str, Any]:
-        state = {
-            "paper": pdf_text,
-            "review": review_content,
-            "feedback_list": [],
-            "aggregated_feedback": None,
-            "critiqued_feedback": None,
-            "formatted_feedback": None,
+    def _escalate(self, node: PlanNode, state: Dict[str, Any]) -> None:
+        logger.info(f"Output of step {node.index + 1} failed validation, rerunning it on the larger model")
+        state["escalated_steps"].append(node.index + 1)
+
+    def _run_step(self, node: PlanNode, state: Dict[str, Any], limit: Optional[threading.Semaphore] = None) -> str:
+        event = self._prefix_event(node, state)
+        if event is not None:
+            event.wait()
+        with limit or nullcontext(), step_span(node.index + 1, node.component.__name__):
+            inputs = self._step_inputs(node, state)
+            if node.index in state["repair_components"]:
+                return state["repair_components"][node.index](**inputs)
+            cascade = self.cascade_components.get(node.index)
+            if cascade is not None:
+                output = cascade(**inputs)
+                if cascade.validate(output, state["review"]):
+                    return output
+                self._escalate(node, state)
+            return self.components[node.index](**inputs)
+
+    async def _arun_step(
+        self,
+        node: PlanNode,
+        state: Dict[str, Any],
+        semaphore: asyncio.Semaphore,
+        limit: Optional[asyncio.Semaphore] = None,
+    ) -> str:
+        event = self._prefix_event(node, state)
+        if event is not None:
+            await event.wait()
+        async with limit or nullcontext(), semaphore:
+            with step_span(node.index + 1, node.component.__name__):
+                inputs = self._step_inputs(node, state)
+                if node.index in state["repair_components"]:
+                    return await state["repair_components"][node.index].acall(**inputs)
+                cascade = self.cascade_components.get(node.index)
+                if cascade is not None:
+                    output = await cascade.acall(**inputs)
+                    if cascade.validate(output, state["review"]):
+                        return output
+                    self._escalate(node, state)
+                return await self.components[node.index].acall(**inputs)
+
+    def _stream_step(self, node: PlanNode, state: Dict[str, Any], limit: Optional[threading.Semaphore] = None) -> Iterator[str]:
+        # Streams the Formatter output with quotes replaced. The output of a cascaded step is only kept
+        # once validated, so it is sent as a single chunk.
+        if node.index in self.cascade_components and node.index not in state["repair_components"]:
+            text = self._run_step(node, state, limit).replace("<quote>", "'").replace("</quote>", "'")
+            if text:
+                yield text
+            return
+        event = self._prefix_event(node, state)
+        if event is not None:
+            event.wait()
+        with limit or nullcontext(), step_span(node.index + 1, node.component.__name__):
+            replacer = _QuoteReplacer()
+            component = state["repair_components"].get(node.index, self.components[node.index])
+            for chunk in component.stream(**self._step_inputs(node, state)):
+                text = replacer.feed(chunk)
+                if text:
+                    yield text
+            text = replacer.flush()
+            if text:
+                yield text
+
+    def _group_limits(self, semaphore_type: type) -> Dict[int, Any]:
+        # Steps of a component specification with the [concurrency=n] option share a semaphore of n slots
+        return {
+            node.group: semaphore_type(int(node.option("concurrency")))
+            for node in self.plan.nodes
+            if node.option("concurrency") is not None
         }
 
-        for step, component in enumerate(self.sequence):
-            logger.info(f"Running step {step + 1}: {component.__class__.__name__}")
-
-            if isinstance(component, FeedbackActor):
-                feedback = component(paper=state["paper"], review=state["review"])
-                state["feedback_list"].append(feedback)
-            elif isinstance(component, Aggregator):
-                assert (
-                    len(state["feedback_list"]) > 1
-                ), f"Total feedback: {len(state['feedback_list'])}. Have at least 2 feedback to aggregate."
-                state["aggregated_feedback"] = (
-                    component(
-                        feedbacks=state["feedback_list"],
-                        paper=state["paper"],
-                        review=state["review"],
-                    )
-                    if len(state["feedback_list"]) > 1
-                    else state["feedback_list"][0]
-                )
-            elif isinstance(component, FeedbackCritic):
-                assert (
-                    state["aggregated_feedback"] or len(state["feedback_list"]) == 1
-                ), "No feedback to critique. Have a single feedback or run Aggregator first."
-                state["critiqued_feedback"] = component(
-                    paper=state["paper"],
-                    review=state["review"],
-                    feedback=state["aggregated_feedback"] or state["feedback_list"][0],
-                )
-            elif isinstance(component, Formatter):
-                assert (
-                    state["critiqued_feedback"] or state["aggregated_feedback"]
-                ), "No feedback to format. Run the FeedbackCritic or Aggregator first."
-                state["formatted_feedback"] = component(
-                    feedback=state["critiqued_feedback"] or state["aggregated_feedback"]
-                )
-                state["formatted_feedback"] = (
-                    state["formatted_feedback"]
-                    .replace("<quote>", "'")
-                    .replace("</quote>", "'")
-                )
+    def _new_trace(self) -> Optional[Trace]:
+        return Trace() if self.tracing else None
 
+    def _restore_checkpoint(self, state: Dict[str, Any]) -> None:
+        """
+        Restore the outputs saved by an earlier, failed run on the same inputs
+
+        Params:
+            state: initial pipeline state, updated in place
+        """
+        if state["checkpoint_key"] is None:
+            return
+        checkpoint = self.checkpoint_store.load(state["checkpoint_key"])
+        if checkpoint is None:
+            return
+        state.update(checkpoint["state"])
+        # JSON object keys are strings
+        state["outputs"] = {int(index): output for index, output in state["outputs"].items()}
+        logger.info(f"Resuming from checkpoint after {len(state['outputs'])} of {len(self.plan.nodes)} steps")
+
+    def _checkpoint(self, state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Snapshot of the state to save, None once every step has completed
+        if len(state["outputs"]) == len(self.plan.nodes):
+            return None
         return {
-            "initial feedback": state["feedback_list"],
-            "aggregated feedback": state["aggregated_feedback"],
-            "critiqued feedback": state["critiqued_feedback"],
-            "formatted feedback": state["formatted_feedback"],
+            "version": CHECKPOINT_VERSION,
+            "architecture": self.architecture,
+            "completed_steps": sorted(state["outputs"]),
+            "state": {key: type(state[key])(state[key]) for key in CHECKPOINTED_STATE},
         }
+
+    def _write_checkpoint(self, key: str, checkpoint: Optional[Dict[str, Any]]) -> None:
+        if checkpoint is None:
+            self.checkpoint_store.delete(key)
+        else:
+            self.checkpoint_store.save(key, checkpoint)
+
+    def _save_checkpoint(self, state: Dict[str, Any]) -> None:
+        if state["checkpoint_key"] is not None:
+            self._write_checkpoint(state["checkpoint_key"], self._checkpoint(state))
+
+    def _run_plan(self, state: Dict[str, Any], stream: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Run the plan on the state, starting each step as soon as the steps it depends on have finished,
+        and yielding progress events
+
+        Params:
+            state: initial pipeline state, updated in place
+            stream: whether to stream the Formatter output as "token" events
+
+        Returns:
+            iterator over "step started" and "step finished" events for each step, "step restored" events for
+            steps restored from a checkpoint, and "token" events with chunks of the formatted feedback if streaming
+        """
+        self._restore_checkpoint(state)
+        if state["prefix_warmup"] is not None:
+            state["prefix_warmup"].done(state["outputs"])
+        for index in sorted(state["outputs"]):
+            yield {"event": "step restored", "step": index + 1, "component": self.plan.nodes[index].component.__name__}
+
+        pending = [node for node in self.plan.nodes if node.index not in state["outputs"]]
+        limits = self._group_limits(threading.Semaphore)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                ready = [node for node in pending if all(i in state["outputs"] for i in node.inputs)]
+                pending = [node for node in pending if node not in ready]
+                self._prune_context(ready, state)
+
+                finished = []
+                for node in ready:
+                    yield {"event": "step started", "step": node.index + 1, "component": node.component.__name__}
+                    if stream and hasattr(self.components[node.index], "stream"):
+                        chunks = []
+                        for text in self._stream_step(node, state, limits.get(node.group)):
+                            chunks.append(text)
+                            yield {"event": "token", "text": text}
+                        finished.append((node, "".join(chunks)))
+                    elif len(ready) == 1 and not running:
+                        finished.append((node, self._run_step(node, state, limits.get(node.group))))
+                    else:
+                        # Each step runs in a copy of the current context so that the trace follows it into the worker thread
+                        context = contextvars.copy_context()
+                        running[executor.submit(context.run, self._run_step, node, state, limits.get(node.group))] = node
+
+                error = None
+                if running:
+                    done = [future for future in running if future.done()]
+                    if not done and not finished:
+                        done = wait(running, return_when=FIRST_COMPLETED).done
+                    error = _collect(done, running, finished)
+                    if error is not None:
+                        # The steps still running are waited for, so that their outputs are saved with the others
+                        _collect(wait(running).done, running, finished)
+
+                finished.sort(key=lambda item: item[0].index)
+                for node, output in finished:
+                    self._update_state(node, state, output)
+                self._save_checkpoint(state)
+                if error is not None:
+                    raise error
+                for node, _ in finished:
+                    yield {"event": "step finished", "step": node.index + 1, "component": node.component.__name__}
+
+    def __call__(self, pdf_text: Union[str, Paper], review_content: str) -> Dict[str, Any]:
+        return self._call(pdf_text, review_content)
+
+    def _call(self, pdf_text: Union[str, Paper], review_content: str, warmup: Optional[PrefixWarmup] = None) -> Dict[str, Any]:
+        trace = self._new_trace()
+        with trace or nullcontext():
+            result = _run_to_end(self._run_review(pdf_text, review_content, warmup=warmup))
+        return self._finish(result, trace)
+
+    def stream(self, pdf_text: Union[str, Paper], review_content: str) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming version of __call__ for interactive use, yielding events as the pipeline progresses:
+        {"event": "step started" or "step finished", "step": ..., "component": ...} around each step
+        ("step restored" for steps restored from a checkpoint),
+        {"event": "token", "text": ...} for each chunk of the formatted feedback as the Formatter generates it,
+        {"event": "repair", "attempt": ..., "failed tests": ..., "steps": ...} before the steps rerun by each repair,
+        whose "token" events start the formatted feedback over, and finally {"event": "result", "result": ...}
+        with the same dict __call__ returns. Events of reviews split into shards (see shard_size) interleave, with
+        the index of their shard under "shard".
+        """
+        trace = self._new_trace()
+        events = self._run_review(pdf_text, review_content, stream=True)
+        result = yield from (trace.iterate(events) if trace is not None else events)
+        yield {"event": "result", "result": self._finish(result, trace)}
+
+    async def acall(self, pdf_text: Union[str, Paper], review_content: str) -> Dict[str, Any]:
+        """
+        Async version of __call__, running each step on the event loop as soon as the steps it depends on have finished
+        """
+        return await self._acall(pdf_text, review_content)
+
+    async def _acall(self, pdf_text: Union[str, Paper], review_content: str, warmup: Optional[PrefixWarmup] = None) -> Dict[str, Any]:
+        trace = self._new_trace()
+        with trace or nullcontext():
+            result = await self._arun_review(pdf_text, review_content, warmup)
+        return self._finish(result, trace)
+
+    def session(self, pdf_text: Union[str, Paper], asynchronous: bool = False) -> PaperSession:
+        """
+        Params:
+            pdf_text: paper text
+            asynchronous: whether the reviews are run with the session's acall, otherwise with its __call__
+
+        Returns:
+            PaperSession running the agent on reviews of the paper, ordering their steps so that the paper
+                prefix cached by the first review is reused by the others, see PaperSession
+        """
+        return PaperSession(self, pdf_text, asynchronous)
+
+    def call_reviews(self, pdf_text: Union[str, Paper], reviews: List[str]) -> List[Dict[str, Any]]:
+        """
+        Run the agent on all reviews of a paper concurrently. With shared_prefix, the first review leads: the other
+        reviews run each step that takes the paper once the first review has run it, so that the paper sent by the
+        first review is read from the provider's prompt cache by the calls of the other reviews, which follow each
+        other. Without shared_prefix, the reviews run independently.
+
+        Params:
+            pdf_text: paper text
+            reviews: review texts
+
+        Returns:
+            list: result of each review, as returned by __call__
+        """
+        if not reviews:
+            return []
+        session = self.session(pdf_text)
+        with ThreadPoolExecutor(max_workers=len(reviews)) as executor:
+            # Each review runs in a copy of the current context, like the steps of a review
+            futures = [executor.submit(contextvars.copy_context().run, session, review) for review in reviews]
+            return [future.result() for future in futures]
+
+    async def acall_reviews(self, pdf_text: Union[str, Paper], reviews: List[str]) -> List[Dict[str, Any]]:
+        """
+        Async version of call_reviews
+        """
+        session = self.session(pdf_text, asynchronous=True)
+        return list(await asyncio.gather(*(session.acall(review) for review in reviews)))
+
+    async def _arun_plan(self, state: Dict[str, Any]) -> None:
+        """
+        Async version of _run_plan, running each step as a task waiting for the steps it depends on
+
+        Params:
+            state: initial pipeline state, updated in place
+        """
+        semaphore = asyncio.Semaphore(self.max_workers)
+        limits = self._group_limits(asyncio.Semaphore)
+        checkpoint_lock = asyncio.Lock()
+        tasks = {}
+
+        async def run_node(node: PlanNode) -> None:
+            if node.index in state["outputs"]:
+                return
+            await asyncio.gather(*(tasks[i] for i in node.inputs))
+            self._prune_context([node], state)
+            output = await self._arun_step(node, state, semaphore, limits.get(node.group))
+            self._update_state(node, state, output)
+            if state["checkpoint_key"] is not None:
+                # Checkpoint writes are blocking, so they are run in a worker thread, one at a time so that
+                # a newer snapshot is never overwritten by an older one
+                async with checkpoint_lock:
+                    await asyncio.to_thread(self._write_checkpoint, state["checkpoint_key"], self._checkpoint(state))
+
+        if state["checkpoint_key"] is not None:
+            await asyncio.to_thread(self._restore_checkpoint, state)
+            if state["prefix_warmup"] is not None:
+                state["prefix_warmup"].done(state["outputs"])
+        for node in self.plan.nodes:
+            tasks[node.index] = asyncio.create_task(run_node(node))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+
+def _collect(done: Iterable[Future], running: Dict[Future, PlanNode], finished: List[Tuple[PlanNode, str]]) -> Optional[BaseException]:
+    # Move the done futures from running to finished, returning the first error among them if any
+    error = None
+    for future in done:
+        node = running.pop(future)
+        if future.exception() is not None:
+            error = error or future.exception()
+        else:
+            finished.append((node, future.result()))
+    return error
+
+
+def _run_to_end(generator: Generator) -> Any:
+    # Consume a generator, returning its return value
+    while True:
+        try:
+            next(generator)
+        except StopIteration as stop:
+            return stop.value
@@ -0,0 +1,109 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+from review_feedback_agent.agents.paper import Paper
+from review_feedback_agent.utils.feedback_parsing import FeedbackItem, find_comment_span, format_feedback_items, parse_feedback
+from review_feedback_agent.utils.review_parsing import diff_review_comments, review_with_comments, split_review_comments
+from review_feedback_agent.utils.utils import logger
+
+
+def incremental_review(
+    review_content: str, previous_review: str, previous_result: Dict[str, Any]
+) -> Tuple[Optional[str], List[FeedbackItem], int]:
+    """
+    Params:
+        review_content: revised review text
+        previous_review: review text of the previous run
+        previous_result: result of the previous run
+
+    Returns:
+        str: review to run the pipeline on, with only the new or edited comments, None if there are none
+        list: feedback items of the previous result that still apply, with their spans in the revised review
+        int: number of new or edited comments
+    """
+    unchanged, changed = diff_review_comments(previous_review, review_content)
+    # Feedback items are lists in results read back from JSON
+    previous_items = [
+        item if isinstance(item, FeedbackItem) else FeedbackItem.from_list(item)
+        for item in previous_result["feedback items"]
+    ]
+    comment_spans = [comment.span for comment in split_review_comments(previous_review)]
+    unchanged_spans = [comment.span for comment, _ in unchanged]
+
+    def contains(spans: List[Tuple[int, int]], span: Tuple[int, int]) -> bool:
+        return any(start <= span[0] and span[1] <= end for start, end in spans)
+
+    reused = []
+    for item in previous_items:
+        if item.span is None:
+            continue
+        # Items about a comment that was edited or removed are dropped, as are items about text outside
+        # the comments (e.g. the summary) that is no longer in the review
+        if contains(unchanged_spans, item.span) or not contains(comment_spans, item.span):
+            span = find_comment_span(item.comment, review_content)
+            if span is not None:
+                reused.append(FeedbackItem(item.comment, item.feedback, span, item.stage))
+
+    changed_review = review_with_comments(review_content, changed) if changed else None
+    return changed_review, reused, len(changed)
+
+
+def incremental_result(
+    result: Dict[str, Any], review_content: str, reused: List[FeedbackItem], changed_comments: int
+) -> Dict[str, Any]:
+    # Feedback on the changed comments is located in the full revised review, then merged with the reused items
+    new_items = parse_feedback(result["formatted feedback"], review_content) if result["formatted feedback"] else []
+    items = sorted(reused + new_items, key=lambda item: item.span[0] if item.span is not None else len(review_content))
+    result["feedback items"] = items
+    result["formatted feedback"] = format_feedback_items(items)
+    result["incremental"] = {
+        "changed comments": changed_comments,
+        "reused items": len(reused),
+        "new items": len(new_items),
+    }
+    return result
+
+
+class IncrementalMixin:
+    """
+    Incremental runs of FeedbackAgent on revised reviews, rerunning only the new or edited comments
+    """
+
+    def update(
+        self, pdf_text: Union[str, Paper], review_content: str, previous_review: str, previous_result: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Incremental version of __call__ for a revised review. The comments of the Weaknesses and Questions sections
+        are compared with those of the previous review: feedback on unchanged comments is reused, and only the new
+        or edited comments are run through the pipeline, with the other sections of the review kept as context.
+
+        Params:
+            pdf_text: paper text
+            review_content: revised review text
+            previous_review: review text of the previous run
+            previous_result: result of the previous run on previous_review
+
+        Returns:
+            dict: result of the run on the new or edited comments, with "feedback items" and "formatted feedback"
+                merging the reused and new feedback in review order, and the number of changed comments, reused
+                items and new items under "incremental". Without changed comments, no step is run.
+        """
+        changed_review, reused, changed_comments = incremental_review(review_content, previous_review, previous_result)
+        logger.info(f"Incremental run: {changed_comments} new or edited comments, {len(reused)} feedback items reused")
+        if changed_review is None:
+            result = self._finish(self._result(self._initial_state(pdf_text, review_content)), self._new_trace())
+        else:
+            result = self(pdf_text, changed_review)
+        return incremental_result(result, review_content, reused, changed_comments)
+
+    async def aupdate(
+        self, pdf_text: Union[str, Paper], review_content: str, previous_review: str, previous_result: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Async version of update
+        """
+        changed_review, reused, changed_comments = incremental_review(review_content, previous_review, previous_result)
+        logger.info(f"Incremental run: {changed_comments} new or edited comments, {len(reused)} feedback items reused")
+        if changed_review is None:
+            result = self._finish(self._result(self._initial_state(pdf_text, review_content)), self._new_trace())
+        else:
+            result = await self.acall(pdf_text, changed_review)
+        return incremental_result(result, review_content, reused, changed_comments)
@@ -0,0 +1,91 @@
+import hashlib
+import threading
+import weakref
+from typing import Any, Dict, Union
+
+
+class Paper:
+    __slots__ = ("text", "digest", "__weakref__")
+
+    # Live handles by digest of their text, so that all runs on the same paper share one copy of it
+    _interned = weakref.WeakValueDictionary()
+    _lock = threading.Lock()
+
+    def __init__(self, text: str, digest: str):
+        """
+        Immutable handle of a paper's text, shared by every pipeline state and prompt of the runs on the paper.
+        Create handles with Paper.intern rather than directly.
+
+        Params:
+            text: paper text
+            digest: sha256 hex digest of the text
+        """
+        object.__setattr__(self, "text", text)
+        object.__setattr__(self, "digest", digest)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("Paper handles are immutable")
+
+    @classmethod
+    def intern(cls, paper: Union[str, "Paper"]) -> "Paper":
+        """
+        Params:
+            paper: paper text, or a handle which is returned as is
+
+        Returns:
+            the live handle of the same text if there is one, a new handle otherwise. The text passed in
+                can be released by the caller once a handle of the same text exists.
+        """
+        if isinstance(paper, Paper):
+            return paper
+        digest = hashlib.sha256(paper.encode("utf-8")).hexdigest()
+        with cls._lock:
+            handle = cls._interned.get(digest)
+            if handle is None:
+                handle = cls(paper, digest)
+                cls._interned[digest] = handle
+            return handle
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def cache_payload(self) -> Dict[str, str]:
+        # Stands for the paper in completion cache keys
+        return {"paper": self.digest}
+
+    def __repr__(self) -> str:
+        return f"Paper(digest={self.digest[:12]!r}, characters={len(self.text)})"
+
+
+class LazyPrompt:
+    __slots__ = ("template", "values")
+
+    def __init__(self, template: str, **values: Union[str, Paper]):
+        """
+        Prompt template and the values to format it with, formatted only when the prompt is sent. Until then a
+        prompt holds references to the paper handle and other values rather than a formatted copy of them,
+        so that calls waiting for a rate limit or concurrency slot do not each keep a copy of the paper.
+
+        Params:
+            template: prompt template, e.g. ACTOR_PROMPT
+            values: values of the template's fields, the paper as a Paper handle or text
+        """
+        self.template = template
+        self.values = values
+
+    def __str__(self) -> str:
+        return self.template.format(**{key: str(value) for key, value in self.values.items()})
+
+    def __len__(self) -> int:
+        # Length of the formatted prompt give or take the template's field names, without formatting it
+        return len(self.template) + sum(len(value) for value in self.values.values())
+
+    def cache_payload(self) -> Dict[str, Any]:
+        # Stands for the formatted prompt in completion cache keys, the paper being hashed by its digest
+        return {"template": self.template, "values": self.values}
+
+    def __repr__(self) -> str:
+        return f"LazyPrompt({self.template[:30]!r}..., fields={sorted(self.values)})"
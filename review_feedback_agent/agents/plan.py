@@ -0,0 +1,196 @@
+import re
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Type
+from review_feedback_agent.agents.base import Component
+from review_feedback_agent.agents.components import FeedbackActor, Aggregator, FeedbackCritic, Formatter
+
+# Component names accepted in architecture strings
+COMPONENTS: Dict[str, Type[Component]] = {
+    "Actor": FeedbackActor,
+    "Aggregator": Aggregator,
+    "FeedbackCritic": FeedbackCritic,
+    "Formatter": Formatter,
+}
+
+# Options accepted in brackets after a component, e.g. "Actor(2)[pruned=4000,model=haiku-3.5,concurrency=1]"
+# or "FeedbackCritic[cascade=haiku-3.5]"
+OPTIONS = {"pruned", "model", "cascade", "concurrency"}
+
+STEP_SPECIFICATION = re.compile(r"(\w+)(?:\((\d+)\))?\s*(?:\[([^\]]*)\])?")
+
+
+@dataclass(frozen=True)
+class PlanNode:
+    """
+    A step of a compiled architecture
+
+    index: position of the step in the plan, steps are numbered from index + 1 in logs and results
+    name: name of the component in the architecture string, e.g. "Actor"
+    options: (key, value) options of the step, "" for flags such as [pruned]
+    inputs: indices of the steps whose outputs the step takes as input, in order
+    level: length of the longest chain of steps the step depends on
+    group: index of the component specification the step comes from, e.g. all replicas of "Actor(4)"
+    replica: index of the step among the steps of the same component
+    """
+
+    index: int
+    name: str
+    options: Tuple[Tuple[str, str], ...]
+    inputs: Tuple[int, ...]
+    level: int
+    group: int
+    replica: int
+
+    @property
+    def component(self) -> Type[Component]:
+        return COMPONENTS[self.name]
+
+    def option(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        return dict(self.options).get(key, default)
+
+
+@dataclass(frozen=True)
+class Plan:
+    """
+    Architecture compiled into a DAG of steps, immutable so that it can be shared between agents and runs
+
+    architecture: architecture string the plan was compiled from
+    nodes: steps in an order where every step comes after its inputs
+    levels: indices of the steps of each level, steps of a level only depend on steps of earlier levels
+    """
+
+    architecture: str
+    nodes: Tuple[PlanNode, ...]
+    levels: Tuple[Tuple[int, ...], ...]
+
+    def describe(self) -> str:
+        """
+        Returns:
+            str: one line per level listing its steps and their inputs, e.g. "2: Aggregator#3 <- 1, 2"
+        """
+        lines = []
+        for level, indices in enumerate(self.levels):
+            steps = []
+            for index in indices:
+                node = self.nodes[index]
+                inputs = f" <- {', '.join(str(i + 1) for i in node.inputs)}" if node.inputs else ""
+                steps.append(f"{node.name}#{index + 1}{inputs}")
+            lines.append(f"{level}: {'; '.join(steps)}")
+        return "\n".join(lines)
+
+
+def _parse_options(name: str, options_str: Optional[str]) -> Tuple[Tuple[str, str], ...]:
+    options = {}
+    for option in filter(None, (o.strip() for o in (options_str or "").split(","))):
+        key, _, value = option.partition("=")
+        key, value = key.strip(), value.strip()
+        if key not in OPTIONS:
+            raise ValueError(f"Unknown option [{key}] of {name}, expected one of {sorted(OPTIONS)}")
+        options[key] = value
+
+    if "pruned" in options:
+        if not COMPONENTS[name].uses_paper:
+            raise ValueError(f"{name} does not take the paper as input and cannot be [pruned]")
+        if options["pruned"] and not options["pruned"].isdigit():
+            raise ValueError(f"The token budget of [pruned] must be a number, got {options['pruned']}")
+    if "concurrency" in options and not (options["concurrency"].isdigit() and int(options["concurrency"]) > 0):
+        raise ValueError(f"[concurrency] must be a positive number, got {options['concurrency']}")
+    for key in ("model", "cascade"):
+        if key in options and not options[key]:
+            raise ValueError(f"[{key}] of {name} needs a model name, e.g. [{key}=haiku-3.5]")
+    return tuple(sorted(options.items()))
+
+
+def _parse_segments(architecture: str) -> List[List[Tuple[str, Tuple[Tuple[str, str], ...], int]]]:
+    # Steps separated by "->" run one after the other, and steps separated by "|" (or replicated with
+    # "(n)") run side by side. Each step is returned as (name, options, group).
+    segments, group = [], 0
+    for part in architecture.split("->"):
+        segment = []
+        for specification in part.split("|"):
+            match = STEP_SPECIFICATION.fullmatch(specification.strip())
+            if not match:
+                raise ValueError(f"Invalid component specification: {specification.strip()}")
+            name, count, options_str = match.groups()
+            if name not in COMPONENTS:
+                raise ValueError(f"Unknown component: {name}")
+            if count is not None and int(count) < 1:
+                raise ValueError(f"{name} must run at least once, got {name}({count})")
+            segment += [(name, _parse_options(name, options_str), group)] * int(count or 1)
+            group += 1
+        if len({COMPONENTS[name] for name, _, _ in segment}) > 1:
+            raise ValueError(f"Steps run side by side must use the same component: {part.strip()}")
+        # Consecutive steps without inputs (e.g. "Actor->Actor") do not depend on each other
+        if segments and COMPONENTS[segment[0][0]].max_inputs == 0 and COMPONENTS[segments[-1][0][0]].max_inputs == 0:
+            segments[-1] += segment
+        else:
+            segments.append(segment)
+    return segments
+
+
+@lru_cache(maxsize=128)
+def compile_architecture(architecture: str) -> Plan:
+    """
+    Compile an architecture string into a plan, checking that every step gets inputs of the types it accepts
+
+    Each step takes the outputs of the steps just before it: a component taking any number of inputs (the
+    Aggregator) takes all of them, and a component taking one input (the FeedbackCritic or Formatter) takes
+    the single step before it, or runs once per step before it, e.g. "Actor(2)->FeedbackCritic(2)->Aggregator"
+    critiques each Actor's feedback separately before aggregating. Plans are cached by architecture string.
+
+    Params:
+        architecture: architecture string, e.g. "Actor(2)->Aggregator->FeedbackCritic->Formatter"
+
+    Returns:
+        the compiled plan
+
+    Raises:
+        ValueError: if the architecture is invalid
+    """
+    nodes, previous, replicas = [], [], Counter()
+    for segment in _parse_segments(architecture):
+        name = segment[0][0]
+        component = COMPONENTS[name]
+
+        if component.max_inputs == 0:
+            if previous:
+                raise ValueError(f"{name} takes no feedback as input and can only start the architecture")
+            inputs = [()] * len(segment)
+        else:
+            if not previous:
+                raise ValueError(f"{name} needs feedback as input and cannot start the architecture")
+            for i in previous:
+                if nodes[i].component.output_type not in component.input_types:
+                    raise ValueError(
+                        f"{name} cannot take the {nodes[i].component.output_type} of {nodes[i].name} as input, "
+                        f"it takes {' or '.join(sorted(component.input_types))}"
+                    )
+            if component.max_inputs is None:
+                if len(previous) < component.min_inputs:
+                    raise ValueError(
+                        f"{name} needs at least {component.min_inputs} feedback as input, got {len(previous)}"
+                    )
+                inputs = [tuple(previous)] * len(segment)
+            elif len(previous) == 1:
+                inputs = [tuple(previous)] * len(segment)
+            elif len(previous) == len(segment):
+                inputs = [(i,) for i in previous]
+            else:
+                raise ValueError(
+                    f"{name} takes a single feedback as input, but follows {len(previous)} steps. Aggregate them "
+                    f"first, or run {name}({len(previous)}) to process each separately"
+                )
+
+        previous = []
+        for (_, options, group), node_inputs in zip(segment, inputs):
+            level = max((nodes[i].level + 1 for i in node_inputs), default=0)
+            nodes.append(PlanNode(len(nodes), name, options, node_inputs, level, group, replicas[name]))
+            replicas[name] += 1
+            previous.append(len(nodes) - 1)
+
+    levels = [[] for _ in range(max(node.level for node in nodes) + 1)]
+    for node in nodes:
+        levels[node.level].append(node.index)
+    return Plan(architecture, tuple(nodes), tuple(tuple(level) for level in levels))
@@ -220,4 +220,31 @@ Your goal is to only keep feedback to the reviewers that can help them improve t
 - The response you send will be immediately shared with the reviewers. Thus, there should be NO OTHER TEXT in the output, for example no preamble or conclusion sentences. Only respond with the list of feedback & reviewer comment bullets, and no other text.
 - Since your response will immediately be sent to the reviewers, if there is no feedback, just say 'Thanks for your hard work!'."""
 
-FORMATTER_PROMPT = "Here is the feedback for you to format: {feedback}"
\ No newline at end of file
+FORMATTER_PROMPT = "Here is the feedback for you to format: {feedback}"
+
+# Shared-prefix layout: the paper and review come first, in the same form for every stage,
+# so that calls about the same paper or review share a cacheable prompt prefix
+PAPER_CONTEXT_PROMPT = "Here is the paper: <PAPER> {paper} </PAPER>."
+
+REVIEW_CONTEXT_PROMPT = "Here is the peer review: <REVIEW> {review} </REVIEW>"
+
+AGGREGATOR_SUFFIX_PROMPT = "Here are the lists of feedback: <FEEDBACK_LIST> {feedbacks} </FEEDBACK_LIST>"
+
+CRITIC_SUFFIX_PROMPT = """Here is the feedback: <FEEDBACK> {feedback} </FEEDBACK>\n
+Remember:
+- You are a critic that will help reviewers improve their comments and reviews. Your valuable feedback will help improve their review.
+- Do not address the authors at all or provide suggestions to the authors. You are only giving feedback to the reviewer."""
+
+# Appended to the system prompt of the steps rerun to repair feedback that failed reliability tests
+REPAIR_SYSTEM_PROMPT = """
+
+An earlier version of this feedback failed the following quality checks. This is repair attempt {attempt}, so make sure your response fixes each of these problems:
+{failures}"""
+
+# What to fix for each failed reliability test, given to the steps rerun to repair it
+REPAIR_GUIDANCE = {
+    "praise_feedback": "- Some feedback only praises, agrees with or summarizes the reviewer comment without anything the reviewer could change. Remove these comment-feedback pairs.",
+    "addressed_to_author": "- Some feedback is addressed to the authors (e.g. \"your method\", \"readers\") rather than to the reviewer. Rewrite it as feedback to the reviewer about their comment.",
+    "restate_reviewer": "- Some feedback restates the reviewer comment without adding a new, specific suggestion. Give each comment a concrete suggestion the reviewer can act on, or remove it.",
+    "comments_in_review": "- Some reviewer comments are not quoted verbatim from the review. Quote each reviewer comment exactly as it appears in the review.",
+}
@@ -0,0 +1,300 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Generator, Iterator, List, Set, Tuple, Union
+from review_feedback_agent.agents.components import Formatter
+from review_feedback_agent.agents.paper import Paper
+from review_feedback_agent.agents.plan import Plan
+from review_feedback_agent.agents.prompts import REPAIR_GUIDANCE, REPAIR_SYSTEM_PROMPT
+from review_feedback_agent.agents.sharding import merge_shards
+from review_feedback_agent.apis.tracing import Trace, current_trace
+from review_feedback_agent.reliability.run_reliability_tests import run_reliability_tests
+
+# Components able to repair feedback failing each reliability test. Items that only praise can be dropped by
+# the Formatter, other failures need a component that sees the paper and review. Tests missing from it are
+# repaired like restate_reviewer, and from the Formatter if the architecture has none of the components.
+REPAIR_STAGES = {
+    "praise_feedback": ("Formatter",),
+    "addressed_to_author": ("FeedbackCritic", "Aggregator"),
+    "restate_reviewer": ("FeedbackCritic", "Aggregator"),
+    "comments_in_review": ("FeedbackCritic", "Aggregator"),
+}
+
+
+def final_step(plan: Plan) -> int:
+    """
+    Params:
+        plan: compiled architecture
+
+    Returns:
+        int: index of the step whose output is the formatted feedback, the last one if the plan has no Formatter
+    """
+    formatters = [node.index for node in plan.nodes if issubclass(node.component, Formatter)]
+    return formatters[-1] if formatters else len(plan.nodes) - 1
+
+
+def repair_steps(plan: Plan, failed_tests: List[str]) -> Set[int]:
+    """
+    Steps to rerun to repair feedback that failed reliability tests: for each test, the steps closest to the output
+    among those of the components able to fix it (see REPAIR_STAGES), and every step downstream of them
+
+    Params:
+        plan: compiled architecture
+        failed_tests: names of the failed tests
+
+    Returns:
+        set: indices of the steps to rerun
+    """
+    final = final_step(plan)
+    ancestors = {final}
+    for node in reversed(plan.nodes[:final]):
+        if any(node.index in plan.nodes[i].inputs for i in ancestors):
+            ancestors.add(node.index)
+
+    roots = set()
+    for test in failed_tests:
+        names = REPAIR_STAGES.get(test, REPAIR_STAGES["restate_reviewer"])
+        candidates = [plan.nodes[i] for i in ancestors if plan.nodes[i].name in names]
+        # Side by side steps (e.g. FeedbackCritic(2)) each hold part of the feedback, so all of them are rerun
+        level = max((node.level for node in candidates), default=None)
+        roots.update(node.index for node in candidates if node.level == level)
+        if not candidates:
+            roots.add(final)
+
+    steps = set()
+    for node in plan.nodes:
+        if node.index in ancestors and (node.index in roots or any(i in steps for i in node.inputs)):
+            steps.add(node.index)
+    return steps
+
+
+def repair_guidance(failed_tests: List[str], attempt: int) -> str:
+    # Instructions added to the system prompt of the rerun steps
+    return REPAIR_SYSTEM_PROMPT.format(
+        attempt=attempt,
+        failures="\n".join(REPAIR_GUIDANCE.get(test, f"- The feedback failed the {test} check.") for test in failed_tests),
+    )
+
+
+@contextmanager
+def repair_trace() -> Iterator[Trace]:
+    # Records the calls of a repair separately to report its tokens and cost, adding them to the trace of the run if any
+    outer = current_trace()
+    with Trace() as trace:
+        yield trace
+    if outer is not None:
+        outer.extend(trace)
+
+
+def repair_record(attempt: int, failed_tests: List[str], steps: Set[int], trace: Trace) -> Dict[str, Any]:
+    return {"attempt": attempt, "failed tests": failed_tests, "steps": sorted(step + 1 for step in steps), **trace.totals()}
+
+
+def repaired_result(best: Tuple[Dict[str, Any], List[str]], repairs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # A repair can fix some tests and break others, so the result failing the fewest tests is kept
+    result, failed_tests = best
+    result["reliability"] = {"passed": not failed_tests, "failed tests": failed_tests}
+    result["repairs"] = repairs
+    return result
+
+
+class RepairMixin:
+    """
+    Repair of feedback failing the reliability tests for FeedbackAgent, rerunning only the steps that can fix it
+    """
+
+    def _repair_state(self, state: Dict[str, Any], failed_tests: List[str], attempt: int) -> Tuple[Dict[str, Any], Set[int]]:
+        """
+        State of a run repairing the outputs of a finished one, keeping the outputs of the steps that are not rerun
+        and giving the rerun steps the failures to fix
+
+        Params:
+            state: state of the finished run
+            failed_tests: names of the reliability tests its output failed
+            attempt: number of the repair attempt
+
+        Returns:
+            dict: state of the repair run
+            set: indices of the steps to rerun
+        """
+        steps = repair_steps(self.plan, failed_tests)
+        guidance = repair_guidance(failed_tests, attempt)
+        repair_components = {}
+        for index in steps:
+            component = self.components[index]
+            repair_components[index] = type(component)(
+                component.llm_api, system_prompt=component.system_prompt + guidance, shared_prefix=self.shared_prefix
+            )
+        repair_state = {
+            **state,
+            "outputs": {index: output for index, output in state["outputs"].items() if index not in steps},
+            "pruning_stats": [stats for stats in state["pruning_stats"] if stats["step"] - 1 not in steps],
+            "escalated_steps": [step for step in state["escalated_steps"] if step - 1 not in steps],
+            "repair_components": repair_components,
+            # Repairs are not checkpointed, the checkpoint of the original run was deleted once it succeeded
+            "checkpoint_key": None,
+        }
+        return repair_state, steps
+
+    def _state_from_result(self, pdf_text: Union[str, Paper], review_content: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        state = self._initial_state(pdf_text, review_content)
+        # Step numbers are strings in results read back from JSON
+        state["outputs"] = {int(step) - 1: output for step, output in result["step outputs"].items()}
+        state["pruning_stats"] = list(result["pruning stats"])
+        state["escalated_steps"] = list(result["escalated steps"])
+        return state
+
+    def _verify(self, result: Dict[str, Any], review: str) -> Tuple[bool, List[str]]:
+        return run_reliability_tests(
+            result["formatted feedback"],
+            review,
+            tests=self.reliability_tests,
+            verifier_llm=self.verifier_llm,
+            verifier_llms=self.verifier_llms,
+            precheck=True,
+        )
+
+    def _run(self, state: Dict[str, Any], stream: bool = False) -> Generator[Dict[str, Any], None, Dict[str, Any]]:
+        """
+        Run the plan on the state, then repair its output until it passes the reliability tests if repair_attempts is set
+
+        Params:
+            state: initial pipeline state, updated in place
+            stream: whether to stream the Formatter output as "token" events
+
+        Returns:
+            generator over the events of _run_plan, with a {"event": "repair", "attempt": ..., "failed tests": ...,
+                "steps": ...} event before the events of each repair, returning the result
+        """
+        yield from self._run_plan(state, stream)
+        result = self._result(state)
+        if not self.repair_attempts or not result["formatted feedback"]:
+            return result
+
+        passed, failed_tests = self._verify(result, state["review"])
+        best, repairs = (result, failed_tests), []
+        for attempt in range(1, self.repair_attempts + 1):
+            if passed:
+                break
+            state, steps = self._repair_state(state, failed_tests, attempt)
+            yield {"event": "repair", "attempt": attempt, "failed tests": failed_tests, "steps": sorted(s + 1 for s in steps)}
+            with repair_trace() as trace:
+                yield from self._run_plan(state, stream)
+                result = self._result(state)
+                passed, remaining_tests = self._verify(result, state["review"])
+            repairs.append(repair_record(attempt, failed_tests, steps, trace))
+            failed_tests = remaining_tests
+            if len(failed_tests) <= len(best[1]):
+                best = (result, failed_tests)
+        return repaired_result(best, repairs)
+
+    async def _arun(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        # Async version of _run
+        await self._arun_plan(state)
+        result = self._result(state)
+        if not self.repair_attempts or not result["formatted feedback"]:
+            return result
+
+        passed, failed_tests = await asyncio.to_thread(self._verify, result, state["review"])
+        best, repairs = (result, failed_tests), []
+        for attempt in range(1, self.repair_attempts + 1):
+            if passed:
+                break
+            state, steps = self._repair_state(state, failed_tests, attempt)
+            with repair_trace() as trace:
+                await self._arun_plan(state)
+                result = self._result(state)
+                passed, remaining_tests = await asyncio.to_thread(self._verify, result, state["review"])
+            repairs.append(repair_record(attempt, failed_tests, steps, trace))
+            failed_tests = remaining_tests
+            if len(failed_tests) <= len(best[1]):
+                best = (result, failed_tests)
+        return repaired_result(best, repairs)
+
+    def _repair_states(
+        self, pdf_text: Union[str, Paper], review_content: str, result: Dict[str, Any], failed_tests: List[str], attempt: int
+    ) -> Tuple[List[Dict[str, Any]], Set[int]]:
+        """
+        Params:
+            pdf_text: paper text
+            review_content: review text
+            result: result of an earlier run of the agent, possibly merged from shards
+            failed_tests: names of the failed tests
+            attempt: number of the repair attempt
+
+        Returns:
+            list: state of the repair run of each shard of the result, a single one if the review was not split
+            set: indices of the steps to rerun, the same for every shard
+        """
+        if "shards" not in result:
+            state, steps = self._repair_state(self._state_from_result(pdf_text, review_content, result), failed_tests, attempt)
+            return [state], steps
+        shard_reviews = [state["review"] for state in self._shard_states(pdf_text, review_content)]
+        if len(shard_reviews) != len(result["shards"]):
+            raise ValueError(
+                f"The result was merged from {len(result['shards'])} shards but the review splits into {len(shard_reviews)}, "
+                f"repair it with an agent with the shard_size of the agent that produced it"
+            )
+        repairs = [
+            self._repair_state(self._state_from_result(pdf_text, shard_review, shard_result), failed_tests, attempt)
+            for shard_review, shard_result in zip(shard_reviews, result["shards"])
+        ]
+        return [state for state, _ in repairs], repairs[0][1]
+
+    def _repaired(self, review_content: str, states: List[Dict[str, Any]], record: Dict[str, Any]) -> Dict[str, Any]:
+        # Result of the repair runs of a result, merged again if it was split into shards
+        result = self._result(states[0]) if len(states) == 1 else merge_shards(review_content, [self._result(state) for state in states])
+        result["repair"] = record
+        return result
+
+    def repair(self, pdf_text: Union[str, Paper], review_content: str, result: Dict[str, Any], failed_tests: List[str], attempt: int = 1) -> Dict[str, Any]:
+        """
+        Repair feedback that failed reliability tests by rerunning only the steps that can fix them, usually the
+        FeedbackCritic and Formatter, with the failures added to their instructions. The other steps keep their outputs.
+        The shards of a result merged from shards (see shard_size) are each repaired, concurrently, and merged again.
+
+        Params:
+            pdf_text: paper text
+            review_content: review text
+            result: result of an earlier run of the agent on the same paper and review
+            failed_tests: names of the failed tests, e.g. as returned by run_reliability_tests
+            attempt: number of the repair attempt, part of the instructions so that a repeated repair is not
+                served from the completion cache
+
+        Returns:
+            dict: result of the repaired run, with the rerun steps and their calls, tokens and cost under "repair"
+        """
+        states, steps = self._repair_states(pdf_text, review_content, result, failed_tests, attempt)
+
+        def run_plan(state: Dict[str, Any]) -> None:
+            for _ in self._run_plan(state):
+                pass
+
+        trace = self._new_trace()
+        with trace or nullcontext():
+            with repair_trace() as trace_of_repair:
+                if len(states) == 1:
+                    run_plan(states[0])
+                else:
+                    with ThreadPoolExecutor(max_workers=len(states)) as executor:
+                        # Each shard runs in a copy of the current context so that the trace follows it into the worker thread
+                        futures = [executor.submit(contextvars.copy_context().run, run_plan, state) for state in states]
+                        for future in futures:
+                            future.result()
+        result = self._repaired(review_content, states, repair_record(attempt, failed_tests, steps, trace_of_repair))
+        return self._finish(result, trace)
+
+    async def arepair(
+        self, pdf_text: Union[str, Paper], review_content: str, result: Dict[str, Any], failed_tests: List[str], attempt: int = 1
+    ) -> Dict[str, Any]:
+        """
+        Async version of repair
+        """
+        states, steps = self._repair_states(pdf_text, review_content, result, failed_tests, attempt)
+        trace = self._new_trace()
+        with trace or nullcontext():
+            with repair_trace() as trace_of_repair:
+                await asyncio.gather(*(self._arun_plan(state) for state in states))
+        result = self._repaired(review_content, states, repair_record(attempt, failed_tests, steps, trace_of_repair))
+        return self._finish(result, trace)
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Union
+from review_feedback_agent.agents.paper import Paper
+
+if TYPE_CHECKING:
+    from review_feedback_agent.agents.feedback_agent import FeedbackAgent
+
+
+@dataclass(frozen=True)
+class PrefixWarmup:
+    """
+    Orders the steps of runs on reviews of the same paper so that the provider has cached the paper prefix
+    of a step before the other runs send it: the lead run marks each of its steps done, and the other runs
+    wait for the lead before running a step that takes the paper
+
+    events: threading.Event or asyncio.Event set once the lead run has finished each step, by step index
+    lead: whether the run is the lead run
+    """
+
+    events: Dict[int, Any]
+    lead: bool
+
+    def done(self, indices) -> None:
+        if self.lead:
+            for index in indices:
+                self.events[index].set()
+
+
+class PaperSession:
+    def __init__(self, agent: "FeedbackAgent", pdf_text: Union[str, Paper], asynchronous: bool = False):
+        """
+        Runs of a FeedbackAgent on reviews of the same paper, created with FeedbackAgent.session. If the agent has
+        shared_prefix set, the first review run through the session leads: the other reviews only start a step that
+        sends the paper once the lead has finished it, so that the paper is sent to the provider's prompt cache once
+        per step and read from it by the other reviews, whose calls to each step follow each other. Otherwise the
+        reviews run independently, sharing only the paper handle.
+
+        Params:
+            agent: agent running the reviews
+            pdf_text: paper text or handle, shared by all runs of the session
+            asynchronous: whether the session is used through acall, otherwise through __call__
+        """
+        self.agent = agent
+        self.paper = Paper.intern(pdf_text)
+        event_type = asyncio.Event if asynchronous else threading.Event
+        self._events = {node.index: event_type() for node in agent.plan.nodes}
+        self._lead_taken = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _warmup(self) -> Iterator[Optional[PrefixWarmup]]:
+        # Without a shared prefix there is no cached paper to wait for, so the runs are not ordered
+        if not self.agent.shared_prefix:
+            yield None
+            return
+        with self._lock:
+            warmup = PrefixWarmup(self._events, lead=not self._lead_taken)
+            self._lead_taken = True
+        try:
+            yield warmup
+        finally:
+            # The other runs stop waiting once the lead has finished, including when it failed
+            warmup.done(self._events)
+
+    def __call__(self, review_content: str) -> Dict[str, Any]:
+        with self._warmup() as warmup:
+            return self.agent._call(self.paper, review_content, warmup)
+
+    async def acall(self, review_content: str) -> Dict[str, Any]:
+        with self._warmup() as warmup:
+            return await self.agent._acall(self.paper, review_content, warmup)
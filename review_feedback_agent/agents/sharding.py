@@ -0,0 +1,129 @@
+import asyncio
+import contextvars
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Any, Dict, Generator, List, Optional, Union
+from review_feedback_agent.agents.paper import Paper
+from review_feedback_agent.agents.session import PrefixWarmup
+from review_feedback_agent.utils.feedback_parsing import format_feedback_items, parse_feedback
+from review_feedback_agent.utils.review_parsing import shard_review
+from review_feedback_agent.utils.utils import logger
+
+
+def merge_shards(review_content: str, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge the results of the shards of a review. The shards have no comment in common, so their feedback
+    items are merged in review order without another step.
+
+    Params:
+        review_content: review text
+        results: result of each shard
+
+    Returns:
+        dict: result with the keys of a single run except "step outputs", which are kept in the result of
+            each shard under "shards", and with the steps escalated in any shard under "escalated steps"
+    """
+    items = sorted(
+        (item for result in results if result["formatted feedback"] for item in parse_feedback(result["formatted feedback"], review_content)),
+        key=lambda item: item.span[0] if item.span is not None else len(review_content),
+    )
+
+    def joined(key: str) -> Optional[str]:
+        outputs = [result[key] for result in results if result[key]]
+        return "\n\n".join(outputs) if outputs else None
+
+    formatted = any(result["formatted feedback"] for result in results)
+    merged = {
+        "initial feedback": [feedback for result in results for feedback in result["initial feedback"]],
+        "aggregated feedback": joined("aggregated feedback"),
+        "critiqued feedback": joined("critiqued feedback"),
+        "formatted feedback": format_feedback_items(items) if formatted else None,
+        "feedback items": items,
+        "pruning stats": [stats for result in results for stats in result["pruning stats"]],
+        "escalated steps": sorted({step for result in results for step in result["escalated steps"]}),
+        "shards": results,
+    }
+    if any("reliability" in result for result in results):
+        failed_tests = [test for result in results for test in result.get("reliability", {}).get("failed tests", [])]
+        merged["reliability"] = {"passed": not failed_tests, "failed tests": list(dict.fromkeys(failed_tests))}
+        merged["repairs"] = [
+            {**repair, "shard": shard} for shard, result in enumerate(results) for repair in result.get("repairs", [])
+        ]
+    return merged
+
+
+class ShardingMixin:
+    """
+    Runs of FeedbackAgent on long reviews split into shards of comments (see shard_size), run concurrently
+    """
+
+    def _shard_states(self, pdf_text: Union[str, Paper], review_content: str) -> List[Dict[str, Any]]:
+        # Initial state of each shard of the review, a single state if the review is not split
+        shards = shard_review(review_content, self.shard_size) if self.shard_size is not None else [review_content]
+        if len(shards) > 1:
+            logger.info(f"Running the review as {len(shards)} shards of at most {self.shard_size} comments")
+        return [self._initial_state(pdf_text, shard) for shard in shards]
+
+    def _run_shards(self, states: List[Dict[str, Any]], stream: bool = False) -> Generator[Dict[str, Any], None, List[Dict[str, Any]]]:
+        """
+        Run each shard of a review concurrently, each in a worker thread
+
+        Params:
+            states: initial pipeline state of each shard, updated in place
+            stream: whether to stream the Formatter outputs as "token" events
+
+        Returns:
+            generator over the events of _run for all shards as they happen, with the index of the shard
+                under "shard", returning the result of each shard
+        """
+        events = queue.Queue()
+
+        def run_shard(shard: int, state: Dict[str, Any]) -> Dict[str, Any]:
+            generator = self._run(state, stream)
+            while True:
+                try:
+                    event = next(generator)
+                except StopIteration as stop:
+                    return stop.value
+                events.put({**event, "shard": shard})
+
+        with ThreadPoolExecutor(max_workers=len(states)) as executor:
+            # Each shard runs in a copy of the current context so that the trace follows it into the worker thread
+            futures = [
+                executor.submit(contextvars.copy_context().run, run_shard, shard, state) for shard, state in enumerate(states)
+            ]
+            for future in futures:
+                # Marks the end of the events of a shard
+                future.add_done_callback(lambda _: events.put(None))
+            running = len(futures)
+            while running:
+                event = events.get()
+                if event is None:
+                    running -= 1
+                else:
+                    yield event
+        return [future.result() for future in futures]
+
+    def _review_states(self, pdf_text: Union[str, Paper], review_content: str, warmup: Optional[PrefixWarmup]) -> List[Dict[str, Any]]:
+        states = self._shard_states(pdf_text, review_content)
+        for shard, state in enumerate(states):
+            # Only the first shard of the lead run leads
+            state["prefix_warmup"] = warmup if shard == 0 or warmup is None else replace(warmup, lead=False)
+        return states
+
+    def _run_review(
+        self, pdf_text: Union[str, Paper], review_content: str, stream: bool = False, warmup: Optional[PrefixWarmup] = None
+    ) -> Generator[Dict[str, Any], None, Dict[str, Any]]:
+        # _run on the review, or on each of its shards if it is split
+        states = self._review_states(pdf_text, review_content, warmup)
+        if len(states) == 1:
+            return (yield from self._run(states[0], stream))
+        return merge_shards(review_content, (yield from self._run_shards(states, stream)))
+
+    async def _arun_review(self, pdf_text: Union[str, Paper], review_content: str, warmup: Optional[PrefixWarmup] = None) -> Dict[str, Any]:
+        # Async version of _run_review
+        states = self._review_states(pdf_text, review_content, warmup)
+        if len(states) == 1:
+            return await self._arun(states[0])
+        return merge_shards(review_content, list(await asyncio.gather(*(self._arun(state) for state in states))))
@@ -1 +1,3 @@
 from .llm import LLM
+from .engines import AnthropicEngine
+from .scheduler import Scheduler
@@ -0,0 +1,89 @@
+import copy
+from typing import Union, List, Dict, Any, Iterator, Optional
+import anthropic
+from review_feedback_agent.apis import tracing
+
+# Short model names accepted by LLM, mapped to Anthropic model identifiers
+MODEL_ALIASES = {
+    "sonnet-3.5": "claude-3-5-sonnet-20241022",
+    "haiku-3.5": "claude-3-5-haiku-20241022",
+    "haiku-3": "claude-3-haiku-20240307",
+    "opus-3": "claude-3-opus-20240229",
+}
+
+
+class AnthropicEngine:
+    # Messages may be lists of content blocks carrying cache_control breakpoints
+    supports_cache_control = True
+    # Calls accept a `timeout` in seconds, given by the LLM's scheduler
+    supports_timeout = True
+
+    def __init__(
+        self,
+        model_name: str = "sonnet-3.5",
+        max_tokens: int = 2000,
+        temperature: float = 0,
+        api_key: Optional[str] = None,
+        max_retries: int = 2,
+    ):
+        """
+        Engine calling the Anthropic Messages API directly, with a native async path
+
+        Params:
+            model_name: short model name (see MODEL_ALIASES) or full Anthropic model identifier
+            max_tokens: maximum number of tokens to generate per call
+            temperature: sampling temperature
+            api_key: Anthropic API key, read from ANTHROPIC_API_KEY if not given
+            max_retries: number of retries made by the Anthropic client, set to 0 when the LLM has a Scheduler
+                so that retries are only made (and rate limited) by the scheduler
+        """
+        self.model_string = MODEL_ALIASES.get(model_name, model_name)
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.client = anthropic.Anthropic(api_key=api_key, max_retries=max_retries)
+        self.async_client = anthropic.AsyncAnthropic(api_key=api_key, max_retries=max_retries)
+
+    def with_model(self, model_name: str) -> "AnthropicEngine":
+        """
+        Engine calling another model with the same settings, sharing the Anthropic clients
+
+        Params:
+            model_name: short model name (see MODEL_ALIASES) or full Anthropic model identifier
+        """
+        engine = copy.copy(self)
+        engine.model_string = MODEL_ALIASES.get(model_name, model_name)
+        return engine
+
+    def _request(self, message: Union[List[Dict[str, Any]], str], system_prompt: str, **kwargs) -> Dict[str, Any]:
+        return {
+            "model": self.model_string,
+            "system": system_prompt,
+            "messages": [{"role": "user", "content": message}],
+            "max_tokens": kwargs.pop("max_tokens", self.max_tokens),
+            "temperature": kwargs.pop("temperature", self.temperature),
+            **kwargs,
+        }
+
+    def __call__(self, message: Union[List[Dict[str, Any]], str], system_prompt: str, **kwargs) -> str:
+        response = self.client.messages.create(**self._request(message, system_prompt, **kwargs))
+        _record_usage(response.usage)
+        return response.content[0].text
+
+    async def acall(self, message: Union[List[Dict[str, Any]], str], system_prompt: str, **kwargs) -> str:
+        response = await self.async_client.messages.create(**self._request(message, system_prompt, **kwargs))
+        _record_usage(response.usage)
+        return response.content[0].text
+
+    def stream(self, message: Union[List[Dict[str, Any]], str], system_prompt: str, **kwargs) -> Iterator[str]:
+        with self.client.messages.stream(**self._request(message, system_prompt, **kwargs)) as stream:
+            yield from stream.text_stream
+            _record_usage(stream.get_final_message().usage)
+
+
+def _record_usage(usage: Any) -> None:
+    tracing.record_usage(
+        usage.input_tokens,
+        usage.output_tokens,
+        getattr(usage, "cache_read_input_tokens", 0),
+        getattr(usage, "cache_creation_input_tokens", 0),
+    )
@@ -1,12 +1,347 @@
 import os
-from typing import Union, List, Dict, Any
+import asyncio
+import hashlib
+import json
+import threading
+import weakref
+from typing import Union, List, Dict, Any, Iterator, Optional
+import diskcache
 import textgrad as tg
+from review_feedback_agent.apis import tracing
+from review_feedback_agent.apis.scheduler import Scheduler
+
+
+# Engine attributes holding the defaults of the sampling parameters that calls can override
+ENGINE_SETTINGS = ("model_string", "max_tokens", "temperature", "top_p", "top_k")
 
 
 class LLM:
-    def __init__(self, model_name: str = "sonnet-3.5"):
+    def __init__(
+        self,
+        model_name: str = "sonnet-3.5",
+        engine: Any = None,
+        max_concurrency: Optional[int] = None,
+        cache_dir: Optional[str] = None,
+        cache_size_limit: int = 2**30,
+        cache_ttl: Optional[float] = None,
+        scheduler: Optional[Scheduler] = None,
+        priority: str = "interactive",
+    ):
+        """
+        Wrapper around the engine used by all components
+
+        Params:
+            model_name: name of the model, used to create a textgrad engine if no engine is given
+            engine: engine to use instead of the textgrad engine, e.g. AnthropicEngine for native async calls
+            max_concurrency: maximum number of in-flight async calls per event loop, unbounded if None
+            cache_dir: directory of the persistent completion cache, caching is disabled if None
+            cache_size_limit: maximum size of the cache in bytes, least recently used entries are evicted first
+            cache_ttl: number of seconds after which cached completions expire, never if None
+            scheduler: scheduler applying rate limits, retries and deadlines to engine calls, shared between
+                LLMs using the same provider account. Engine calls are made once with no retry if None
+            priority: priority of this LLM's calls in the scheduler, "interactive" or "batch"
+        """
         self.model_name = model_name
-        self.engine = tg.get_engine(model_name, cache_or_not=False)
+        self._textgrad_engine = engine is None
+        self.engine = engine if engine is not None else tg.get_engine(model_name, cache_or_not=False)
+        self.max_concurrency = max_concurrency
+        self.scheduler = scheduler
+        self.priority = priority
+        self._semaphores = weakref.WeakKeyDictionary()
+
+        self.cache = (
+            diskcache.Cache(
+                cache_dir,
+                size_limit=cache_size_limit,
+                eviction_policy="least-recently-used",
+            )
+            if cache_dir is not None
+            else None
+        )
+        self.cache_ttl = cache_ttl
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._stats_lock = threading.Lock()
+
+    def with_model(self, model_name: str) -> "LLM":
+        """
+        LLM calling another model with the same type of engine and the same settings, sharing this LLM's
+        completion cache (whose keys include the model), its scheduler and its priority
+
+        Params:
+            model_name: name of the model
+
+        Returns:
+            llm: LLM for the model
+
+        Raises:
+            ValueError: if the engine was given and has no with_model method to copy it for another model
+        """
+        if self._textgrad_engine:
+            engine = None
+        elif hasattr(self.engine, "with_model"):
+            engine = self.engine.with_model(model_name)
+        else:
+            raise ValueError(f"{type(self.engine).__name__} cannot be copied for model {model_name}, give an LLM for it instead")
+        llm = LLM(model_name, engine, self.max_concurrency, scheduler=self.scheduler, priority=self.priority)
+        llm.cache = self.cache
+        llm.cache_ttl = self.cache_ttl
+        return llm
+
+    def __call__(
+        self,
+        message: Union[List[Dict[str, str]], str],
+        system_prompt: str,
+        use_cache: bool = True,
+        cache_salt: Optional[str] = None,
+        **kwargs,
+    ):
+        """
+        Call the engine, returning a cached completion if one exists
+
+        Params:
+            message: prompt to send, either a string or a list of text content blocks that may carry
+                cache_control breakpoints marking the end of a prefix the provider should cache. The prompt and
+                the text of the blocks can also be objects formatted with str() when the call is sent, such as
+                LazyPrompt, so that calls waiting for the scheduler or a concurrency slot do not hold the formatted text
+            system_prompt: system prompt to send
+            use_cache: whether to read and write the cache for this call
+            cache_salt: extra value added to the cache key, e.g. to keep replicas meant to be diverse apart
+            kwargs: sampling parameters passed on to the engine
+        """
+        with tracing.llm_call(self.model_name) as call:
+            key = self._cache_key(message, system_prompt, cache_salt, kwargs) if use_cache else None
+            completion = self._cache_get(key)
+            cached = completion is not None
+            if not cached:
+                completion = self._call_engine(message, system_prompt, **kwargs)
+                self._cache_set(key, completion)
+            if call is not None:
+                self._complete_call_record(call, message, system_prompt, completion, cached)
+        return completion
+
+    def stream(
+        self,
+        message: Union[List[Dict[str, str]], str],
+        system_prompt: str,
+        use_cache: bool = True,
+        cache_salt: Optional[str] = None,
+        **kwargs,
+    ) -> Iterator[str]:
+        """
+        Streaming version of __call__, yielding the completion in chunks as they are generated.
+        Engines without a `stream` method, and cached completions, yield the whole completion at once.
+        The completion is cached once the stream has been consumed to the end.
+        """
+        with tracing.llm_call(self.model_name) as call:
+            key = self._cache_key(message, system_prompt, cache_salt, kwargs) if use_cache else None
+            completion = self._cache_get(key)
+            cached = completion is not None
+            if cached:
+                yield completion
+            elif not hasattr(self.engine, "stream"):
+                completion = self._call_engine(message, system_prompt, **kwargs)
+                yield completion
+            else:
+                chunks = []
+                for chunk in self._stream_engine(message, system_prompt, **kwargs):
+                    chunks.append(chunk)
+                    yield chunk
+                completion = "".join(chunks)
+            if not cached:
+                self._cache_set(key, completion)
+            if call is not None:
+                self._complete_call_record(call, message, system_prompt, completion, cached)
+
+    async def acall(
+        self,
+        message: Union[List[Dict[str, str]], str],
+        system_prompt: str,
+        use_cache: bool = True,
+        cache_salt: Optional[str] = None,
+        **kwargs,
+    ):
+        """
+        Async version of __call__. Engines without a native `acall` are run in a worker thread.
+        """
+        with tracing.llm_call(self.model_name) as call:
+            key = self._cache_key(message, system_prompt, cache_salt, kwargs) if use_cache else None
+            completion = self._cache_get(key)
+            cached = completion is not None
+            if not cached:
+                semaphore = self._get_semaphore()
+                if semaphore is None:
+                    completion = await self._acall_engine(message, system_prompt, **kwargs)
+                else:
+                    async with semaphore:
+                        completion = await self._acall_engine(message, system_prompt, **kwargs)
+                self._cache_set(key, completion)
+            if call is not None:
+                self._complete_call_record(call, message, system_prompt, completion, cached)
+        return completion
+
+    def _call_engine(self, message: Union[List[Dict[str, str]], str], system_prompt: str, **kwargs) -> str:
+        if self.scheduler is None:
+            return self.engine(self._prepare_message(message), system_prompt=system_prompt, **kwargs)
+
+        completion = self.scheduler.run(
+            lambda remaining: self.engine(
+                self._prepare_message(message), system_prompt=system_prompt, **self._with_timeout(kwargs, remaining)
+            ),
+            tokens=_estimate_tokens(message, system_prompt),
+            priority=self.priority,
+        )
+        self.scheduler.charge(len(completion) // 4)
+        return completion
+
+    async def _acall_engine(self, message: Union[List[Dict[str, str]], str], system_prompt: str, **kwargs) -> str:
+        async def call(remaining: Optional[float] = None) -> str:
+            engine_kwargs = self._with_timeout(kwargs, remaining)
+            prepared = self._prepare_message(message)
+            if hasattr(self.engine, "acall"):
+                return await self.engine.acall(prepared, system_prompt=system_prompt, **engine_kwargs)
+            return await asyncio.to_thread(self.engine, prepared, system_prompt=system_prompt, **engine_kwargs)
+
+        if self.scheduler is None:
+            return await call()
+        completion = await self.scheduler.arun(
+            call, tokens=_estimate_tokens(message, system_prompt), priority=self.priority
+        )
+        self.scheduler.charge(len(completion) // 4)
+        return completion
+
+    def _stream_engine(self, message: Union[List[Dict[str, str]], str], system_prompt: str, **kwargs) -> Iterator[str]:
+        if self.scheduler is None:
+            yield from self.engine.stream(self._prepare_message(message), system_prompt=system_prompt, **kwargs)
+            return
+
+        # Only failures before the first chunk can be retried, later ones would repeat the output
+        def start(remaining: Optional[float]):
+            chunks = iter(
+                self.engine.stream(
+                    self._prepare_message(message), system_prompt=system_prompt, **self._with_timeout(kwargs, remaining)
+                )
+            )
+            return next(chunks, None), chunks
+
+        first, chunks = self.scheduler.run(
+            start, tokens=_estimate_tokens(message, system_prompt), priority=self.priority
+        )
+        output_length = 0
+        if first is not None:
+            output_length += len(first)
+            yield first
+        for chunk in chunks:
+            output_length += len(chunk)
+            yield chunk
+        self.scheduler.charge(output_length // 4)
+
+    def _with_timeout(self, kwargs: Dict[str, Any], remaining: Optional[float]) -> Dict[str, Any]:
+        # Engines declaring `supports_timeout` are given the time left before the scheduler's deadline
+        if remaining is None or not getattr(self.engine, "supports_timeout", False):
+            return kwargs
+        return {**kwargs, "timeout": remaining}
+
+    def _prepare_message(self, message: Union[List[Dict[str, Any]], str]) -> Union[List[Dict[str, Any]], str]:
+        # Called when the message is sent, formatting lazy prompts. Structured text blocks with cache breakpoints
+        # are only understood by engines that declare `supports_cache_control`, other engines get the blocks
+        # joined into a single prompt
+        if not isinstance(message, list):
+            return str(message)
+        if not getattr(self.engine, "supports_cache_control", False) and all(
+            isinstance(block, dict) and block.get("type") == "text" for block in message
+        ):
+            return "\n".join(str(block["text"]) for block in message)
+        return [
+            {**block, "text": str(block["text"])} if isinstance(block, dict) and "text" in block else block
+            for block in message
+        ]
+
+    def _complete_call_record(
+        self,
+        call: tracing.CallRecord,
+        message: Union[List[Dict[str, Any]], str],
+        system_prompt: str,
+        completion: str,
+        cached: bool,
+    ) -> None:
+        # Token counts are estimated at about 4 characters per token for engines that do not report usage
+        call.cached = cached
+        if not cached and not call.reported_usage:
+            call.input_tokens = _estimate_tokens(message, system_prompt)
+            call.output_tokens = len(completion) // 4
+
+    def _get_semaphore(self) -> Optional[asyncio.Semaphore]:
+        # Semaphores are bound to an event loop, so keep one per running loop
+        if self.max_concurrency is None:
+            return None
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[loop]
+
+    def _cache_key(
+        self,
+        message: Union[List[Dict[str, str]], str],
+        system_prompt: str,
+        cache_salt: Optional[str],
+        sampling_params: Dict[str, Any],
+    ) -> Optional[str]:
+        if self.cache is None:
+            return None
+        # The engine's own settings apply to every call that does not override them, so they are part of the
+        # key, e.g. the temperature and max_tokens of an AnthropicEngine
+        engine_settings = {name: getattr(self.engine, name) for name in ENGINE_SETTINGS if hasattr(self.engine, name)}
+        payload = json.dumps(
+            {
+                "model": self.model_name,
+                "engine": f"{type(self.engine).__module__}.{type(self.engine).__qualname__}",
+                "system_prompt": system_prompt,
+                "message": message,
+                "sampling_params": {**engine_settings, **sampling_params},
+                "salt": cache_salt,
+            },
+            sort_keys=True,
+            default=_cache_payload,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+        completion = self.cache.get(key)
+        with self._stats_lock:
+            if completion is None:
+                self.cache_misses += 1
+            else:
+                self.cache_hits += 1
+        return completion
+
+    def _cache_set(self, key: Optional[str], completion: str) -> None:
+        if key is not None:
+            self.cache.set(key, completion, expire=self.cache_ttl)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            dict: number of cache hits and misses since creation, and current cache size in bytes
+        """
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "size": self.cache.volume() if self.cache is not None else 0,
+        }
+
+
+def _cache_payload(value: Any) -> Any:
+    # Lazy prompts and paper handles are hashed by their template and the paper's digest, without formatting them
+    cache_payload = getattr(value, "cache_payload", None)
+    return cache_payload() if cache_payload is not None else str(value)
+
 
-    def __call__(self, message: Union[List[Dict[str, str]], str], system_prompt: str):
-        return self.engine(message, system_prompt=system_prompt)
+def _estimate_tokens(message: Union[List[Dict[str, Any]], str], system_prompt: str) -> int:
+    # About 4 characters per token, for engines that do not report usage and for rate limiting. Lazy prompts
+    # report their length without being formatted.
+    if isinstance(message, list):
+        return (len(system_prompt) + sum(len(block.get("text", "")) for block in message if isinstance(block, dict))) // 4
+    return (len(system_prompt) + len(message)) // 4
@@ -0,0 +1,227 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+from review_feedback_agent.apis import tracing
+from review_feedback_agent.utils.utils import logger
+
+T = TypeVar("T")
+
+# HTTP statuses worth retrying: rate limited, server errors and Anthropic's "overloaded"
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+PRIORITIES = ("interactive", "batch")
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Token bucket refilled continuously at `rate_per_minute`, that can be overdrawn: a reservation larger
+        than the current level is granted immediately with the time to wait until it is covered, so that
+        concurrent callers queue up in order
+
+        Params:
+            rate_per_minute: units (requests or tokens) added per minute
+            capacity: maximum level of the bucket, defaults to one minute of units
+        """
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float, floor: float = 0.0) -> float:
+        """
+        Take `amount` units from the bucket
+
+        Params:
+            amount: units to take, capped at the capacity of the bucket
+            floor: share of the capacity the level must stay above once the amount is taken, e.g. to keep
+                part of the capacity for higher priority callers
+
+        Returns:
+            seconds to wait before using the units
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+            self._updated = now
+            amount = min(amount, self.capacity * (1 - floor))
+            wait = max(0.0, (floor * self.capacity + amount - self.level) / self.rate)
+            self.level -= amount
+            return wait
+
+    def charge(self, amount: float) -> None:
+        """
+        Take `amount` units without waiting, e.g. to account for usage only known once a call has finished
+        """
+        with self._lock:
+            self.level -= amount
+
+
+class Scheduler:
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = 5,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        timeout: Optional[float] = None,
+        batch_reserve: float = 0.2,
+        is_retryable: Optional[Callable[[Exception], bool]] = None,
+    ):
+        """
+        Rate limits, retries and deadlines for engine calls, shared by every LLM (and thread or event loop)
+        calling the same provider account
+
+        Calls first wait for the request and token buckets. Calls failing with a retryable error (rate limit,
+        overload, server error, timeout or connection error) are retried with jittered exponential backoff,
+        waiting at least the provider's retry-after. A rate-limit response pauses all callers until the
+        retry-after has passed.
+
+        Params:
+            requests_per_minute: maximum number of requests started per minute, unlimited if None
+            tokens_per_minute: maximum number of input and output tokens per minute, unlimited if None
+            max_retries: maximum number of retries per call
+            initial_backoff: upper bound of the first backoff in seconds, doubled at every retry
+            max_backoff: maximum backoff in seconds
+            timeout: deadline in seconds of each call including rate limit waits and retries, none if None
+            batch_reserve: share of each bucket that "batch" priority calls leave to "interactive" calls
+            is_retryable: predicate deciding whether an exception is retried, defaults to is_retryable_error
+        """
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.batch_reserve = batch_reserve
+        self.is_retryable = is_retryable or is_retryable_error
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def run(self, call: Callable[[Optional[float]], T], tokens: int = 0, priority: str = "interactive") -> T:
+        """
+        Run an engine call under the rate limits, retrying it on retryable errors
+
+        Params:
+            call: function making the engine call, given the seconds left before the deadline (None if there is none)
+            tokens: estimated number of input tokens of the call
+            priority: "interactive" or "batch"
+
+        Returns:
+            result of the call
+        """
+        deadline = self._deadline()
+        for attempt in range(self.max_retries + 1):
+            self._sleep(self._acquire(tokens, priority), deadline)
+            try:
+                return call(self._remaining(deadline))
+            except Exception as e:
+                self._sleep(self._backoff(e, attempt), deadline, e)
+
+    async def arun(
+        self, call: Callable[[Optional[float]], Awaitable[T]], tokens: int = 0, priority: str = "interactive"
+    ) -> T:
+        """
+        Async version of run. Each attempt is cancelled if it runs past the deadline.
+        """
+        deadline = self._deadline()
+        for attempt in range(self.max_retries + 1):
+            await self._asleep(self._acquire(tokens, priority), deadline)
+            remaining = self._remaining(deadline)
+            try:
+                return await asyncio.wait_for(call(remaining), remaining)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError) and deadline is not None and time.monotonic() >= deadline:
+                    raise DeadlineExceeded(f"Call did not finish within its {self.timeout} second deadline") from e
+                await self._asleep(self._backoff(e, attempt), deadline, e)
+
+    def charge(self, tokens: int) -> None:
+        """
+        Count tokens known only after a call, such as its output, against the tokens per minute limit
+        """
+        if self.token_bucket is not None:
+            self.token_bucket.charge(tokens)
+
+    def _deadline(self) -> Optional[float]:
+        return time.monotonic() + self.timeout if self.timeout is not None else None
+
+    def _remaining(self, deadline: Optional[float]) -> Optional[float]:
+        return max(0.0, deadline - time.monotonic()) if deadline is not None else None
+
+    def _acquire(self, tokens: int, priority: str) -> float:
+        # Seconds to wait before the call may start
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}, expected one of {PRIORITIES}")
+        floor = self.batch_reserve if priority == "batch" else 0.0
+        wait = max(0.0, self._paused_until - time.monotonic())
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.reserve(1, floor))
+        if self.token_bucket is not None and tokens:
+            wait = max(wait, self.token_bucket.reserve(tokens, floor))
+        return wait
+
+    def _backoff(self, error: Exception, attempt: int) -> float:
+        # Seconds to wait before retrying after `error`, re-raising it if it should not be retried
+        if attempt >= self.max_retries or not self.is_retryable(error):
+            raise error
+        retry_after = get_retry_after(error)
+        backoff = random.uniform(0, min(self.max_backoff, self.initial_backoff * 2**attempt))
+        if retry_after is not None:
+            backoff = max(backoff, retry_after)
+            if getattr(error, "status_code", None) == 429:
+                with self._lock:
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        logger.warning(f"Retrying LLM call in {backoff:.1f}s after {type(error).__name__}: {error}")
+        tracing.record_retry()
+        return backoff
+
+    def _check_deadline(self, wait: float, deadline: Optional[float], error: Optional[Exception]) -> None:
+        if deadline is not None and time.monotonic() + wait > deadline:
+            raise DeadlineExceeded(f"Call would not start within its {self.timeout} second deadline") from error
+
+    def _sleep(self, wait: float, deadline: Optional[float], error: Optional[Exception] = None) -> None:
+        self._check_deadline(wait, deadline, error)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def _asleep(self, wait: float, deadline: Optional[float], error: Optional[Exception] = None) -> None:
+        self._check_deadline(wait, deadline, error)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Whether an engine error is transient: a retryable HTTP status (e.g. anthropic.RateLimitError), a timeout
+    or a connection error
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    name = type(error).__name__
+    return isinstance(error, (TimeoutError, ConnectionError)) or "Timeout" in name or "Connection" in name
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    Seconds the provider asked to wait before retrying, from the retry-after(-ms) headers of the error's response
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
@@ -0,0 +1,321 @@
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from review_feedback_agent.apis.engines import MODEL_ALIASES
+
+# Price in dollars per million input and output tokens, keyed by Anthropic model identifier
+MODEL_PRICES = {
+    "claude-3-5-sonnet-20241022": (3.0, 15.0),
+    "claude-3-5-sonnet-20240620": (3.0, 15.0),
+    "claude-3-5-haiku-20241022": (0.8, 4.0),
+    "claude-3-haiku-20240307": (0.25, 1.25),
+    "claude-3-opus-20240229": (15.0, 75.0),
+}
+# Prompt cache writes and reads are billed relative to the input token price
+CACHE_WRITE_PRICE_FACTOR = 1.25
+CACHE_READ_PRICE_FACTOR = 0.1
+
+# The trace of the current run and the step being run, if tracing is enabled. Context variables follow
+# the run into asyncio tasks and asyncio.to_thread, but work submitted to a thread pool has to be run in
+# a copy of the submitting context.
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+_current_step: contextvars.ContextVar[Optional[Tuple[int, str]]] = contextvars.ContextVar("trace_step", default=None)
+_current_call: contextvars.ContextVar[Optional["CallRecord"]] = contextvars.ContextVar("trace_call", default=None)
+
+
+@dataclass
+class CallRecord:
+    model: str
+    step: Optional[int] = None
+    component: Optional[str] = None
+    start: float = 0.0
+    duration: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    # Whether the token counts were reported by the engine, rather than estimated from the text
+    reported_usage: bool = False
+    cached: bool = False
+    retries: int = 0
+    cost: Optional[float] = None
+
+
+@dataclass
+class StepRecord:
+    step: int
+    component: str
+    start: float = 0.0
+    duration: float = 0.0
+
+
+@dataclass
+class Trace:
+    """
+    Timings, token counts and estimated cost of the LLM calls and steps of one run, with times in
+    seconds relative to the start of the trace
+    """
+
+    steps: List[StepRecord] = field(default_factory=list)
+    calls: List[CallRecord] = field(default_factory=list)
+    started_at: float = field(default_factory=time.time)
+    duration: float = 0.0
+
+    def __post_init__(self):
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._tokens = []
+
+    def __enter__(self) -> "Trace":
+        self._tokens.append(_current_trace.set(self))
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        _current_trace.reset(self._tokens.pop())
+        self.duration = time.perf_counter() - self._start
+
+    def iterate(self, iterator: Iterator) -> Iterator:
+        """
+        Consume an iterator with the trace active while each item is produced, without leaving it active
+        in the consumer's context between items (e.g. for the events of FeedbackAgent.stream). Returns the
+        return value of the iterator if it is a generator.
+        """
+        context = contextvars.copy_context()
+        context.run(self.__enter__)
+        try:
+            while True:
+                try:
+                    item = context.run(next, iterator)
+                except StopIteration as stop:
+                    return stop.value
+                yield item
+        finally:
+            context.run(self.__exit__, None, None, None)
+
+    def _add(self, records: list, record) -> None:
+        with self._lock:
+            records.append(record)
+
+    def extend(self, other: "Trace") -> None:
+        """
+        Add the steps and calls of a trace recorded while this one was active, e.g. to account for part of
+        a run separately
+        """
+        offset = other._start - self._start
+        with self._lock:
+            self.steps += [replace(step, start=step.start + offset) for step in other.steps]
+            self.calls += [replace(call, start=call.start + offset) for call in other.calls]
+
+    def totals(self) -> Dict[str, float]:
+        """
+        Returns:
+            dict: number of LLM calls, tokens and estimated cost of all calls of the trace
+        """
+        return {
+            "calls": len(self.calls),
+            "input tokens": sum(call.input_tokens for call in self.calls),
+            "output tokens": sum(call.output_tokens for call in self.calls),
+            "cache read tokens": sum(call.cache_read_tokens for call in self.calls),
+            "cost": sum(call.cost or 0.0 for call in self.calls),
+        }
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns:
+            dict: totals per component ("" for calls made outside of a step) of steps, LLM calls, wall time,
+                tokens, completion cache hits, retries and estimated cost
+        """
+        totals = defaultdict(lambda: defaultdict(float))
+        for step in self.steps:
+            totals[step.component]["steps"] += 1
+            totals[step.component]["seconds"] += step.duration
+        for call in self.calls:
+            component = totals[call.component or ""]
+            component["calls"] += 1
+            component["input tokens"] += call.input_tokens
+            component["output tokens"] += call.output_tokens
+            component["cache read tokens"] += call.cache_read_tokens
+            component["cache write tokens"] += call.cache_write_tokens
+            component["cache hits"] += call.cached
+            component["retries"] += call.retries
+            component["cost"] += call.cost or 0.0
+        return {name: dict(values) for name, values in totals.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "started at": self.started_at,
+            "duration": self.duration,
+            "steps": [asdict(step) for step in self.steps],
+            "calls": [asdict(call) for call in self.calls],
+            "summary": self.summary(),
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def step_span(step: int, component: str) -> Iterator[None]:
+    """
+    Record the wall time of a pipeline step, and attribute the LLM calls made within it to the step.
+    Does nothing if no trace is active.
+
+    Params:
+        step: number of the step in the sequence, starting at 1
+        component: name of the component run by the step
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    token = _current_step.set((step, component))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current_step.reset(token)
+        trace._add(trace.steps, StepRecord(step, component, start - trace._start, time.perf_counter() - start))
+
+
+@contextmanager
+def llm_call(model: str) -> Iterator[Optional[CallRecord]]:
+    """
+    Record an LLM call made within the block, yielding its record for the caller to complete,
+    or None if no trace is active
+
+    Params:
+        model: model name
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    step, component = _current_step.get() or (None, None)
+    call = CallRecord(model=model, step=step, component=component, start=time.perf_counter() - trace._start)
+    token = _current_call.set(call)
+    try:
+        yield call
+    finally:
+        _current_call.reset(token)
+        call.duration = time.perf_counter() - trace._start - call.start
+        call.cost = estimate_cost(call)
+        trace._add(trace.calls, call)
+
+
+def record_usage(
+    input_tokens: int, output_tokens: int, cache_read_tokens: int = 0, cache_write_tokens: int = 0
+) -> None:
+    """
+    Report the token usage of the current LLM call, for engines whose API returns it. Does nothing if
+    no trace is active.
+    """
+    call = _current_call.get()
+    if call is not None:
+        call.input_tokens = input_tokens
+        call.output_tokens = output_tokens
+        call.cache_read_tokens = cache_read_tokens or 0
+        call.cache_write_tokens = cache_write_tokens or 0
+        call.reported_usage = True
+
+
+def record_retry() -> None:
+    """
+    Count a retry of the current LLM call. Does nothing if no trace is active.
+    """
+    call = _current_call.get()
+    if call is not None:
+        call.retries += 1
+
+
+def estimate_cost(call: CallRecord) -> Optional[float]:
+    """
+    Returns:
+        cost: estimated cost of the call in dollars, None if the model's price is unknown
+    """
+    if call.cached:
+        return 0.0
+    prices = MODEL_PRICES.get(MODEL_ALIASES.get(call.model, call.model))
+    if prices is None:
+        return None
+    input_price, output_price = prices
+    return (
+        call.input_tokens * input_price
+        + call.cache_write_tokens * input_price * CACHE_WRITE_PRICE_FACTOR
+        + call.cache_read_tokens * input_price * CACHE_READ_PRICE_FACTOR
+        + call.output_tokens * output_price
+    ) / 1e6
+
+
+class JSONLExporter:
+    def __init__(self, path: str):
+        """
+        Appends each trace to a JSONL file, one line per trace
+
+        Params:
+            path: path to the JSONL file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace) -> None:
+        line = json.dumps(trace.to_dict())
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+class PrometheusExporter:
+    # Metric name, help text and summary field of each counter, labeled by component
+    METRICS = [
+        ("review_feedback_steps_total", "Pipeline steps run", "steps"),
+        ("review_feedback_step_seconds_total", "Wall time spent in pipeline steps", "seconds"),
+        ("review_feedback_llm_calls_total", "LLM calls", "calls"),
+        ("review_feedback_llm_input_tokens_total", "Uncached input tokens sent", "input tokens"),
+        ("review_feedback_llm_output_tokens_total", "Output tokens generated", "output tokens"),
+        ("review_feedback_llm_cache_read_tokens_total", "Input tokens read from the prompt cache", "cache read tokens"),
+        ("review_feedback_llm_cache_hits_total", "LLM calls answered from the completion cache", "cache hits"),
+        ("review_feedback_llm_retries_total", "Retried LLM requests", "retries"),
+        ("review_feedback_llm_cost_dollars_total", "Estimated cost of LLM calls", "cost"),
+    ]
+
+    def __init__(self, path: str):
+        """
+        Accumulates traces into counters per component, rewritten to a Prometheus text file after each
+        export (e.g. for the node exporter's textfile collector)
+
+        Params:
+            path: path to the metrics file
+        """
+        self.path = path
+        self._totals = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace) -> None:
+        with self._lock:
+            for component, values in trace.summary().items():
+                for key, value in values.items():
+                    self._totals[component][key] += value
+            self._write()
+
+    def _write(self) -> None:
+        lines = []
+        for name, description, key in self.METRICS:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            for component, values in sorted(self._totals.items()):
+                lines.append(f'{name}{{component="{component}"}} {values.get(key, 0.0)}')
+
+        # Write to a temporary file first so that the file is never read half written
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(f.name, self.path)
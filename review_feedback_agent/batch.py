@@ -0,0 +1,406 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Set
+from review_feedback_agent.agents import FeedbackAgent, PaperSession
+from review_feedback_agent.agents.checkpoint import SQLiteCheckpointStore
+from review_feedback_agent.apis import LLM, Scheduler
+from review_feedback_agent.apis.tracing import JSONLExporter, PrometheusExporter, Trace
+from review_feedback_agent.reliability.run_reliability_tests import run_reliability_tests
+from review_feedback_agent.utils.feedback_parsing import FeedbackItem
+from review_feedback_agent.utils.openreview_index import ReviewIndex
+from review_feedback_agent.utils.paper_store import set_default_paper_store
+from review_feedback_agent.utils.utils import (
+    logger,
+    get_openreview_paper,
+    parse_uploaded_paper,
+)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: Optional[float] = None):
+        """
+        Spaces out the start of requests so that at most `requests_per_minute` start per minute
+
+        Params:
+            requests_per_minute: maximum number of requests started per minute, unlimited if None
+        """
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def entry_key(entry: Dict[str, Any]) -> str:
+    """
+    Unique key of a manifest entry, used to resume a batch from its output file
+
+    Params:
+        entry: manifest entry with either paper_id/reviewer_id or pdf_path/review_text
+
+    Returns:
+        key: the entry's "id" if given, otherwise derived from its paper and review
+    """
+    if "id" in entry:
+        return str(entry["id"])
+    if "paper_id" in entry:
+        return f"{entry['paper_id']}:{entry['reviewer_id']}"
+    review_hash = hashlib.sha256(entry["review_text"].encode("utf-8")).hexdigest()[:16]
+    return f"{entry['pdf_path']}:{review_hash}"
+
+
+def load_manifest(manifest_path: str) -> List[Dict[str, Any]]:
+    """
+    Load a JSONL manifest, one entry per line with either `paper_id` and `reviewer_id`
+    (OpenReview) or `pdf_path` and `review_text` (local), and an optional `id`
+
+    Params:
+        manifest_path: path to the manifest
+
+    Returns:
+        entries: list of manifest entries
+    """
+    entries = []
+    with open(manifest_path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if not ({"paper_id", "reviewer_id"} <= entry.keys() or {"pdf_path", "review_text"} <= entry.keys()):
+                raise ValueError(
+                    f"Manifest line {line_number} needs either paper_id and reviewer_id or pdf_path and review_text"
+                )
+            entries.append(entry)
+    return entries
+
+
+def truncate_partial_line(output_path: str) -> None:
+    """
+    Truncate the output file after its last complete line, dropping a line partially written by a crashed run
+    so that the records appended when resuming start on a line of their own
+
+    Params:
+        output_path: path to the output JSONL file
+    """
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, "rb+") as f:
+        end = position = f.seek(0, os.SEEK_END)
+        # Search backwards for the last newline, a chunk at a time
+        while position > 0:
+            start = max(0, position - 2**16)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            logger.warning(f"Dropping the partially written last line of {output_path}")
+            f.truncate(position)
+
+
+def load_completed(output_path: str) -> Set[str]:
+    """
+    Keys of entries that already completed successfully in a previous run
+
+    Params:
+        output_path: path to the output JSONL file
+
+    Returns:
+        keys: set of completed entry keys
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partially written line from a crashed run
+            if record.get("status") == "ok":
+                completed.add(record["key"])
+    return completed
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        agent: FeedbackAgent,
+        max_concurrency: int = 16,
+        max_papers_in_flight: int = 8,
+        fetch_workers: int = 4,
+        requests_per_minute: Optional[float] = None,
+        run_tests: bool = True,
+        venue_id: Optional[str] = None,
+        combined_verification: bool = False,
+        verifier_llm: Optional[LLM] = None,
+        verifier_llms: Optional[Dict[str, LLM]] = None,
+    ):
+        """
+        Runs the feedback agent over a manifest of (paper, review) pairs, streaming results to a JSONL file
+
+        Reviews are grouped by paper so that each paper is fetched and parsed once. Papers are processed
+        concurrently, so fetching and parsing of one paper overlaps with generation and verification of others.
+
+        Params:
+            agent: agent used to generate feedback
+            max_concurrency: maximum number of reviews being generated or verified at once
+            max_papers_in_flight: maximum number of papers whose text is held in memory at once
+            fetch_workers: maximum number of papers being downloaded and parsed at once
+            requests_per_minute: maximum number of reviews started per minute, unlimited if None
+            run_tests: whether to run the reliability tests on the generated feedback
+            venue_id: OpenReview venue of the manifest's reviews. If given, all of the venue's reviews are
+                indexed in a few paged requests, otherwise each paper of the manifest is fetched once
+            combined_verification: whether to run all reliability tests in a single verifier call
+            verifier_llm: LLM used by the reliability tests, defaults to the agent's verifier_llm, or its llm_api
+            verifier_llms: LLM used by each reliability test by name instead of verifier_llm
+        """
+        self.agent = agent
+        self.max_concurrency = max_concurrency
+        self.max_papers_in_flight = max_papers_in_flight
+        self.fetch_workers = fetch_workers
+        self.requests_per_minute = requests_per_minute
+        self.run_tests = run_tests
+        self.venue_id = venue_id
+        self.combined_verification = combined_verification
+        self.verifier_llm = verifier_llm or agent.verifier_llm or agent.llm_api
+        self.verifier_llms = verifier_llms
+
+    async def run(self, manifest_path: str, output_path: str) -> Dict[str, int]:
+        """
+        Process every entry of the manifest not already completed in the output file
+
+        Params:
+            manifest_path: path to the JSONL manifest
+            output_path: path to the JSONL output, appended to
+
+        Returns:
+            dict: number of entries that succeeded, failed and were skipped as already completed
+        """
+        entries = load_manifest(manifest_path)
+        completed = load_completed(output_path)
+        pending = [entry for entry in entries if entry_key(entry) not in completed]
+        logger.info(f"{len(entries) - len(pending)} of {len(entries)} entries already completed, skipping them")
+
+        papers = OrderedDict()
+        for entry in pending:
+            paper = entry["paper_id"] if "paper_id" in entry else entry["pdf_path"]
+            papers.setdefault(paper, []).append(entry)
+
+        self._paper_slots = asyncio.Semaphore(self.max_papers_in_flight)
+        self._fetch_slots = asyncio.Semaphore(self.fetch_workers)
+        self._review_slots = asyncio.Semaphore(self.max_concurrency)
+        self._rate_limiter = RateLimiter(self.requests_per_minute)
+        self._counts = {"ok": 0, "error": 0, "skipped": len(entries) - len(pending)}
+
+        # Resolve all OpenReview reviews up front with bulk requests
+        paper_ids = [entry["paper_id"] for entry in pending if "paper_id" in entry]
+        if not paper_ids:
+            self._review_index = ReviewIndex()
+        elif self.venue_id:
+            self._review_index = await asyncio.to_thread(ReviewIndex.from_venue, self.venue_id)
+        else:
+            self._review_index = await asyncio.to_thread(
+                ReviewIndex.from_paper_ids, paper_ids, self.fetch_workers, True
+            )
+
+        truncate_partial_line(output_path)
+        with open(output_path, "a") as self._output:
+            await asyncio.gather(*(self._process_paper(paper, group) for paper, group in papers.items()))
+        return self._counts
+
+    async def _process_paper(self, paper: str, entries: List[Dict[str, Any]]) -> None:
+        async with self._paper_slots:
+            try:
+                async with self._fetch_slots:
+                    if "paper_id" in entries[0]:
+                        pdf_text = await asyncio.to_thread(get_openreview_paper, paper)
+                    else:
+                        pdf_text = await asyncio.to_thread(parse_uploaded_paper, paper)
+            except Exception as e:
+                logger.error(f"Failed to load paper {paper}: {str(e)}")
+                for entry in entries:
+                    self._write(entry, {"status": "error", "error": f"Failed to load paper: {str(e)}"})
+                return
+
+            # Reviews of the paper run through one session, so that the paper prefix cached by the first is reused by the others
+            session = self.agent.session(pdf_text, asynchronous=True)
+            await asyncio.gather(*(self._process_review(entry, session) for entry in entries))
+
+    async def _process_review(self, entry: Dict[str, Any], session: PaperSession) -> None:
+        try:
+            if "review_text" in entry:
+                review_text = entry["review_text"]
+            else:
+                review_text = self._review_index.get_review_text(entry["paper_id"], entry["reviewer_id"])
+
+            async with self._review_slots:
+                await self._rate_limiter.acquire()
+                feedback_dict = await session.acall(review_text)
+
+                record = {"status": "ok", "feedback": feedback_dict}
+                if "reliability" in feedback_dict:
+                    # Already tested by an agent repairing failing feedback
+                    record["reliability"] = feedback_dict["reliability"]
+                elif self.run_tests and feedback_dict["formatted feedback"]:
+                    passed, failed_tests = await asyncio.to_thread(
+                        run_reliability_tests,
+                        feedback_dict["formatted feedback"],
+                        review_text,
+                        combined=self.combined_verification,
+                        verifier_llm=self.verifier_llm,
+                        verifier_llms=self.verifier_llms,
+                    )
+                    record["reliability"] = {"passed": passed, "failed tests": failed_tests}
+        except Exception as e:
+            logger.error(f"Failed to process {entry_key(entry)}: {str(e)}")
+            record = {"status": "error", "error": str(e)}
+
+        self._write(entry, record)
+
+    def _write(self, entry: Dict[str, Any], record: Dict[str, Any]) -> None:
+        # All writes happen on the event loop thread, so lines are never interleaved
+        self._counts[record["status"]] += 1
+        record = {"key": entry_key(entry), "entry": entry, **record}
+        self._output.write(json.dumps(record, default=_to_json) + "\n")
+        self._output.flush()
+
+
+def _to_json(value: Any) -> Any:
+    # Feedback items are written in their compact list form
+    if isinstance(value, FeedbackItem):
+        return value.to_list()
+    if isinstance(value, Trace):
+        return value.to_dict()
+    return str(value)
+
+
+def run_batch(manifest_path: str, output_path: str, agent: FeedbackAgent, **kwargs) -> Dict[str, int]:
+    """
+    Synchronous entry point for BatchRunner, see BatchRunner for the keyword arguments
+
+    Params:
+        manifest_path: path to the JSONL manifest
+        output_path: path to the JSONL output, appended to
+
+    Returns:
+        dict: number of entries that succeeded, failed and were skipped as already completed
+    """
+    return asyncio.run(BatchRunner(agent, **kwargs).run(manifest_path, output_path))
+
+
+def parse_model_assignments(assignments: List[str]) -> Dict[str, str]:
+    """
+    Parse command line assignments of models, e.g. ["Formatter=haiku-3.5"] into {"Formatter": "haiku-3.5"}
+    """
+    models = {}
+    for assignment in assignments:
+        name, separator, model = assignment.partition("=")
+        if not separator or not name or not model:
+            raise ValueError(f"Expected NAME=MODEL, got {assignment}")
+        models[name] = model
+    return models
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate review feedback for a manifest of (paper, review) pairs")
+    parser.add_argument("manifest", help="JSONL manifest of paper_id/reviewer_id or pdf_path/review_text entries")
+    parser.add_argument("output", help="JSONL output file, completed entries are skipped when resuming")
+    parser.add_argument("--model", default="sonnet-3.5")
+    parser.add_argument("--architecture", default="Actor(2)->Aggregator->FeedbackCritic->Formatter")
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--max-papers-in-flight", type=int, default=8)
+    parser.add_argument("--fetch-workers", type=int, default=4)
+    parser.add_argument("--requests-per-minute", type=float, default=None, help="Maximum number of reviews started per minute")
+    parser.add_argument("--llm-requests-per-minute", type=float, default=None, help="Maximum number of LLM requests per minute")
+    parser.add_argument("--llm-tokens-per-minute", type=float, default=None, help="Maximum number of LLM tokens per minute")
+    parser.add_argument("--max-retries", type=int, default=5, help="Maximum number of retries of a failed LLM request")
+    parser.add_argument("--call-timeout", type=float, default=None, help="Deadline in seconds of each LLM call, including retries")
+    parser.add_argument("--component-models", nargs="+", default=[], metavar="COMPONENT=MODEL", help="Model of a component, e.g. Formatter=haiku-3.5")
+    parser.add_argument("--cascade-models", nargs="+", default=[], metavar="COMPONENT=MODEL", help="Cheaper model a component runs on first, escalating to --model if its output fails validation")
+    parser.add_argument("--verifier-model", default=None, help="Model of the reliability tests' verifier, defaults to --model")
+    parser.add_argument("--verifier-models", nargs="+", default=[], metavar="TEST=MODEL", help="Model of a reliability test's verifier, e.g. restate_reviewer=haiku-3.5")
+    parser.add_argument("--repair-attempts", type=int, default=0, help="Rerun the stages able to fix feedback failing the reliability tests up to this many times")
+    parser.add_argument("--shard-size", type=int, default=None, help="Split reviews into shards of at most this many comments run concurrently")
+    parser.add_argument("--skip-tests", action="store_true", help="Do not run the reliability tests")
+    parser.add_argument("--combined-verification", action="store_true", help="Run all reliability tests in one verifier call")
+    parser.add_argument("--venue-id", default=None, help="OpenReview venue to index all reviews from at once")
+    parser.add_argument("--no-paper-store", action="store_true", help="Download and parse every paper instead of reading the paper store")
+    parser.add_argument("--checkpoint-db", default=None, help="SQLite file of per-stage checkpoints, so failed reviews resume mid-pipeline")
+    parser.add_argument("--trace", action="store_true", help="Record per-step timings, tokens and cost in the output")
+    parser.add_argument("--trace-file", default=None, help="JSONL file to append the trace of each review to")
+    parser.add_argument("--metrics-file", default=None, help="Prometheus text file of per-component counters")
+    args = parser.parse_args()
+
+    if args.no_paper_store:
+        set_default_paper_store(None)
+    trace_exporters = []
+    if args.trace_file:
+        trace_exporters.append(JSONLExporter(args.trace_file))
+    if args.metrics_file:
+        trace_exporters.append(PrometheusExporter(args.metrics_file))
+    # Generation and verification share the provider's limits, and leave part of them to interactive use
+    scheduler = Scheduler(
+        requests_per_minute=args.llm_requests_per_minute,
+        tokens_per_minute=args.llm_tokens_per_minute,
+        max_retries=args.max_retries,
+        timeout=args.call_timeout,
+    )
+    component_models = parse_model_assignments(args.component_models)
+    cascade_models = parse_model_assignments(args.cascade_models)
+    verifier_models = parse_model_assignments(args.verifier_models)
+    verifier_model = args.verifier_model or args.model
+    llms = {
+        model: LLM(model, scheduler=scheduler, priority="batch")
+        for model in {args.model, verifier_model, *component_models.values(), *cascade_models.values(), *verifier_models.values()}
+    }
+    verifier_llm = llms[verifier_model]
+    verifier_llms = {test: llms[model] for test, model in verifier_models.items()}
+    agent = FeedbackAgent(
+        llms[args.model],
+        architecture=args.architecture,
+        tracing=args.trace,
+        trace_exporters=trace_exporters,
+        checkpoint_store=SQLiteCheckpointStore(args.checkpoint_db) if args.checkpoint_db else None,
+        llms=llms,
+        models=component_models,
+        cascade_models=cascade_models,
+        repair_attempts=0 if args.skip_tests else args.repair_attempts,
+        verifier_llm=verifier_llm,
+        verifier_llms=verifier_llms,
+        shard_size=args.shard_size,
+    )
+    counts = run_batch(
+        args.manifest,
+        args.output,
+        agent,
+        max_concurrency=args.max_concurrency,
+        max_papers_in_flight=args.max_papers_in_flight,
+        fetch_workers=args.fetch_workers,
+        requests_per_minute=args.requests_per_minute,
+        run_tests=not args.skip_tests,
+        venue_id=args.venue_id,
+        combined_verification=args.combined_verification,
+        verifier_llm=verifier_llm,
+        verifier_llms=verifier_llms,
+    )
+    logger.info(f"Batch finished: {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+from .reliability_tests import ReliabilityRegistry, ReliabilityTester
+from .rule_checks import RULE_CHECKS, run_rule_checks
+from .run_reliability_tests import run_reliability_tests
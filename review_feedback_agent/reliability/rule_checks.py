@@ -0,0 +1,147 @@
+import re
+from difflib import SequenceMatcher
+from typing import Callable, Dict, List, Optional
+from review_feedback_agent.utils.feedback_parsing import NO_FEEDBACK_MESSAGE, FeedbackItem, parse_feedback
+
+# Deterministic checks run before the LLM verifiers. Each check returns True if the feedback passes
+# the reliability test of the same name, False if it fails, and None if the rules cannot decide and
+# the test needs to be escalated to the LLM verifier.
+
+# Share of a reviewer comment that must be found in the review for it to count as (near-)verbatim,
+# and below which it is certainly not from the review
+QUOTE_MATCH_THRESHOLD = 0.9
+QUOTE_MISMATCH_THRESHOLD = 0.4
+
+# Phrases showing that feedback is written to the authors, or to the reviewer
+AUTHOR_DIRECTED = re.compile(
+    r"\breaders?\b|\b(?:your|in your) (?:paper|method|approach|model|results?|experiments?|work|framework|algorithm|analysis|contributions?|submission|manuscript)\b",
+    re.IGNORECASE,
+)
+REVIEWER_DIRECTED = re.compile(
+    r"\bthe authors\b|\byour (?:comment|review|question|concern|point|critique|suggestion|request)s?\b",
+    re.IGNORECASE,
+)
+# Number of author-directed phrases from which feedback certainly addresses the authors. A single phrase can be
+# an incidental wording, so the LLM verifier decides.
+AUTHOR_DIRECTED_MIN_MATCHES = 2
+
+# Quoted text, e.g. the review or paper quoted in the feedback, whose wording is not the feedback's own. Single
+# quotes only delimit a quote at word boundaries, so that apostrophes (e.g. "the authors' method") are kept.
+QUOTED_SPAN = re.compile(r"\"[^\"]*\"|“[^”]*”|(?<!\w)‘[^’]*’(?!\w)|(?<!\w)'[^']*'(?!\w)")
+
+# Share of a feedback's word trigrams also found in its comment above which the feedback restates
+# the comment, and below which it clearly adds its own content
+RESTATE_THRESHOLD = 0.6
+NO_RESTATE_THRESHOLD = 0.1
+
+
+def _normalize(text: str) -> str:
+    text = text.lower()
+    text = re.sub(r"[“”‘’\"`]", "'", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _quote_coverage(quote: str, text: str) -> float:
+    """
+    Share of the characters of `quote` matched in order within the region of `text` that best matches it
+    """
+    if quote in text:
+        return 1.0
+    matcher = SequenceMatcher(None, quote, text, autojunk=False)
+    match = matcher.find_longest_match(0, len(quote), 0, len(text))
+    start = max(0, match.b - match.a - 20)
+    window = text[start:match.b - match.a + len(quote) + 20]
+    matched = sum(block.size for block in SequenceMatcher(None, quote, window, autojunk=False).get_matching_blocks())
+    return matched / len(quote)
+
+
+def check_comments_in_review(items: List[FeedbackItem], review_text: str) -> Optional[bool]:
+    review = _normalize(review_text)
+    undecided = False
+    for item in items:
+        if item.span is not None:
+            continue
+        # Comments may elide parts of the review with ellipses, each part has to be in the review
+        for segment in re.split(r"\.\.\.|…", _normalize(item.comment)):
+            segment = segment.strip(" '.,;:")
+            if len(segment) < 3:
+                continue
+            coverage = _quote_coverage(segment, review)
+            if coverage < QUOTE_MISMATCH_THRESHOLD:
+                return False
+            if coverage < QUOTE_MATCH_THRESHOLD:
+                undecided = True
+    return None if undecided else True
+
+
+def _unquoted(text: str) -> str:
+    return QUOTED_SPAN.sub(" ", text)
+
+
+def check_addressed_to_author(items: List[FeedbackItem]) -> Optional[bool]:
+    feedbacks = [_unquoted(item.feedback) for item in items]
+    author_matches = sum(len(AUTHOR_DIRECTED.findall(feedback)) for feedback in feedbacks)
+    if author_matches >= AUTHOR_DIRECTED_MIN_MATCHES:
+        return False
+    if not author_matches and all(REVIEWER_DIRECTED.search(feedback) for feedback in feedbacks):
+        return True
+    return None
+
+
+def _trigrams(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def check_restate_reviewer(items: List[FeedbackItem]) -> Optional[bool]:
+    overlaps = []
+    for item in items:
+        feedback_trigrams = _trigrams(item.feedback)
+        if not feedback_trigrams:
+            return None
+        overlaps.append(len(feedback_trigrams & _trigrams(item.comment)) / len(feedback_trigrams))
+    if any(overlap >= RESTATE_THRESHOLD for overlap in overlaps):
+        return False
+    if all(overlap <= NO_RESTATE_THRESHOLD for overlap in overlaps):
+        return True
+    return None
+
+
+RULE_CHECKS: Dict[str, Callable[[List[FeedbackItem], str], Optional[bool]]] = {
+    "comments_in_review": check_comments_in_review,
+    "addressed_to_author": lambda items, review_text: check_addressed_to_author(items),
+    "restate_reviewer": lambda items, review_text: check_restate_reviewer(items),
+}
+
+
+def run_rule_checks(
+    feedback: str, review_text: str, tests: List[str], items: Optional[List[FeedbackItem]] = None
+) -> Dict[str, bool]:
+    """
+    Resolves the reliability tests that can be decided deterministically from the formatted feedback
+
+    Params:
+        feedback: generated feedback, as formatted by the Formatter
+        review_text: review content
+        tests: names of the tests to resolve
+        items: feedback already parsed with parse_feedback(feedback, review_text), parsed here if not given
+
+    Returns:
+        dict: whether the feedback passes each test the rules could decide. Tests missing from the result
+            need to be run by the LLM verifier.
+    """
+    if items is None:
+        items = parse_feedback(feedback, review_text)
+    if not items:
+        # Nothing to verify if the Formatter found no feedback to give, otherwise the output is not parseable
+        if feedback.strip() == NO_FEEDBACK_MESSAGE:
+            return {test: True for test in tests}
+        return {}
+
+    verdicts = {}
+    for test in tests:
+        if test in RULE_CHECKS:
+            verdict = RULE_CHECKS[test](items, review_text)
+            if verdict is not None:
+                verdicts[test] = verdict
+    return verdicts
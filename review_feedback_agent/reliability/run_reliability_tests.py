@@ -0,0 +1,107 @@
+from review_feedback_agent.apis import LLM
+from review_feedback_agent.reliability.reliability_tests import ReliabilityTester, ReliabilityRegistry
+from review_feedback_agent.reliability.rule_checks import run_rule_checks
+from review_feedback_agent.utils.utils import logger
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextvars
+from typing import Dict, Tuple, List, Optional
+
+def run_reliability_tests(
+    feedback: str,
+    review_text: str,
+    tests: Optional[List[str]] = None,
+    max_workers: int = 4,
+    fail_fast: bool = False,
+    verifier_llm: Optional[LLM] = None,
+    combined: bool = False,
+    precheck: bool = False,
+    verifier_llms: Optional[Dict[str, LLM]] = None,
+) -> Tuple[bool, List[str]]:
+    """
+    Runs all reliability tests on feedback, returns boolean representing if all tests passed or not and a list of names that failed
+
+    The tests are run concurrently. With fail_fast, the first failing test ends the run and verifiers that have not
+    started yet are cancelled, so the list of failed tests may be incomplete.
+
+    Params:
+        feedback: generated feedback
+        review_text: review content
+        tests: names of the tests to run, defaults to all registered tests
+        max_workers: number of tests run concurrently
+        fail_fast: whether to stop at the first failing test
+        verifier_llm: LLM used to verify the feedback, defaults to LLM("sonnet-3.5")
+        combined: whether to verify all tests in a single call, falling back to separate calls
+            for the tests whose verdict cannot be parsed from the response
+        precheck: whether to first resolve the tests that can be decided deterministically (e.g. verbatim
+            comment matching), only sending the remaining tests to the LLM verifier
+        verifier_llms: LLM used by each test by name instead of verifier_llm, e.g. a smaller model for
+            "restate_reviewer" and "praise_feedback"
+
+    Returns:
+        bool: True if test passed, False otherwise
+        List[str]: list of reliability test names we fail on, empty list if all tests passed
+    """
+
+    reliability_tests = tests or list(ReliabilityRegistry.properties)
+    remaining_tests = reliability_tests
+    failed_tests = []
+
+    if precheck:
+        verdicts = run_rule_checks(feedback, review_text, reliability_tests)
+        logger.info(f"Resolved {len(verdicts)} of {len(reliability_tests)} reliability tests with rule checks")
+        failed_tests = [test for test, passed in verdicts.items() if not passed]
+        remaining_tests = [test for test in reliability_tests if test not in verdicts]
+        if fail_fast and failed_tests:
+            remaining_tests = []
+
+    if not remaining_tests:
+        failed_tests.sort(key=reliability_tests.index)
+        return (len(failed_tests) == 0, failed_tests)
+
+    reliability_tester = ReliabilityTester(verifier_llm, verifier_llms)
+
+    if combined:
+        verdicts = reliability_tester.test_reliability_combined(remaining_tests, feedback, review_text)
+        failed_tests += [test for test, passed in verdicts.items() if not passed]
+        remaining_tests = [test for test in remaining_tests if test not in verdicts]
+        if fail_fast and failed_tests:
+            remaining_tests = []
+
+    if remaining_tests:
+        failed_tests += _run_tests_separately(
+            reliability_tester, remaining_tests, feedback, review_text, max_workers, fail_fast
+        )
+
+    failed_tests.sort(key=reliability_tests.index)
+    return (len(failed_tests) == 0, failed_tests)
+
+
+def _run_tests_separately(
+    reliability_tester: ReliabilityTester,
+    tests: List[str],
+    feedback: str,
+    review_text: str,
+    max_workers: int,
+    fail_fast: bool,
+) -> List[str]:
+    failed_tests = []
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # Verifiers run in a copy of the caller's context, so that an active trace records their calls
+    futures = {
+        executor.submit(
+            contextvars.copy_context().run, reliability_tester.test_reliability, test, feedback, review_text
+        ): test
+        for test in tests
+    }
+    try:
+        for future in as_completed(futures):
+            if not future.result():
+                failed_tests.append(futures[future])
+                if fail_fast:
+                    break
+    finally:
+        # Verifiers already running cannot be interrupted, only those not started yet are cancelled
+        executor.shutdown(wait=not fail_fast, cancel_futures=True)
+
+    return failed_tests
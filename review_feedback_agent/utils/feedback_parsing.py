@@ -0,0 +1,230 @@
+import json
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Markers of the comment-feedback pairs produced by the Formatter, e.g. "- **Reviewer comment:** ...",
+# also accepting "**Reviewer Comment**:" and "Feedback to the reviewer" in any case
+COMMENT_MARKER = re.compile(r"\*\*\s*Reviewer comment\s*(?::\s*\*\*|\*\*\s*:)", re.IGNORECASE)
+FEEDBACK_MARKER = re.compile(r"\*\*\s*Feedback to the reviewer\s*(?::\s*\*\*|\*\*\s*:)", re.IGNORECASE)
+# Characters of COMMENT_MARKER other than whitespace
+_MARKER_CHARACTERS = frozenset("*:" + "reviewercomment" + "REVIEWERCOMMENT")
+
+# Formatter output when it has no feedback to give
+NO_FEEDBACK_MESSAGE = "Thanks for your hard work!"
+
+# Version of the compact serialization, bumped if its layout changes
+SERIALIZATION_VERSION = 1
+
+
+class FeedbackItem:
+    __slots__ = ("comment", "feedback", "span", "stage")
+
+    def __init__(self, comment: str, feedback: str, span: Optional[Tuple[int, int]] = None, stage: str = "Formatter"):
+        """
+        A reviewer comment and the feedback given to it
+
+        Params:
+            comment: reviewer comment, as quoted in the feedback
+            feedback: feedback to the reviewer about the comment
+            span: (start, end) character offsets of the comment in the review, None if it was not found
+            stage: name of the pipeline stage that produced the item
+        """
+        self.comment = comment
+        self.feedback = feedback
+        self.span = span
+        self.stage = stage
+
+    def to_list(self) -> list:
+        """
+        Returns:
+            compact representation [comment, feedback, start, end, stage], with start and end None if there is no span
+        """
+        start, end = self.span if self.span is not None else (None, None)
+        return [self.comment, self.feedback, start, end, self.stage]
+
+    @classmethod
+    def from_list(cls, values: list) -> "FeedbackItem":
+        comment, feedback, start, end, stage = values
+        return cls(comment, feedback, (start, end) if start is not None else None, stage)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FeedbackItem) and self.to_list() == other.to_list()
+
+    def __repr__(self) -> str:
+        return f"FeedbackItem(comment={self.comment!r}, feedback={self.feedback!r}, span={self.span!r}, stage={self.stage!r})"
+
+
+def _clean(text: str) -> str:
+    # Drop the list bullet of the next marker and surrounding whitespace
+    return re.sub(r"\s*[-*]\s*$", "", text).strip()
+
+
+def find_comment_span(comment: str, review_text: str) -> Optional[Tuple[int, int]]:
+    """
+    Locate a reviewer comment in the review, ignoring case, whitespace differences, and surrounding quotes and ellipses
+
+    Params:
+        comment: reviewer comment
+        review_text: review content
+
+    Returns:
+        span: (start, end) character offsets of the comment in the review, None if it was not found
+    """
+    words = comment.strip("\"'“”‘’.… \n\t").split()
+    if not words:
+        return None
+    match = re.search(r"\s+".join(map(re.escape, words)), review_text, re.IGNORECASE)
+    return match.span() if match else None
+
+
+def _make_item(comment: str, feedback: str, review_text: Optional[str], stage: str) -> FeedbackItem:
+    comment, feedback = _clean(comment), _clean(feedback)
+    span = find_comment_span(comment, review_text) if review_text is not None else None
+    return FeedbackItem(comment, feedback, span, stage)
+
+
+def iter_feedback_items(
+    chunks: Iterable[str], review_text: Optional[str] = None, stage: str = "Formatter"
+) -> Iterator[FeedbackItem]:
+    """
+    Incrementally parse formatted feedback arriving in chunks (e.g. streamed tokens) into feedback items.
+    Each item is yielded as soon as the next comment starts, and the last one when the chunks run out.
+
+    Params:
+        chunks: pieces of the formatted feedback, in order
+        review_text: review content, used to locate each comment in the review
+        stage: name of the pipeline stage that produced the feedback
+
+    Returns:
+        iterator over the feedback items, in order
+    """
+    buffer = ""
+    # Span in the buffer of the marker of the comment in progress
+    current = None
+    # Markers starting before this offset have all been found, so each chunk only scans the new tail
+    scan_from = 0
+    for chunk in chunks:
+        buffer += chunk
+        for marker in COMMENT_MARKER.finditer(buffer, scan_from):
+            # Every comment followed by the start of another one is complete
+            if current is not None:
+                yield _item_from_text(buffer[current[1]:marker.start()], review_text, stage)
+            current = marker.span()
+            scan_from = marker.end()
+        # A marker cut by the end of the chunk starts within the trailing characters that can belong to one
+        scan_from = _marker_tail_start(buffer, scan_from)
+        # Drop the complete comments and the text before the first comment
+        start = current[0] if current is not None else scan_from
+        if start:
+            buffer = buffer[start:]
+            scan_from -= start
+            current = (current[0] - start, current[1] - start) if current is not None else None
+
+    if current is not None:
+        yield _item_from_text(buffer[current[1]:], review_text, stage)
+
+
+def _marker_tail_start(buffer: str, floor: int) -> int:
+    # Offset from which an incomplete comment marker can start: the first "*" of the longest suffix of
+    # buffer[floor:] made of characters that can appear in a marker, the end of the buffer if there is none
+    start = len(buffer)
+    while start > floor and (buffer[start - 1] in _MARKER_CHARACTERS or buffer[start - 1].isspace()):
+        start -= 1
+    star = buffer.find("*", start)
+    return star if star != -1 else len(buffer)
+
+
+def _item_from_text(text: str, review_text: Optional[str], stage: str) -> FeedbackItem:
+    # `text` holds one comment, from the end of its marker to the start of the next comment
+    feedback_marker = FEEDBACK_MARKER.search(text)
+    if feedback_marker is None:
+        return _make_item(text, "", review_text, stage)
+    return _make_item(text[:feedback_marker.start()], text[feedback_marker.end():], review_text, stage)
+
+
+def parse_feedback(
+    formatted_feedback: str, review_text: Optional[str] = None, stage: str = "Formatter"
+) -> List[FeedbackItem]:
+    """
+    Parse the Formatter output into feedback items
+
+    Params:
+        formatted_feedback: formatted feedback, a list of "**Reviewer comment:**" and "**Feedback to the reviewer:**" bullets
+        review_text: review content, used to locate each comment in the review
+        stage: name of the pipeline stage that produced the feedback
+
+    Returns:
+        items: list of feedback items, in order. A comment without feedback gets an empty feedback.
+    """
+    return list(iter_feedback_items([formatted_feedback], review_text, stage))
+
+
+def format_feedback_items(items: List[FeedbackItem]) -> str:
+    """
+    Render feedback items in the Formatter's output format
+
+    Params:
+        items: feedback items
+
+    Returns:
+        formatted_feedback: list of comment-feedback bullets, or NO_FEEDBACK_MESSAGE if there are no items
+    """
+    if not items:
+        return NO_FEEDBACK_MESSAGE
+    return "\n\n".join(
+        f"- **Reviewer comment:** {item.comment}\n- **Feedback to the reviewer:** {item.feedback}" for item in items
+    )
+
+
+def items_to_json(items: List[FeedbackItem]) -> str:
+    """
+    Compact JSON serialization of feedback items, one list per item
+
+    Params:
+        items: feedback items
+
+    Returns:
+        JSON string
+    """
+    return json.dumps({"version": SERIALIZATION_VERSION, "items": [item.to_list() for item in items]}, separators=(",", ":"))
+
+
+def items_from_json(serialized: str) -> List[FeedbackItem]:
+    """
+    Params:
+        serialized: JSON string produced by items_to_json
+
+    Returns:
+        items: feedback items
+    """
+    data = json.loads(serialized)
+    if data["version"] != SERIALIZATION_VERSION:
+        raise ValueError(f"Unsupported feedback item serialization version: {data['version']}")
+    return [FeedbackItem.from_list(values) for values in data["items"]]
+
+
+def items_to_arrow(items: List[FeedbackItem]):
+    """
+    Columnar serialization of feedback items, requires pyarrow
+
+    Params:
+        items: feedback items
+
+    Returns:
+        pyarrow.Table with columns comment, feedback, span_start, span_end and stage
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("pyarrow is required to convert feedback items to Arrow, install it with `pip install pyarrow`")
+
+    columns = list(zip(*(item.to_list() for item in items))) or [[]] * 5
+    return pa.table(
+        {
+            "comment": pa.array(columns[0], type=pa.string()),
+            "feedback": pa.array(columns[1], type=pa.string()),
+            "span_start": pa.array(columns[2], type=pa.int64()),
+            "span_end": pa.array(columns[3], type=pa.int64()),
+            "stage": pa.array(columns[4], type=pa.string()).dictionary_encode(),
+        }
+    )
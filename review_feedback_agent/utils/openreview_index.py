@@ -0,0 +1,167 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+import openreview
+import requests
+from review_feedback_agent.utils.utils import (
+    logger,
+    format_review_content,
+    get_openreview_client,
+    PaperNotFoundError,
+    ReviewNotFoundError,
+)
+
+
+def _reviewer_id(reply: Dict[str, Any]) -> str:
+    # Reviews are signed e.g. "ICLR.cc/2024/Conference/Submission42/Reviewer_gNxe"
+    return reply["signatures"][0].split("_")[-1]
+
+
+def _is_review(reply: Dict[str, Any]) -> bool:
+    return any(invitation.endswith("Official_Review") for invitation in reply.get("invitations", []))
+
+
+def _get_notes_by_ids(openreview_client: openreview.api.OpenReviewClient, note_ids: List[str], details: Optional[str] = None) -> List[openreview.api.Note]:
+    """
+    Fetch several notes in one request. The client's get_notes only filters by a single id, while the /notes
+    endpoint also takes a comma-separated list of ids.
+
+    Params:
+        openreview_client: OpenReview API client
+        note_ids: IDs of the notes
+        details: details to include with each note, e.g. "replies"
+
+    Returns:
+        notes: the notes found, notes that do not exist are left out
+    """
+    params = {"ids": ",".join(note_ids), "limit": len(note_ids)}
+    if details is not None:
+        params["details"] = details
+    response = openreview_client.session.get(openreview_client.notes_url, params=params, headers=openreview_client.headers)
+    response.raise_for_status()
+    # Only keep the requested notes, in case the ids filter is not applied
+    requested = set(note_ids)
+    return [note for note in map(openreview.api.Note.from_json, response.json()["notes"]) if note.id in requested]
+
+
+class ReviewIndex:
+    def __init__(self):
+        """
+        In-memory index of OpenReview submissions and their reviews, built from a few bulk requests
+
+        Reviews are indexed by (paper_id, reviewer_id), where reviewer_id is the suffix of the
+        review's signature (e.g. gNxe), as accepted by get_review_id.
+        """
+        self.reviews: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def add_submission(self, note: openreview.api.Note) -> None:
+        """
+        Index the reviews among the replies of a submission fetched with details="replies"
+
+        Params:
+            note: submission note
+        """
+        for reply in note.details.get("replies", []):
+            if _is_review(reply):
+                self.reviews[(note.id, _reviewer_id(reply))] = reply
+
+    @classmethod
+    def from_venue(cls, venue_id: str, submission_name: str = "Submission", baseurl: Optional[str] = None) -> "ReviewIndex":
+        """
+        Index all reviews of a venue, fetching its submissions with their replies in paged requests
+
+        Params:
+            venue_id: OpenReview venue ID, e.g. ICLR.cc/2024/Conference
+            submission_name: name of the venue's submission invitation
+            baseurl: base URL of the OpenReview API, defaults to OPENREVIEW_BASEURL
+
+        Returns:
+            index: the review index
+        """
+        openreview_client = get_openreview_client(baseurl)
+        index = cls()
+        for note in openreview_client.get_all_notes(
+            invitation=f"{venue_id}/-/{submission_name}", details="replies"
+        ):
+            index.add_submission(note)
+        logger.info(f"Indexed {len(index.reviews)} reviews from venue {venue_id}")
+        return index
+
+    @classmethod
+    def from_paper_ids(
+        cls,
+        paper_ids: Iterable[str],
+        max_workers: int = 8,
+        skip_missing: bool = False,
+        baseurl: Optional[str] = None,
+        batch_size: int = 50,
+    ) -> "ReviewIndex":
+        """
+        Index the reviews of the given papers, fetching them with all of their replies in requests of up to
+        batch_size papers each
+
+        Params:
+            paper_ids: OpenReview paper IDs
+            max_workers: number of requests run concurrently
+            skip_missing: whether to skip papers that cannot be fetched instead of raising PaperNotFoundError
+            baseurl: base URL of the OpenReview API, defaults to OPENREVIEW_BASEURL
+            batch_size: maximum number of papers per request
+
+        Returns:
+            index: the review index
+        """
+        paper_ids = list(dict.fromkeys(paper_ids))
+        batches = [paper_ids[i:i + batch_size] for i in range(0, len(paper_ids), batch_size)]
+
+        def fetch(batch: List[str]) -> List[openreview.api.Note]:
+            try:
+                return _get_notes_by_ids(get_openreview_client(baseurl), batch, details="replies")
+            except (openreview.OpenReviewException, requests.RequestException) as e:
+                logger.error(f"Error getting notes of {len(batch)} papers: {e}")
+                if skip_missing:
+                    return []
+                raise PaperNotFoundError(f"Error getting notes from paper_ids: {', '.join(batch)}")
+
+        index = cls()
+        found = set()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for notes in executor.map(fetch, batches):
+                for note in notes:
+                    found.add(note.id)
+                    index.add_submission(note)
+        for paper_id in paper_ids:
+            if paper_id not in found:
+                logger.error(f"Error getting note from paper_id: {paper_id}")
+                if not skip_missing:
+                    raise PaperNotFoundError(f"Error getting note from paper_id: {paper_id}")
+        logger.info(f"Indexed {len(index.reviews)} reviews of {len(found)} papers in {len(batches)} requests")
+        return index
+
+    def get_review(self, paper_id: str, reviewer_id: str) -> Dict[str, Any]:
+        """
+        Params:
+            paper_id: str representing paper ID
+            reviewer_id: str representing reviewer ID
+
+        Returns:
+            review: the review note
+
+        Raises:
+            ReviewNotFoundError: If the paper has no review by this reviewer in the index
+        """
+        try:
+            return self.reviews[(paper_id, reviewer_id)]
+        except KeyError:
+            raise ReviewNotFoundError(f"No review by reviewer {reviewer_id} for paper {paper_id}")
+
+    def get_review_id(self, paper_id: str, reviewer_id: str) -> str:
+        return self.get_review(paper_id, reviewer_id)["id"]
+
+    def get_review_text(self, paper_id: str, reviewer_id: str) -> str:
+        return format_review_content(self.get_review(paper_id, reviewer_id)["content"])
+
+    def reviewers(self, paper_id: str) -> List[str]:
+        """
+        Returns:
+            list of IDs of the reviewers of a paper in the index
+        """
+        return [reviewer_id for (pid, reviewer_id) in self.reviews if pid == paper_id]
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import zlib
+from typing import Optional, Union
+import diskcache
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "REVIEW_FEEDBACK_AGENT_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "review_feedback_agent"),
+)
+
+
+def hash_file(path: str) -> str:
+    """
+    Content hash of a file
+
+    Params:
+        path: path to the file
+
+    Returns:
+        sha256 hex digest of the file's content
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PaperStore:
+    def __init__(self, directory: str, size_limit: int = 2**30, keep_pdf: bool = False, id_ttl: Optional[float] = 24 * 3600):
+        """
+        On-disk store of parsed papers, keyed by PDF content hash and optionally by OpenReview paper ID
+
+        Texts (and PDFs if kept) are stored zlib-compressed, and the least recently used entries are
+        evicted once the store grows beyond `size_limit`. The store is safe to share between threads
+        and processes.
+
+        Params:
+            directory: directory of the store
+            size_limit: maximum size of the store in bytes
+            keep_pdf: whether to also keep the raw PDFs
+            id_ttl: number of seconds after which a paper ID no longer maps to the text stored for it, so that
+                a revised PDF uploaded under the same ID is downloaded again, never if None. Texts looked up by
+                content hash do not expire, as the hash changes with the PDF.
+        """
+        self.keep_pdf = keep_pdf
+        self.id_ttl = id_ttl
+        self.cache = diskcache.Cache(
+            directory,
+            size_limit=size_limit,
+            eviction_policy="least-recently-used",
+        )
+
+    def get(self, paper_id: Optional[str] = None, content_hash: Optional[str] = None) -> Optional[str]:
+        """
+        Look up the text of a paper by OpenReview paper ID or PDF content hash
+
+        Params:
+            paper_id: OpenReview paper ID
+            content_hash: sha256 hex digest of the PDF
+
+        Returns:
+            text of the paper, or None if it is not in the store
+        """
+        if content_hash is None and paper_id is not None:
+            content_hash = self.cache.get(f"id:{paper_id}")
+        if content_hash is None:
+            return None
+        compressed = self.cache.get(f"text:{content_hash}")
+        return zlib.decompress(compressed).decode("utf-8") if compressed is not None else None
+
+    def get_pdf(self, content_hash: str) -> Optional[bytes]:
+        """
+        Returns:
+            raw PDF with the given content hash, or None if it is not in the store
+        """
+        compressed = self.cache.get(f"pdf:{content_hash}")
+        return zlib.decompress(compressed) if compressed is not None else None
+
+    def put(self, pdf_path: str, text: str, paper_id: Optional[str] = None) -> str:
+        """
+        Store the parsed text of a PDF
+
+        Params:
+            pdf_path: local path to the PDF the text was parsed from
+            text: parsed text of the PDF
+            paper_id: OpenReview paper ID of the PDF, if any
+
+        Returns:
+            content_hash: sha256 hex digest of the PDF
+        """
+        content_hash = hash_file(pdf_path)
+        self.cache.set(f"text:{content_hash}", zlib.compress(text.encode("utf-8")))
+        if self.keep_pdf:
+            with open(pdf_path, "rb") as f:
+                self.cache.set(f"pdf:{content_hash}", zlib.compress(f.read()))
+        if paper_id is not None:
+            self.cache.set(f"id:{paper_id}", content_hash, expire=self.id_ttl)
+        return content_hash
+
+
+# The default store can be disabled with REVIEW_FEEDBACK_AGENT_PAPER_STORE=0
+_default_paper_store = None
+_default_paper_store_disabled = os.environ.get("REVIEW_FEEDBACK_AGENT_PAPER_STORE", "1").lower() in ("0", "false", "no", "off")
+
+
+def get_default_paper_store() -> Optional[PaperStore]:
+    """
+    Returns:
+        the paper store used when none is passed explicitly, created under DEFAULT_CACHE_DIR on first use,
+        or None if it was disabled with set_default_paper_store(None) or REVIEW_FEEDBACK_AGENT_PAPER_STORE=0
+    """
+    global _default_paper_store
+    if _default_paper_store is None and not _default_paper_store_disabled:
+        _default_paper_store = PaperStore(os.path.join(DEFAULT_CACHE_DIR, "papers"))
+    return _default_paper_store
+
+
+def set_default_paper_store(paper_store: Optional[PaperStore]) -> None:
+    """
+    Replace the default paper store, or disable it by passing None
+
+    Params:
+        paper_store: store to use by default
+    """
+    global _default_paper_store, _default_paper_store_disabled
+    _default_paper_store = paper_store
+    _default_paper_store_disabled = paper_store is None
+
+
+def resolve_paper_store(paper_store: Union[PaperStore, bool, None]) -> Optional[PaperStore]:
+    """
+    Params:
+        paper_store: store to use, False to use none, or None (or True) to use the default store
+
+    Returns:
+        the store to read and write, or None if papers are not stored
+    """
+    if paper_store is None or paper_store is True:
+        return get_default_paper_store()
+    return paper_store or None
@@ -0,0 +1,159 @@
+import math
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Iterable, List, Tuple
+
+# Section headers of reviews formatted by format_review_content, e.g. "**Weaknesses**: ..."
+SECTION_HEADER = re.compile(r"^\*\*([A-Z][\w ]*)\*\*:", re.MULTILINE)
+
+# Review sections whose comments the feedback is about
+COMMENT_SECTIONS = ("Weaknesses", "Questions")
+
+# Start of a list item, e.g. "- ", "1. ", "(2) ", "Q3: " or "W1. "
+LIST_ITEM = re.compile(r"^[ \t]*(?:[-*•]|\(?\d+[.):]|[A-Z]\d+[.):]?)[ \t]+", re.MULTILINE)
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+
+
+@dataclass(frozen=True)
+class ReviewComment:
+    """
+    A comment of a review
+
+    section: name of the review section the comment is in, "" if the review has no section headers
+    text: text of the comment
+    span: (start, end) character offsets of the comment in the review
+    """
+
+    section: str
+    text: str
+    span: Tuple[int, int]
+
+
+def review_sections(review: str) -> List[Tuple[str, int, int]]:
+    """
+    Params:
+        review: review text
+
+    Returns:
+        list: (name, start, end) of each section of the review, from the end of its header to the next header,
+            or a single section named "" covering the whole review if it has no section headers
+    """
+    headers = list(SECTION_HEADER.finditer(review))
+    if not headers:
+        return [("", 0, len(review))]
+    ends = [header.start() for header in headers[1:]] + [len(review)]
+    return [(header.group(1), header.end(), end) for header, end in zip(headers, ends)]
+
+
+def split_review_comments(review: str, sections: Iterable[str] = COMMENT_SECTIONS) -> List[ReviewComment]:
+    """
+    Split the comment sections of a review into comments: one per list item if the section is a list,
+    otherwise one per paragraph. A review without section headers is split as a whole.
+
+    Params:
+        review: review text
+        sections: names of the sections to split
+
+    Returns:
+        list: comments of the sections, in review order
+    """
+    sections = set(sections)
+    comments = []
+    for name, start, end in review_sections(review):
+        if name and name not in sections:
+            continue
+        text = review[start:end]
+        starts = [match.start() for match in LIST_ITEM.finditer(text)]
+        if len(starts) < 2:
+            starts = [match.end() for match in PARAGRAPH_BREAK.finditer(text)]
+        # Text before the first list item, e.g. an introductory sentence, is a comment of its own
+        starts = [0] + [s for s in starts if s > 0]
+        for piece_start, piece_end in zip(starts, starts[1:] + [len(text)]):
+            piece = text[piece_start:piece_end]
+            if not piece.strip():
+                continue
+            offset = start + piece_start + len(piece) - len(piece.lstrip())
+            comments.append(ReviewComment(name, piece.strip(), (offset, offset + len(piece.strip()))))
+    return comments
+
+
+def review_with_comments(review: str, comments: List[ReviewComment], sections: Iterable[str] = COMMENT_SECTIONS) -> str:
+    """
+    Rebuild a review with only some of its comments, keeping the other sections (e.g. the summary) as context
+
+    Params:
+        review: review text
+        comments: comments of the review to keep, from split_review_comments
+        sections: names of the sections the comments were split from
+
+    Returns:
+        str: review text with the other sections unchanged and, in the comment sections, only the given comments.
+            Comment sections left without comments are dropped.
+    """
+    sections = set(sections)
+    parts = []
+    for name, start, end in review_sections(review):
+        if name and name not in sections:
+            parts.append(f"**{name}**: {review[start:end].strip()}")
+            continue
+        kept = "\n\n".join(comment.text for comment in comments if start <= comment.span[0] < end)
+        if kept:
+            parts.append(f"**{name}**: {kept}" if name else kept)
+    return "\n\n".join(parts)
+
+
+def shard_review(review: str, max_comments: int, sections: Iterable[str] = COMMENT_SECTIONS) -> List[str]:
+    """
+    Split a review into shards of consecutive comments, keeping the other sections (e.g. the summary) in every
+    shard as context. The comments are spread evenly over as few shards as possible.
+
+    Params:
+        review: review text
+        max_comments: maximum number of comments per shard
+        sections: names of the sections to split into comments
+
+    Returns:
+        list: review text of each shard in review order, [review] if it has at most max_comments comments
+    """
+    if max_comments < 1:
+        raise ValueError(f"Shards need at least 1 comment, got {max_comments}")
+    comments = split_review_comments(review, sections)
+    if len(comments) <= max_comments:
+        return [review]
+    count = math.ceil(len(comments) / max_comments)
+    bounds = [round(i * len(comments) / count) for i in range(count + 1)]
+    return [review_with_comments(review, comments[start:end], sections) for start, end in zip(bounds, bounds[1:])]
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def diff_review_comments(
+    previous_review: str, review: str, sections: Iterable[str] = COMMENT_SECTIONS
+) -> Tuple[List[Tuple[ReviewComment, ReviewComment]], List[ReviewComment]]:
+    """
+    Match the comments of a revised review to those of its previous version, ignoring case and whitespace changes
+
+    Params:
+        previous_review: previous version of the review
+        review: revised review
+        sections: names of the sections to compare
+
+    Returns:
+        list: (previous comment, comment) pairs of the comments left unchanged
+        list: comments of the revised review that are new or were edited
+    """
+    previous = defaultdict(list)
+    for comment in split_review_comments(previous_review, sections):
+        previous[_normalize(comment.text)].append(comment)
+
+    unchanged, changed = [], []
+    for comment in split_review_comments(review, sections):
+        matches = previous.get(_normalize(comment.text))
+        if matches:
+            unchanged.append((matches.pop(0), comment))
+        else:
+            changed.append(comment)
+    return unchanged, changed
@@ -1,14 +1,31 @@
 from pypdf import PdfReader
 import os
 import openreview
-from typing import Tuple
+from typing import Tuple, Dict, Any, List, Iterator, Optional, Union
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import logging
+import multiprocessing
+import tempfile
+import threading
 import urllib.request
+from review_feedback_agent.utils.paper_store import PaperStore, hash_file, resolve_paper_store
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 
+# Base URLs of the OpenReview API and PDF download endpoint, can be pointed at a local server
+OPENREVIEW_BASEURL = os.environ.get("OPENREVIEW_BASEURL", "https://api2.openreview.net")
+OPENREVIEW_PDF_URL = os.environ.get("OPENREVIEW_PDF_URL", "https://openreview.net/pdf")
+
+_openreview_clients = threading.local()
+
+# Process pool shared by all PDF extractions, created on first use
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
+
+
 class PaperNotFoundError(Exception):
     """Raised when a paper ID cannot be found"""
     pass
@@ -24,81 +41,202 @@ class ReviewNotFoundError(Exception):
     pass
 
 
-def pdf_to_text(pdf_path: str) -> str:
+def get_openreview_client(baseurl: Optional[str] = None) -> openreview.api.OpenReviewClient:
     """
-    Converts paper PDF to a text string
+    Returns a long-lived OpenReview client, reused by every call made from the same thread
+    so that its HTTP session and connections are kept alive
+
+    Params:
+        baseurl: base URL of the OpenReview API, defaults to OPENREVIEW_BASEURL
+
+    Returns:
+        openreview_client: OpenReview API client
+    """
+    baseurl = baseurl or OPENREVIEW_BASEURL
+    clients = getattr(_openreview_clients, "clients", None)
+    if clients is None:
+        clients = _openreview_clients.clients = {}
+    if baseurl not in clients:
+        try:
+            clients[baseurl] = openreview.api.OpenReviewClient(baseurl=baseurl)
+        except openreview.OpenReviewException as e:
+            raise e
+    return clients[baseurl]
+
+
+def _extract_pages(pdf_path: str, start: int, end: int) -> List[str]:
+    """
+    Extract the text of pages [start, end) of a PDF, run in a worker process
 
     Params:
         pdf_path: local path to paper PDF
+        start: index of the first page to extract
+        end: index after the last page to extract
 
     Returns:
-        paper_text: paper PDF's text
+        pages: text of each page
+    """
+    reader = PdfReader(pdf_path)
+    return [
+        reader.pages[p].extract_text().encode('utf-8', errors='ignore').decode('utf-8') # removes invalid characters by ignoring encoding errors
+        for p in range(start, end)
+    ]
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """
+    Returns the process pool extracting PDF pages, shared by every call so that concurrent extractions from batch
+    worker threads do not each start their own processes. Its workers are started with forkserver (or spawn where
+    it is not available) rather than fork, which is unsafe from a process running other threads.
+    """
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pdf_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context(start_method))
+        return _pdf_pool
+
+
+def _reset_pdf_pool(pool: ProcessPoolExecutor) -> None:
+    # Drops a broken pool so that the next extraction starts a new one
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False)
+
+
+def iter_pdf_pages(pdf_path: str, num_workers: int = 1, min_pages_per_worker: int = 8) -> Iterator[str]:
+    """
+    Yields the text of each page of a PDF in order, as soon as it has been extracted
+
+    Pages are extracted in the current process by default. With num_workers > 1, they are split into contiguous
+    ranges that are extracted in parallel by a process pool shared by all calls (see _get_pdf_pool), and PDFs too
+    short to be worth sharding are still extracted in the current process. The pool starts its workers by importing
+    the main module, so a script using it must run its code under `if __name__ == "__main__":`.
+
+    Params:
+        pdf_path: local path to paper PDF
+        num_workers: number of page ranges extracted in parallel, 1 (the default) extracts the pages in the
+            current process
+        min_pages_per_worker: minimum number of pages extracted by each worker
+
+    Returns:
+        iterator over the text of each page
     """
     try:
-        paper_text = ""
         logger.info(f"Parsing the pdf {pdf_path}")
-        reader = PdfReader(pdf_path)
-        number_of_pages = len(reader.pages)
-        for p in range(number_of_pages):
-            page = reader.pages[p].get_object()
-            text = page.extract_text()
-            paper_text += text.encode('utf-8', errors='ignore').decode('utf-8') # removes invalid characters by ignoring encoding errors
-
-        return paper_text
+        number_of_pages = len(PdfReader(pdf_path).pages)
+        num_workers = min(num_workers, number_of_pages // min_pages_per_worker)
+
+        if num_workers <= 1:
+            yield from _extract_pages(pdf_path, 0, number_of_pages)
+            return
+
+        shard_size = -(-number_of_pages // num_workers)
+        starts = range(0, number_of_pages, shard_size)
+        ends = [min(start + shard_size, number_of_pages) for start in starts]
+        pool = _get_pdf_pool()
+        futures = [pool.submit(_extract_pages, pdf_path, start, end) for start, end in zip(starts, ends)]
+        try:
+            for future in futures:
+                yield from future.result()
+        except BrokenProcessPool:
+            _reset_pdf_pool(pool)
+            raise
+        finally:
+            # Ranges not extracted yet are dropped if the caller stops early or a range fails
+            for future in futures:
+                future.cancel()
     except Exception as e:
         logger.error(f"Error parsing PDF {pdf_path}: {str(e)}")
         raise PDFParsingError(f"Failed to parse PDF: {str(e)}")
 
 
-def get_openreview_paper(paper_id: str) -> str:
+def pdf_to_text(pdf_path: str, num_workers: int = 1) -> str:
+    """
+    Converts paper PDF to a text string
+
+    Params:
+        pdf_path: local path to paper PDF
+        num_workers: number of page ranges extracted in parallel by the shared process pool, 1 (the default)
+            extracts the pages in the current process. See iter_pdf_pages for the requirements of the pool.
+
+    Returns:
+        paper_text: paper PDF's text
+    """
+    return "".join(iter_pdf_pages(pdf_path, num_workers=num_workers))
+
+
+def get_openreview_paper(paper_id: str, paper_store: Union[PaperStore, bool, None] = None) -> str:
     """
     Retrieve text from paper pdf using desired paper ID
 
     Params:
         paper_id: str representing paper ID
+        paper_store: store of parsed papers read before downloading, defaults to get_default_paper_store(), False
+            to use none
 
     Returns:
         pdf_text: paper PDF's text
     """
-    
-    pdf_path = f"./{paper_id}.pdf"
-    paper_url = f"https://openreview.net/pdf?id={paper_id}"
 
-    try:
-        urllib.request.urlretrieve(paper_url, pdf_path)
-    except urllib.error.URLError as e:
-        logger.error(f"Failed to download paper with ID {paper_id}: {str(e)}")
-        raise PaperNotFoundError(f"Failed to download paper with ID {paper_id}")
+    paper_store = resolve_paper_store(paper_store)
+    if paper_store is not None:
+        pdf_text = paper_store.get(paper_id=paper_id)
+        if pdf_text is not None:
+            return pdf_text
+
+    paper_url = f"{OPENREVIEW_PDF_URL}?id={paper_id}"
+
+    # Download into a private directory so that concurrent fetches of the same paper do not collide
+    with tempfile.TemporaryDirectory() as download_dir:
+        pdf_path = os.path.join(download_dir, f"{paper_id}.pdf")
+
+        try:
+            urllib.request.urlretrieve(paper_url, pdf_path)
+        except urllib.error.URLError as e:
+            logger.error(f"Failed to download paper with ID {paper_id}: {str(e)}")
+            raise PaperNotFoundError(f"Failed to download paper with ID {paper_id}")
 
-    try:
         pdf_text = pdf_to_text(pdf_path)
+        if paper_store is not None:
+            paper_store.put(pdf_path, pdf_text, paper_id=paper_id)
         return pdf_text
-    except PDFParsingError as e:
-        raise
-    finally:
-        print('Removing downloaded PDF')
-        os.remove(pdf_path)  # Clean up the downloaded PDF file
 
 
-def get_openreview_paper_and_review(review_id: str, paper_id: str) -> Tuple[str, str]:
+def format_review_content(review_content: Dict[str, Any]) -> str:
     """
-    Retrieve review text from paper pdf using desired paper ID and review ID
+    Format the content of an OpenReview review note into review text
+
+    Params:
+        review_content: content of the review note, mapping field names to {'value': ...}
+
+    Returns:
+        review_content_formatted: formatted review text
+    """
+    headers_to_keep = ['Summary', 'Strengths', 'Weaknesses', 'Questions']
+
+    review_content_formatted = []
+    for section, content in review_content.items():
+        header = section.replace("_", " ").title()
+        if header in headers_to_keep:
+            review_content_formatted.append(f"**{header}**: {content['value']}")
+    return "\n\n".join(review_content_formatted)
+
+
+def get_openreview_review(review_id: str) -> str:
+    """
+    Retrieve formatted review text using desired review ID
 
     Params:
         review_id: str representing review ID
-        paper_id: str representing paper ID
 
     Returns:
         review_content_formatted: formatted review text
-        pdf_text: paper PDF's text
     """
-    
-    try:
-        openreview_client = openreview.api.OpenReviewClient(
-            baseurl="https://api2.openreview.net"
-        )
-    except openreview.OpenReviewException as e:
-        raise e
+
+    openreview_client = get_openreview_client()
 
     try:
         review = openreview_client.get_note(review_id)
@@ -107,18 +245,28 @@ def get_openreview_paper_and_review(review_id: str, paper_id: str) -> Tuple[str,
         logger.error(f"Review {review_id} not found")
         raise ReviewNotFoundError(f"Review {review_id} not found")
 
-    # Reformat review content
-    headers_to_keep = ['Summary', 'Strengths', 'Weaknesses', 'Questions']
+    return format_review_content(review_content)
 
-    review_content_formatted = []
-    for section, content in review_content.items():
-        header = section.replace("_", " ").title()
-        if header in headers_to_keep:
-            review_content_formatted.append(f"**{header}**: {content['value']}")
-    review_content_formatted = "\n\n".join(review_content_formatted)
+
+def get_openreview_paper_and_review(review_id: str, paper_id: str, paper_store: Union[PaperStore, bool, None] = None) -> Tuple[str, str]:
+    """
+    Retrieve review text from paper pdf using desired paper ID and review ID
+
+    Params:
+        review_id: str representing review ID
+        paper_id: str representing paper ID
+        paper_store: store of parsed papers read before downloading, defaults to get_default_paper_store(), False
+            to use none
+
+    Returns:
+        review_content_formatted: formatted review text
+        pdf_text: paper PDF's text
+    """
+
+    review_content_formatted = get_openreview_review(review_id)
 
     try:
-        pdf_text = get_openreview_paper(paper_id)
+        pdf_text = get_openreview_paper(paper_id, paper_store=paper_store)
     except PaperNotFoundError as e:
         raise e
 
@@ -127,7 +275,7 @@ def get_openreview_paper_and_review(review_id: str, paper_id: str) -> Tuple[str,
 
 def get_review_id(paper_id: str, reviewer_id: str) -> str:
     """
-    Retrieve review ID from reviewer ID
+    Retrieve review ID from reviewer ID. To look up the reviews of many papers, build a ReviewIndex once instead.
 
     Params:
         paper_id: str representing paper ID
@@ -135,44 +283,40 @@ def get_review_id(paper_id: str, reviewer_id: str) -> str:
 
     Returns:
         review_id: str representing review ID
-    """
-    
-    try:
-        openreview_client = openreview.api.OpenReviewClient(
-            baseurl="https://api2.openreview.net"
-        )
-    except openreview.OpenReviewException as e:
-        raise e
-
-    try:
-        note = openreview_client.get_notes(paper_id, details='replies')[0]
-    except openreview.OpenReviewException:
-        logger.error(f"Error getting note from paper_id: {paper_id}")
-        raise PaperNotFoundError(f"Error getting note from paper_id: {paper_id}")
-
-    desired_review = next(
-            i
-            for i, entry in enumerate(note.details["replies"])
-            if entry["signatures"][0].split("_")[-1] == reviewer_id
-        )
 
-    review_id = note.details['replies'][desired_review]['id']
+    Raises:
+        PaperNotFoundError: If the paper cannot be found
+        ReviewNotFoundError: If the paper has no review by this reviewer
+    """
+    # Imported here as the index is built on the helpers of this module
+    from review_feedback_agent.utils.openreview_index import ReviewIndex
 
-    return review_id
+    return ReviewIndex.from_paper_ids([paper_id], max_workers=1).get_review_id(paper_id, reviewer_id)
 
 
-def parse_uploaded_paper(pdf_path: str) -> Tuple[str, str]:
+def parse_uploaded_paper(pdf_path: str, paper_store: Union[PaperStore, bool, None] = None) -> Tuple[str, str]:
     """
     Returns paper's text given the path to pdf
 
     Params:
         pdf_path: path to pdf (locally)
+        paper_store: store of parsed papers read before parsing, defaults to get_default_paper_store(), False
+            to use none
 
     Returns:
         pdf_text: paper's PDF text
     """
+    paper_store = resolve_paper_store(paper_store)
+    if paper_store is not None:
+        pdf_text = paper_store.get(content_hash=hash_file(pdf_path))
+        if pdf_text is not None:
+            return pdf_text
+
     try:
         pdf_text = pdf_to_text(pdf_path)
-        return pdf_text
     except PDFParsingError as e:
         raise e
+
+    if paper_store is not None:
+        paper_store.put(pdf_path, pdf_text)
+    return pdf_text
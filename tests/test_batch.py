@@ -0,0 +1,55 @@
+import json
+import random
+import pytest
+from benchmarks.corpus import synthetic_paper_text, synthetic_review, write_pdf
+from benchmarks.fake_engine import FakeEngine
+from review_feedback_agent.agents import FeedbackAgent
+from review_feedback_agent.apis import LLM
+from review_feedback_agent.batch import BatchRunner, entry_key, run_batch, truncate_partial_line
+from review_feedback_agent.utils import paper_store
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path):
+    paper_store.set_default_paper_store(paper_store.PaperStore(str(tmp_path / "papers")))
+    yield
+    paper_store.set_default_paper_store(None)
+    paper_store._default_paper_store_disabled = False
+
+
+def test_truncate_partial_line(tmp_path):
+    output_path = tmp_path / "out.jsonl"
+    output_path.write_text('{"key": "a"}\n{"key": "b"}\n{"key": "c", "sta')
+    truncate_partial_line(str(output_path))
+    assert output_path.read_text() == '{"key": "a"}\n{"key": "b"}\n'
+    truncate_partial_line(str(output_path))
+    assert output_path.read_text() == '{"key": "a"}\n{"key": "b"}\n'
+    output_path.write_text('{"key": "c", "sta')
+    truncate_partial_line(str(output_path))
+    assert output_path.read_text() == ""
+
+
+def test_resume_after_partial_line(tmp_path):
+    rng = random.Random(0)
+    pdf_path = str(tmp_path / "paper.pdf")
+    write_pdf(pdf_path, synthetic_paper_text(rng, 2))
+    entries = [{"pdf_path": pdf_path, "review_text": synthetic_review(rng)} for _ in range(2)]
+    manifest_path = tmp_path / "manifest.jsonl"
+    manifest_path.write_text("".join(json.dumps(entry) + "\n" for entry in entries))
+    output_path = tmp_path / "out.jsonl"
+    # A crashed run completed the first entry and was writing the second
+    done = {"key": entry_key(entries[0]), "entry": entries[0], "status": "ok"}
+    output_path.write_text(json.dumps(done) + "\n" + json.dumps({"key": entry_key(entries[1])})[:20])
+
+    agent = FeedbackAgent(LLM("sonnet-3.5", engine=FakeEngine(latency=0)))
+    counts = run_batch(str(manifest_path), str(output_path), agent, run_tests=False)
+    assert counts == {"ok": 1, "error": 0, "skipped": 1}
+    records = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert [record["key"] for record in records] == [entry_key(entry) for entry in entries]
+
+
+def test_verifier_follows_agent_llm():
+    llm = LLM("haiku-3.5", engine=FakeEngine(latency=0))
+    assert BatchRunner(FeedbackAgent(llm)).verifier_llm is llm
+    verifier_llm = LLM("sonnet-3.5", engine=FakeEngine(latency=0))
+    assert BatchRunner(FeedbackAgent(llm, verifier_llm=verifier_llm)).verifier_llm is verifier_llm
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+import pytest
+from benchmarks.fake_engine import FakeEngine
+from review_feedback_agent.agents import FeedbackAgent
+from review_feedback_agent.agents.checkpoint import DirectoryCheckpointStore, SQLiteCheckpointStore, checkpoint_key
+from review_feedback_agent.agents.prompts import ACTOR_SYSTEM_PROMPT
+from review_feedback_agent.apis import LLM
+
+PAPER = "We propose a method and evaluate it on three benchmarks."
+REVIEW = "**Weaknesses**: The experiments lack strong baselines."
+
+
+class FlakyEngine(FakeEngine):
+    # Fails the calls made with `failing_prompt` as system prompt
+    def __init__(self):
+        super().__init__(latency=0)
+        self.failing_prompt = None
+
+    def _respond(self, message, system_prompt):
+        if system_prompt == self.failing_prompt:
+            raise RuntimeError("Engine down")
+        return super()._respond(message, system_prompt)
+
+
+@pytest.fixture(params=["directory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "directory":
+        return DirectoryCheckpointStore(str(tmp_path / "checkpoints"))
+    return SQLiteCheckpointStore(str(tmp_path / "checkpoints.db"))
+
+
+def test_checkpoint_key_separates_parts():
+    assert checkpoint_key("ab", "c", "Actor") != checkpoint_key("a", "bc", "Actor")
+    assert checkpoint_key("a", "b", "Actor") == checkpoint_key("a", "b", "Actor")
+
+
+def test_checkpoint_key_depends_on_settings(store):
+    llm = LLM("sonnet-3.5", engine=FakeEngine(latency=0))
+    llms = {"haiku-3.5": LLM("haiku-3.5", engine=FakeEngine(latency=0))}
+    agents = [
+        FeedbackAgent(llm, checkpoint_store=store),
+        FeedbackAgent(llm, checkpoint_store=store, llms=llms, models={"Formatter": "haiku-3.5"}),
+        FeedbackAgent(llm, checkpoint_store=store, llms=llms, cascade_models={"Formatter": "haiku-3.5"}),
+        FeedbackAgent(llm, checkpoint_store=store, context_token_budget=4000),
+        FeedbackAgent(llm, checkpoint_store=store, shared_prefix=True),
+        FeedbackAgent(llm, checkpoint_store=store, architecture="Actor(3)->Aggregator->FeedbackCritic->Formatter"),
+    ]
+    keys = {agent._initial_state(PAPER, REVIEW)["checkpoint_key"] for agent in agents}
+    assert len(keys) == len(agents)
+    assert FeedbackAgent(llm, checkpoint_store=store)._initial_state(PAPER, REVIEW)["checkpoint_key"] in keys
+
+
+def test_store_round_trip_and_version(store):
+    checkpoint = {"version": 3, "state": {"outputs": {"0": "feedback"}}}
+    store.save("key", checkpoint)
+    assert store.load("key") == checkpoint
+    store.save("key", {**checkpoint, "version": 0})
+    assert store.load("key") is None
+    store.delete("key")
+    store.delete("key")
+    assert store.load("key") is None
+
+
+def test_failed_run_resumes_after_completed_steps(store):
+    engine = FlakyEngine()
+    agent = FeedbackAgent(LLM("sonnet-3.5", engine=engine), checkpoint_store=store)
+    engine.failing_prompt = agent.components[-1].system_prompt
+    with pytest.raises(RuntimeError):
+        agent(PAPER, REVIEW)
+    key = agent._initial_state(PAPER, REVIEW)["checkpoint_key"]
+    assert store.load(key)["completed_steps"] == [0, 1, 2, 3]
+    completed_calls = len(engine.calls)
+
+    engine.failing_prompt = None
+    events = list(agent.stream(PAPER, REVIEW))
+    assert [event["step"] for event in events if event["event"] == "step restored"] == [1, 2, 3, 4]
+    # Only the Formatter is run again
+    assert [call.system_prompt for call in engine.calls[completed_calls:]] == [agent.components[-1].system_prompt]
+    assert events[-1]["result"]["formatted feedback"]
+    assert store.load(key) is None
+
+
+def test_failed_async_run_resumes(store):
+    engine = FlakyEngine()
+    agent = FeedbackAgent(LLM("sonnet-3.5", engine=engine), checkpoint_store=store)
+    engine.failing_prompt = agent.components[3].system_prompt
+    with pytest.raises(RuntimeError):
+        asyncio.run(agent.acall(PAPER, REVIEW))
+    completed_calls = len(engine.calls)
+
+    engine.failing_prompt = None
+    result = asyncio.run(agent.acall(PAPER, REVIEW))
+    assert len(engine.calls) - completed_calls == 2
+    # Outputs are deterministic, so the resumed run gives the feedback of an uninterrupted one
+    assert result["formatted feedback"] == agent(PAPER, REVIEW)["formatted feedback"]
+
+
+class FirstActorFailsEngine(FakeEngine):
+    # The first Actor call fails at once while the other replica is still running
+    def __init__(self, actor_prompt: str):
+        super().__init__(latency=0)
+        self.actor_prompt = actor_prompt
+        self.failed = threading.Event()
+
+    def _respond(self, message, system_prompt):
+        if system_prompt == self.actor_prompt:
+            with self._lock:
+                first = not self.failed.is_set()
+                self.failed.set()
+            if first:
+                raise RuntimeError("Engine down")
+            time.sleep(0.05)
+        return super()._respond(message, system_prompt)
+
+
+def test_failed_step_saves_the_outputs_of_its_siblings(store):
+    agent = FeedbackAgent(LLM("sonnet-3.5", engine=FirstActorFailsEngine(ACTOR_SYSTEM_PROMPT)), checkpoint_store=store)
+    with pytest.raises(RuntimeError):
+        agent(PAPER, REVIEW)
+    checkpoint = store.load(agent._initial_state(PAPER, REVIEW)["checkpoint_key"])
+    assert len(checkpoint["completed_steps"]) == 1 and checkpoint["completed_steps"][0] in (0, 1)
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from benchmarks.fake_engine import FakeEngine
+from review_feedback_agent.agents import FeedbackAgent
+from review_feedback_agent.apis import LLM
+
+SYSTEM = "You are a careful reviewer."
+PAPER = "paper " * 400
+REVIEW = "review " * 40
+
+
+def message(review: str = REVIEW, paper: str = PAPER) -> list:
+    return [
+        {"type": "text", "text": paper, "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": review, "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": "Give feedback."},
+    ]
+
+
+def tokens(*parts: str) -> int:
+    return len("".join(parts)) // 4
+
+
+def test_prompt_cache_matches_at_every_breakpoint():
+    engine = FakeEngine(latency=0, prompt_cache=True)
+    engine(message(), SYSTEM)
+    engine(message(), SYSTEM)
+    engine(message("another review"), SYSTEM)
+    engine(message(), "Another stage")
+    first, same, other_review, other_stage = engine.calls
+
+    assert (first.cache_read_tokens, first.cache_write_tokens) == (0, tokens(SYSTEM, PAPER, REVIEW))
+    assert (same.cache_read_tokens, same.cache_write_tokens) == (tokens(SYSTEM, PAPER, REVIEW), 0)
+    # Another review of the paper reads the prefix up to the paper and writes its review
+    assert other_review.cache_read_tokens == tokens(SYSTEM, PAPER)
+    assert other_review.cache_write_tokens == tokens(SYSTEM, PAPER, "another review") - tokens(SYSTEM, PAPER)
+    # The system prompt is part of the prefix
+    assert (other_stage.cache_read_tokens, other_stage.cache_write_tokens) == (0, tokens("Another stage", PAPER, REVIEW))
+    assert all(abs(call.input_tokens - tokens("Give feedback.")) <= 1 for call in engine.calls)
+
+
+def test_prompt_cache_is_written_once_the_call_completes():
+    engine = FakeEngine(latency=0.05, prompt_cache=True)
+
+    async def run():
+        await asyncio.gather(engine.acall(message(), SYSTEM), engine.acall(message(), SYSTEM))
+        await engine.acall(message(), SYSTEM)
+
+    asyncio.run(run())
+    concurrent, other_concurrent, later = engine.calls
+    assert concurrent.cache_read_tokens == other_concurrent.cache_read_tokens == 0
+    assert concurrent.cache_write_tokens == other_concurrent.cache_write_tokens > 0
+    assert later.cache_read_tokens > 0 and later.cache_write_tokens == 0
+
+
+def test_prompt_cache_is_not_written_by_failed_or_unfinished_calls():
+    engine = FakeEngine(latency=0, prompt_cache=True)
+    stream = engine.stream(message(), SYSTEM)
+    next(stream)
+    # A call sent while the first is still streaming does not read its prefix
+    thread = threading.Thread(target=engine, args=(message(), "Other"))
+    thread.start()
+    thread.join()
+    engine(message(), SYSTEM)
+    assert engine.calls[-1].cache_read_tokens == 0
+    list(stream)
+    engine(message(), SYSTEM)
+    assert engine.calls[-1].cache_read_tokens > 0
+
+    failing = FakeEngine(latency=0, prompt_cache=True, failure_rate=1.0)
+    for _ in range(2):
+        try:
+            failing(message(), SYSTEM)
+        except Exception:
+            pass
+    assert [call.cache_read_tokens for call in failing.calls] == [0, 0]
+
+
+def test_actor_replicas_each_write_the_prefix():
+    engine = FakeEngine(latency=0.05, prompt_cache=True)
+    agent = FeedbackAgent(LLM("sonnet-3.5", engine=engine), shared_prefix=True)
+    agent(PAPER, REVIEW)
+    actor_calls = [call for call in engine.calls if call.system_prompt == agent.components[0].system_prompt]
+    # The replicas run side by side, so neither finds the prefix of the other in the cache
+    assert len(actor_calls) == 2
+    assert all(call.cache_read_tokens == 0 and call.cache_write_tokens > 0 for call in actor_calls)
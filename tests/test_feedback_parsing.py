@@ -0,0 +1,87 @@
+from review_feedback_agent.utils import feedback_parsing
+from review_feedback_agent.utils.feedback_parsing import (
+    NO_FEEDBACK_MESSAGE,
+    FeedbackItem,
+    format_feedback_items,
+    items_from_json,
+    items_to_json,
+    iter_feedback_items,
+    parse_feedback,
+)
+
+REVIEW = "The experiments lack strong baselines. The proof of Theorem 2 skips the bounded variance step."
+FEEDBACK = (
+    "- **Reviewer comment:** The experiments lack strong baselines.\n"
+    "- **Feedback to the reviewer:** Could you name the baselines you have in mind?\n\n"
+    "- **Reviewer comment:** \"the proof of theorem 2 skips the bounded variance step\"\n"
+    "- **Feedback to the reviewer:** Could you point to the line where the step is skipped?"
+)
+
+
+def test_parse_feedback_locates_comments():
+    items = parse_feedback(FEEDBACK, REVIEW)
+    assert [item.feedback for item in items] == [
+        "Could you name the baselines you have in mind?",
+        "Could you point to the line where the step is skipped?",
+    ]
+    assert [REVIEW[slice(*item.span)] for item in items] == [
+        "The experiments lack strong baselines",
+        "The proof of Theorem 2 skips the bounded variance step",
+    ]
+
+
+def test_iter_feedback_items_matches_parse_for_any_chunking():
+    expected = parse_feedback(FEEDBACK, REVIEW)
+    for size in (1, 2, 3, 7, 50, len(FEEDBACK)):
+        chunks = [FEEDBACK[i:i + size] for i in range(0, len(FEEDBACK), size)]
+        assert list(iter_feedback_items(chunks, REVIEW)) == expected
+
+
+def test_iter_feedback_items_yields_item_once_next_comment_starts():
+    first, second = FEEDBACK.split("\n\n")
+    consumed = []
+
+    def chunks():
+        for chunk in (first, "\n\n", second[:30], second[30:]):
+            consumed.append(chunk)
+            yield chunk
+
+    items = iter_feedback_items(chunks(), REVIEW)
+    assert next(items).comment == "The experiments lack strong baselines."
+    # The first item is complete once the marker of the second comment has arrived, before the end of the stream
+    assert len(consumed) == 3
+    assert next(items).feedback == "Could you point to the line where the step is skipped?"
+
+
+def test_iter_feedback_items_accepts_marker_variants():
+    feedback = "**Reviewer Comment**: A\n**feedback to the reviewer**: B"
+    assert list(iter_feedback_items(iter(feedback))) == [FeedbackItem("A", "B")]
+
+
+def test_iter_feedback_items_scans_only_new_text(monkeypatch):
+    scanned = []
+    marker = feedback_parsing.COMMENT_MARKER
+
+    class CountingMarker:
+        def finditer(self, string, pos=0):
+            scanned.append(len(string) - pos)
+            return marker.finditer(string, pos)
+
+    feedback = "\n\n".join([FEEDBACK] * 20)
+    expected = parse_feedback(feedback, REVIEW)
+    monkeypatch.setattr(feedback_parsing, "COMMENT_MARKER", CountingMarker())
+    assert list(iter_feedback_items(iter(feedback), REVIEW)) == expected
+    # Each character is scanned a bounded number of times, not once per later chunk
+    assert sum(scanned) < 3 * len(feedback)
+
+
+def test_comment_without_feedback_and_empty_output():
+    assert parse_feedback("- **Reviewer comment:** A") == [FeedbackItem("A", "")]
+    assert parse_feedback(NO_FEEDBACK_MESSAGE) == []
+
+
+def test_format_and_serialize_round_trip():
+    items = parse_feedback(FEEDBACK, REVIEW)
+    assert parse_feedback(format_feedback_items(items), REVIEW) == items
+    assert items_from_json(items_to_json(items)) == items
+    assert format_feedback_items([]) == NO_FEEDBACK_MESSAGE
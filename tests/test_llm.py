@@ -0,0 +1,72 @@
+from benchmarks.fake_engine import FakeEngine
+from review_feedback_agent.agents import FeedbackAgent
+from review_feedback_agent.agents.paper import LazyPrompt, Paper
+from review_feedback_agent.apis import LLM, AnthropicEngine, Scheduler
+from review_feedback_agent.apis.engines import MODEL_ALIASES
+
+PAPER = "We propose a method and evaluate it on three benchmarks."
+REVIEW = "**Weaknesses**: The experiments lack strong baselines."
+
+
+def test_component_model_llm_copies_llm_api(tmp_path):
+    scheduler = Scheduler()
+    llm = LLM(
+        "sonnet-3.5",
+        engine=FakeEngine(latency=0),
+        max_concurrency=3,
+        cache_dir=str(tmp_path / "cache"),
+        cache_size_limit=2**20,
+        cache_ttl=60,
+        scheduler=scheduler,
+        priority="batch",
+    )
+    agent = FeedbackAgent(llm, models={"Formatter": "haiku-3.5"})
+    haiku = agent.llms["haiku-3.5"]
+    assert haiku.model_name == "haiku-3.5"
+    assert isinstance(haiku.engine, FakeEngine) and haiku.engine is not llm.engine
+    assert haiku.cache is llm.cache and haiku.cache.size_limit == 2**20 and haiku.cache_ttl == 60
+    assert haiku.scheduler is scheduler and haiku.priority == "batch" and haiku.max_concurrency == 3
+
+    agent(PAPER, REVIEW)
+    assert len(haiku.engine.calls) == 1
+    assert len(llm.engine.calls) == len(agent.plan.nodes) - 1
+
+
+def test_anthropic_engine_with_model():
+    engine = AnthropicEngine("sonnet-3.5", max_tokens=500, temperature=0.5, api_key="test", max_retries=0)
+    haiku = LLM("sonnet-3.5", engine=engine).with_model("haiku-3.5").engine
+    assert isinstance(haiku, AnthropicEngine)
+    assert haiku.model_string == MODEL_ALIASES["haiku-3.5"]
+    assert (haiku.max_tokens, haiku.temperature) == (500, 0.5)
+    assert haiku.client is engine.client
+    assert engine.model_string == MODEL_ALIASES["sonnet-3.5"]
+
+
+def test_cache_key_includes_engine_settings(tmp_path):
+    def key(engine, **sampling_params):
+        return LLM("sonnet-3.5", engine=engine, cache_dir=str(tmp_path / "cache"))._cache_key("prompt", "system", None, sampling_params)
+
+    engine = AnthropicEngine("sonnet-3.5", max_tokens=500, temperature=0, api_key="test", max_retries=0)
+    assert key(engine) == key(AnthropicEngine("sonnet-3.5", max_tokens=500, temperature=0, api_key="test", max_retries=0))
+    assert key(engine) != key(AnthropicEngine("sonnet-3.5", max_tokens=500, temperature=1, api_key="test", max_retries=0))
+    assert key(engine) != key(AnthropicEngine("sonnet-3.5", max_tokens=1000, temperature=0, api_key="test", max_retries=0))
+    assert key(engine, temperature=1) == key(AnthropicEngine("sonnet-3.5", max_tokens=500, temperature=1, api_key="test", max_retries=0))
+    assert key(engine) != key(FakeEngine(latency=0))
+
+
+def test_cache_key_does_not_format_lazy_prompts(tmp_path, monkeypatch):
+    llm = LLM("sonnet-3.5", engine=FakeEngine(latency=0), cache_dir=str(tmp_path / "cache"))
+    paper = Paper.intern(PAPER)
+    other = Paper.intern(PAPER + " We also prove a theorem.")
+
+    def key(prompt):
+        return llm._cache_key([{"type": "text", "text": prompt}], "system", None, {})
+
+    def fail(self):
+        raise AssertionError("prompt formatted for its cache key")
+
+    monkeypatch.setattr(LazyPrompt, "__str__", fail)
+    monkeypatch.setattr(Paper, "__str__", fail)
+    assert key(LazyPrompt("Paper: {paper}", paper=paper)) == key(LazyPrompt("Paper: {paper}", paper=paper))
+    assert key(LazyPrompt("Paper: {paper}", paper=paper)) != key(LazyPrompt("Paper: {paper}", paper=other))
+    assert key(LazyPrompt("Paper: {paper}", paper=paper)) != key(LazyPrompt("Text: {paper}", paper=paper))
@@ -0,0 +1,83 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from review_feedback_agent.utils.openreview_index import ReviewIndex
+from review_feedback_agent.utils import utils
+from review_feedback_agent.utils.utils import PaperNotFoundError, ReviewNotFoundError, get_review_id
+
+
+def submission(paper_id, reviewers):
+    replies = [
+        {
+            "id": f"{paper_id}-{reviewer}",
+            "invitations": ["Venue/Submission/-/Official_Review"],
+            "signatures": [f"Venue/Submission/Reviewer_{reviewer}"],
+            "content": {"summary": {"value": f"Review of {paper_id} by {reviewer}"}},
+        }
+        for reviewer in reviewers
+    ]
+    return {"id": paper_id, "forum": paper_id, "details": {"replies": replies}}
+
+
+class NotesHandler(BaseHTTPRequestHandler):
+    # Stub of the /notes endpoint filtering by a comma-separated list of ids
+    notes = {}
+    requests = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        type(self).requests.append((url.path, params))
+        ids = params["ids"].split(",")
+        body = json.dumps({"notes": [self.notes[note_id] for note_id in ids if note_id in self.notes]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    NotesHandler.notes = {f"paper{i}": submission(f"paper{i}", ["abcd", "efgh"]) for i in range(5)}
+    NotesHandler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), NotesHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_from_paper_ids_batches_requests(server):
+    paper_ids = [f"paper{i}" for i in range(5)] + ["paper0"]
+    index = ReviewIndex.from_paper_ids(paper_ids, max_workers=2, baseurl=server, batch_size=2)
+    assert len(NotesHandler.requests) == 3
+    assert sorted(params["ids"] for _, params in NotesHandler.requests) == ["paper0,paper1", "paper2,paper3", "paper4"]
+    assert all(path == "/notes" and params["details"] == "replies" for path, params in NotesHandler.requests)
+    assert len(index.reviews) == 10
+    assert index.reviewers("paper3") == ["abcd", "efgh"]
+    assert index.get_review_id("paper4", "efgh") == "paper4-efgh"
+
+
+def test_from_paper_ids_missing_papers(server):
+    with pytest.raises(PaperNotFoundError):
+        ReviewIndex.from_paper_ids(["paper0", "missing"], baseurl=server)
+    index = ReviewIndex.from_paper_ids(["paper0", "missing"], skip_missing=True, baseurl=server)
+    assert index.reviewers("paper0") == ["abcd", "efgh"]
+    assert index.reviewers("missing") == []
+
+
+def test_get_review_id(server, monkeypatch):
+    monkeypatch.setattr(utils, "OPENREVIEW_BASEURL", server)
+    assert get_review_id("paper2", "abcd") == "paper2-abcd"
+    assert NotesHandler.requests == [("/notes", {"ids": "paper2", "details": "replies", "limit": "1"})]
+    with pytest.raises(ReviewNotFoundError):
+        get_review_id("paper2", "zzzz")
+    with pytest.raises(PaperNotFoundError):
+        get_review_id("missing", "abcd")
@@ -0,0 +1,58 @@
+import os
+import random
+import subprocess
+import sys
+import time
+from benchmarks.corpus import synthetic_paper_text, write_pdf
+from review_feedback_agent.utils import paper_store
+from review_feedback_agent.utils.paper_store import PaperStore, hash_file
+from review_feedback_agent.utils.utils import parse_uploaded_paper
+
+
+def test_paper_id_mapping_expires(tmp_path):
+    pdf_path = tmp_path / "paper.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4 first version")
+    store = PaperStore(str(tmp_path / "store"), id_ttl=0.2)
+    content_hash = store.put(str(pdf_path), "first version", paper_id="abc")
+    assert store.get(paper_id="abc") == "first version"
+    time.sleep(0.3)
+    # The paper ID must be resolved again, the text stays available by content hash
+    assert store.get(paper_id="abc") is None
+    assert store.get(content_hash=content_hash) == "first version"
+
+    pdf_path.write_bytes(b"%PDF-1.4 revised version")
+    store.put(str(pdf_path), "revised version", paper_id="abc")
+    assert store.get(paper_id="abc") == "revised version"
+    assert hash_file(str(pdf_path)) != content_hash
+
+
+def test_paper_id_mapping_without_ttl(tmp_path):
+    pdf_path = tmp_path / "paper.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4")
+    store = PaperStore(str(tmp_path / "store"), id_ttl=None)
+    store.put(str(pdf_path), "text", paper_id="abc")
+    assert store.get(paper_id="abc") == "text"
+
+
+def test_paper_store_can_be_disabled(tmp_path, monkeypatch):
+    pdf_path = str(tmp_path / "paper.pdf")
+    write_pdf(pdf_path, synthetic_paper_text(random.Random(0), 1))
+    store = PaperStore(str(tmp_path / "store"))
+    monkeypatch.setattr(paper_store, "_default_paper_store", store)
+    text = parse_uploaded_paper(pdf_path, paper_store=False)
+    assert store.get(content_hash=hash_file(pdf_path)) is None
+    assert parse_uploaded_paper(pdf_path) == text
+    assert store.get(content_hash=hash_file(pdf_path)) == text
+
+
+def test_default_paper_store_disabled_by_environment(tmp_path):
+    code = "from review_feedback_agent.utils.paper_store import get_default_paper_store\nassert get_default_paper_store() is None\n"
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(path for path in sys.path if path),
+        REVIEW_FEEDBACK_AGENT_CACHE_DIR=str(tmp_path),
+        REVIEW_FEEDBACK_AGENT_PAPER_STORE="0",
+    )
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert not any(tmp_path.iterdir())
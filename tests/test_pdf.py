@@ -0,0 +1,71 @@
+import os
+import random
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.corpus import synthetic_paper_text, write_pdf
+from review_feedback_agent.utils import utils
+from review_feedback_agent.utils.utils import iter_pdf_pages
+
+
+def test_pdf_extractions_share_one_pool(tmp_path):
+    pdf_path = str(tmp_path / "paper.pdf")
+    write_pdf(pdf_path, synthetic_paper_text(random.Random(0), 6))
+    expected = list(iter_pdf_pages(pdf_path, num_workers=1))
+
+    def extract(_):
+        return list(iter_pdf_pages(pdf_path, num_workers=3, min_pages_per_worker=1)), utils._get_pdf_pool()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(extract, range(4)))
+    assert all(pages == expected for pages, _ in results)
+    pools = {id(pool) for _, pool in results}
+    assert len(pools) == 1
+    assert utils._pdf_pool._mp_context.get_start_method() != "fork"
+
+
+def test_closing_iterator_early_keeps_pool_usable(tmp_path):
+    pdf_path = str(tmp_path / "paper.pdf")
+    write_pdf(pdf_path, synthetic_paper_text(random.Random(1), 6))
+    pages = iter_pdf_pages(pdf_path, num_workers=3, min_pages_per_worker=1)
+    first = next(pages)
+    pages.close()
+    assert list(iter_pdf_pages(pdf_path, num_workers=3, min_pages_per_worker=1))[0] == first
+
+
+def run_script(tmp_path, source, pdf_path):
+    script = tmp_path / "script.py"
+    script.write_text(source)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    return subprocess.run([sys.executable, str(script), pdf_path], env=env, cwd=tmp_path, capture_output=True, text=True, timeout=120)
+
+
+def test_unguarded_script_extracts_in_process(tmp_path):
+    pdf_path = str(tmp_path / "paper.pdf")
+    write_pdf(pdf_path, synthetic_paper_text(random.Random(2), 24))
+    source = (
+        "import sys\n"
+        "from review_feedback_agent.utils import utils\n"
+        "text = utils.pdf_to_text(sys.argv[1])\n"
+        "assert utils._pdf_pool is None\n"
+        "print(len(text))\n"
+    )
+    result = run_script(tmp_path, source, pdf_path)
+    assert result.returncode == 0, result.stderr
+    assert int(result.stdout.split()[-1]) == len(utils.pdf_to_text(pdf_path))
+
+
+def test_guarded_script_extracts_with_pool(tmp_path):
+    pdf_path = str(tmp_path / "paper.pdf")
+    write_pdf(pdf_path, synthetic_paper_text(random.Random(3), 6))
+    source = (
+        "import sys\n"
+        "from review_feedback_agent.utils import utils\n"
+        "if __name__ == '__main__':\n"
+        "    pages = list(utils.iter_pdf_pages(sys.argv[1], num_workers=3, min_pages_per_worker=1))\n"
+        "    assert utils._pdf_pool is not None\n"
+        "    print(len(''.join(pages)))\n"
+    )
+    result = run_script(tmp_path, source, pdf_path)
+    assert result.returncode == 0, result.stderr
+    assert int(result.stdout.split()[-1]) == len(utils.pdf_to_text(pdf_path))
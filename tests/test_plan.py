@@ -0,0 +1,68 @@
+import pytest
+from review_feedback_agent.agents.plan import compile_architecture
+
+
+def test_compile_default_architecture():
+    plan = compile_architecture("Actor(2)->Aggregator->FeedbackCritic->Formatter")
+    assert [node.name for node in plan.nodes] == ["Actor", "Actor", "Aggregator", "FeedbackCritic", "Formatter"]
+    assert [node.inputs for node in plan.nodes] == [(), (), (0, 1), (2,), (3,)]
+    assert [node.replica for node in plan.nodes] == [0, 1, 0, 0, 0]
+    assert plan.levels == ((0, 1), (2,), (3,), (4,))
+
+
+def test_compile_side_by_side_critics():
+    plan = compile_architecture("Actor(2)->FeedbackCritic(2)->Aggregator->Formatter")
+    assert [node.inputs for node in plan.nodes] == [(), (), (0,), (1,), (2, 3), (4,)]
+    assert plan.describe() == (
+        "0: Actor#1; Actor#2\n"
+        "1: FeedbackCritic#3 <- 1; FeedbackCritic#4 <- 2\n"
+        "2: Aggregator#5 <- 3, 4\n"
+        "3: Formatter#6 <- 5"
+    )
+
+
+def test_compile_parallel_and_consecutive_actors():
+    plan = compile_architecture("Actor|Actor->Actor->Aggregator->Formatter")
+    # Steps without inputs do not depend on each other, so all three Actors run side by side
+    assert plan.levels[0] == (0, 1, 2)
+    assert plan.nodes[3].inputs == (0, 1, 2)
+    assert [node.group for node in plan.nodes[:3]] == [0, 1, 2]
+
+
+def test_compile_options():
+    plan = compile_architecture("Actor(2)[pruned=4000, concurrency=1]->Aggregator->Formatter[model=haiku-3.5]")
+    assert plan.nodes[0].options == (("concurrency", "1"), ("pruned", "4000"))
+    assert plan.nodes[1].option("pruned") == "4000"
+    assert plan.nodes[2].option("pruned") is None
+    assert plan.nodes[3].option("model") == "haiku-3.5"
+    assert compile_architecture("Actor(2)[pruned]->Aggregator->Formatter").nodes[0].option("pruned") == ""
+
+
+def test_compile_is_cached():
+    architecture = "Actor(3)->Aggregator->Formatter"
+    assert compile_architecture(architecture) is compile_architecture(architecture)
+
+
+@pytest.mark.parametrize(
+    "architecture, message",
+    [
+        ("Actor->Foo", "Unknown component: Foo"),
+        ("Actor(2)->Aggregator->", "Invalid component specification"),
+        ("Aggregator->Formatter", "cannot start the architecture"),
+        ("Actor(2)->Formatter", "Formatter cannot take the feedback of Actor as input"),
+        ("Actor->Aggregator->Actor", "Aggregator needs at least 2 feedback as input"),
+        ("Actor(2)->Aggregator->Actor", "can only start the architecture"),
+        ("Actor(0)->Aggregator", "must run at least once"),
+        ("Actor(2)->FeedbackCritic(3)", "run FeedbackCritic(2) to process each separately"),
+        ("Actor|Aggregator", "must use the same component"),
+        ("Actor[bogus]", "Unknown option [bogus]"),
+        ("Actor(2)->Aggregator->Formatter[pruned]", "cannot be [pruned]"),
+        ("Actor[pruned=many]", "must be a number"),
+        ("Actor[concurrency=0]", "must be a positive number"),
+        ("Actor[model=]", "needs a model name"),
+    ],
+)
+def test_compile_invalid_architecture(architecture, message):
+    with pytest.raises(ValueError) as error:
+        compile_architecture(architecture)
+    assert message in str(error.value)
@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from benchmarks.fake_engine import FakeEngine
+from review_feedback_agent.agents import FeedbackAgent
+from review_feedback_agent.agents.repair import repair_steps
+from review_feedback_agent.apis import LLM
+
+PAPER = "We propose a method and evaluate it on three benchmarks."
+REVIEW = (
+    "**Summary**: The paper proposes a method.\n\n"
+    "**Weaknesses**:\n"
+    "- The experiments lack strong baselines.\n"
+    "- The proof of Theorem 2 skips a step.\n"
+    "- Figure 3 has no error bars.\n\n"
+    "**Questions**:\n"
+    "1. How sensitive is the method to the learning rate?\n"
+    "2. Why is the second dataset smaller?"
+)
+
+
+def agent(**kwargs) -> FeedbackAgent:
+    return FeedbackAgent(LLM("sonnet-3.5", engine=FakeEngine(latency=0)), **kwargs)
+
+
+def test_repair_steps():
+    plan = agent(architecture="Actor(2)->FeedbackCritic(2)->Aggregator->Formatter").plan
+    assert repair_steps(plan, ["restate_reviewer"]) == {4, 5}
+    assert repair_steps(plan, ["praise_feedback"]) == {5}
+    plan = agent(architecture="Actor(2)->Aggregator->Formatter").plan
+    assert repair_steps(plan, ["addressed_to_author"]) == {2, 3}
+
+
+def test_repair_reruns_only_the_repair_steps():
+    single = agent()
+    result = single(PAPER, REVIEW)
+    repaired = single.repair(PAPER, REVIEW, result, ["restate_reviewer"])
+    assert repaired["repair"]["steps"] == [4, 5]
+    assert repaired["repair"]["calls"] == 2
+    assert repaired["step outputs"][1] == result["step outputs"][1]
+    assert repaired["step outputs"][4] != result["step outputs"][4]
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_repair_of_sharded_result_repairs_each_shard(asynchronous):
+    sharded = agent(shard_size=2)
+    result = sharded(PAPER, REVIEW)
+    assert len(result["shards"]) == 3 and result["escalated steps"] == []
+    if asynchronous:
+        repaired = asyncio.run(sharded.arepair(PAPER, REVIEW, result, ["restate_reviewer"]))
+    else:
+        repaired = sharded.repair(PAPER, REVIEW, result, ["restate_reviewer"])
+    assert len(repaired["shards"]) == 3
+    # The FeedbackCritic and Formatter of every shard are rerun
+    assert repaired["repair"]["steps"] == [4, 5] and repaired["repair"]["calls"] == 6
+    assert all(
+        shard["step outputs"][1] == before["step outputs"][1] for shard, before in zip(repaired["shards"], result["shards"])
+    )
+    positions = [item.span[0] for item in repaired["feedback items"] if item.span is not None]
+    assert positions == sorted(positions)
+
+
+def test_repair_of_sharded_result_needs_the_same_shard_size():
+    result = agent(shard_size=2)(PAPER, REVIEW)
+    with pytest.raises(ValueError, match="shard_size"):
+        agent(shard_size=4).repair(PAPER, REVIEW, result, ["restate_reviewer"])
+
+
+def test_repair_attempts_with_shards():
+    result = agent(shard_size=2, repair_attempts=1, verifier_llm=LLM("sonnet-3.5", engine=FakeEngine(latency=0)))(PAPER, REVIEW)
+    # The made up comments of FakeEngine are not in the review, so each shard is repaired once
+    assert result["reliability"]["failed tests"] == ["comments_in_review"]
+    assert [repair["shard"] for repair in result["repairs"]] == [0, 1, 2]
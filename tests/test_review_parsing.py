@@ -0,0 +1,107 @@
+import pytest
+from review_feedback_agent.agents.incremental import incremental_result, incremental_review
+from review_feedback_agent.agents.sharding import merge_shards
+from review_feedback_agent.utils.feedback_parsing import FeedbackItem, format_feedback_items, parse_feedback
+from review_feedback_agent.utils.review_parsing import diff_review_comments, shard_review, split_review_comments
+
+REVIEW = (
+    "**Summary**: The paper proposes a method.\n\n"
+    "**Weaknesses**:\n"
+    "- The experiments lack strong baselines.\n"
+    "- The proof of Theorem 2 skips a step.\n"
+    "- Figure 3 has no error bars.\n\n"
+    "**Questions**:\n"
+    "1. How sensitive is the method to the learning rate?\n"
+    "2. Why is the second dataset smaller?"
+)
+COMMENTS = [
+    "The experiments lack strong baselines.",
+    "The proof of Theorem 2 skips a step.",
+    "Figure 3 has no error bars.",
+    "How sensitive is the method to the learning rate?",
+    "Why is the second dataset smaller?",
+]
+
+
+def feedback_on(*comments: str) -> str:
+    return format_feedback_items([FeedbackItem(comment, f"Feedback on {comment[:12]}") for comment in comments])
+
+
+def test_split_review_comments():
+    comments = split_review_comments(REVIEW)
+    assert [comment.section for comment in comments] == ["Weaknesses"] * 3 + ["Questions"] * 2
+    assert [REVIEW[slice(*comment.span)] for comment in comments] == [f"- {c}" for c in COMMENTS[:3]] + [
+        f"{i}. {c}" for i, c in enumerate(COMMENTS[3:], 1)
+    ]
+
+
+def test_diff_review_comments_ignores_case_and_whitespace():
+    revised = REVIEW.replace("Figure 3 has no error bars.", "FIGURE 3  has no\nerror bars.").replace(
+        "skips a step", "skips the bounded variance step"
+    ) + "\n3. Is the code available?"
+    unchanged, changed = diff_review_comments(REVIEW, revised)
+    assert len(unchanged) == 4
+    assert [comment.text for comment in changed] == ["- The proof of Theorem 2 skips the bounded variance step.", "3. Is the code available?"]
+
+
+def test_incremental_review_reuses_feedback_on_unchanged_comments():
+    previous_result = {"feedback items": parse_feedback(feedback_on(*COMMENTS[:3]), REVIEW)}
+    revised = REVIEW.replace("skips a step", "skips the bounded variance step").replace("**Summary**:", "**Summary**: Revised.")
+    changed_review, reused, changed = incremental_review(revised, REVIEW, previous_result)
+
+    assert changed == 1
+    assert [item.comment for item in reused] == [COMMENTS[0], COMMENTS[2]]
+    # Spans are those of the comments in the revised review
+    assert all(revised[slice(*item.span)] == item.comment.rstrip(".") for item in reused)
+    # Only the edited comment is run again, with the summary kept as context
+    assert changed_review == "**Summary**: Revised. The paper proposes a method.\n\n**Weaknesses**: - The proof of Theorem 2 skips the bounded variance step."
+
+    new_result = {"formatted feedback": feedback_on("The proof of Theorem 2 skips the bounded variance step.")}
+    merged = incremental_result(new_result, revised, reused, changed)
+    assert [item.comment[:20] for item in merged["feedback items"]] == [
+        "The experiments lack",
+        "The proof of Theorem",
+        "Figure 3 has no erro",
+    ]
+    assert merged["incremental"] == {"changed comments": 1, "reused items": 2, "new items": 1}
+
+
+def test_incremental_review_without_changes():
+    previous_result = {"feedback items": [item.to_list() for item in parse_feedback(feedback_on(COMMENTS[0]), REVIEW)]}
+    changed_review, reused, changed = incremental_review(REVIEW, REVIEW, previous_result)
+    assert changed_review is None and changed == 0 and len(reused) == 1
+
+
+def test_shard_review_spreads_comments_evenly():
+    shards = shard_review(REVIEW, 2)
+    assert len(shards) == 3
+    assert [len(split_review_comments(shard)) for shard in shards] == [2, 1, 2]
+    assert all(shard.startswith("**Summary**: The paper proposes a method.") for shard in shards)
+    assert shard_review(REVIEW, 5) == [REVIEW]
+    with pytest.raises(ValueError):
+        shard_review(REVIEW, 0)
+
+
+def shard_result(formatted: str) -> dict:
+    return {
+        "initial feedback": [formatted],
+        "aggregated feedback": formatted,
+        "critiqued feedback": formatted,
+        "formatted feedback": formatted,
+        "pruning stats": [],
+        "escalated steps": [],
+    }
+
+
+def test_merge_shards_orders_items_by_review_position():
+    # Shards can list their feedback in any order, and finish in any order
+    results = [
+        shard_result(feedback_on(COMMENTS[4], COMMENTS[3])),
+        shard_result(feedback_on(COMMENTS[2], "A comment that is not in the review.", COMMENTS[0])),
+        shard_result(feedback_on(COMMENTS[1])),
+    ]
+    merged = merge_shards(REVIEW, results)
+    assert [item.comment for item in merged["feedback items"]] == [*COMMENTS, "A comment that is not in the review."]
+    assert parse_feedback(merged["formatted feedback"], REVIEW) == merged["feedback items"]
+    assert merged["shards"] is results
+    assert len(merged["initial feedback"]) == 3
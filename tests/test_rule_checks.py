@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+from review_feedback_agent.reliability.rule_checks import (
+    check_addressed_to_author,
+    check_comments_in_review,
+    check_restate_reviewer,
+    run_rule_checks,
+)
+from review_feedback_agent.utils.feedback_parsing import NO_FEEDBACK_MESSAGE, FeedbackItem, parse_feedback
+
+REVIEW = "The experiments lack a comparison with strong recent baselines on the main benchmark."
+
+
+def item(feedback: str, comment: str = "The experiments lack a comparison with strong recent baselines") -> FeedbackItem:
+    return parse_feedback(f"- **Reviewer comment:** {comment}\n- **Feedback to the reviewer:** {feedback}", REVIEW)[0]
+
+
+def test_comments_in_review():
+    assert check_comments_in_review([item("Which baselines?")], REVIEW) is True
+    assert check_comments_in_review([item("Which baselines?", "The experiments lack ... strong recent baselines")], REVIEW) is True
+    assert check_comments_in_review([item("Which baselines?", "Lemma 7 of Appendix XYZ")], REVIEW) is False
+    assert check_comments_in_review([item("Which baselines?", "The experiments lack comparisons with recent strong baselines")], REVIEW) is None
+
+
+def test_addressed_to_author():
+    assert check_addressed_to_author([item("Could you name the baselines the authors should compare against?")]) is True
+    assert check_addressed_to_author([item("Your experiments need baselines, which would help readers.")]) is False
+    assert check_addressed_to_author([item("Add baselines to your experiments."), item("Readers need error bars.")]) is False
+    assert check_addressed_to_author([item("Could you name the baselines?")]) is None
+
+
+def test_addressed_to_author_single_phrase_is_undecided():
+    # A single phrase can be incidental, e.g. feedback to the reviewer about readers of the review
+    assert check_addressed_to_author([item("Your comment would help readers if you named the baselines.")]) is None
+    assert check_addressed_to_author([item("Add baselines to your experiments.")]) is None
+
+
+def test_addressed_to_author_ignores_quoted_text():
+    quoting_review = [
+        item('You wrote "your method is not novel"; could you name the prior work the authors should cite?'),
+        item("Your comment 'your results are weak and your experiments too small' could say which results the authors should add."),
+        item("The authors' claim “readers will find your approach obvious” needs a reference in your comment."),
+        item("Your question about ‘your analysis’ could point the authors to the relevant section."),
+    ]
+    assert check_addressed_to_author(quoting_review) is True
+    # Apostrophes are not quotes
+    assert check_addressed_to_author([item("The authors' readers need your experiments' baselines and your results.")]) is False
+
+
+def test_restate_reviewer():
+    restated = item("The experiments lack a comparison with strong recent baselines on the benchmark.")
+    assert check_restate_reviewer([restated]) is False
+    assert check_restate_reviewer([item("Could you name which methods you consider strong?")]) is True
+    assert check_restate_reviewer([item("Fine.")]) is None
+
+
+def test_run_rule_checks_leaves_undecided_tests_out():
+    feedback = "- **Reviewer comment:** The experiments lack a comparison with strong recent baselines\n- **Feedback to the reviewer:** Could you name the baselines?"
+    verdicts = run_rule_checks(feedback, REVIEW, ["comments_in_review", "addressed_to_author", "restate_reviewer", "praise_feedback"])
+    assert verdicts == {"comments_in_review": True, "restate_reviewer": True}
+
+
+def test_run_rule_checks_without_feedback():
+    assert run_rule_checks(NO_FEEDBACK_MESSAGE, REVIEW, ["restate_reviewer"]) == {"restate_reviewer": True}
+    assert run_rule_checks("unparseable output", REVIEW, ["restate_reviewer"]) == {}
+
+
+def test_runtime_does_not_import_tests_package():
+    code = (
+        "import sys\n"
+        "import review_feedback_agent, review_feedback_agent.batch\n"
+        "assert not any(name.startswith('review_feedback_agent.tests') for name in sys.modules)\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
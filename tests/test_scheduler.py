@@ -0,0 +1,125 @@
+import pytest
+from review_feedback_agent.apis import scheduler as scheduler_module
+from review_feedback_agent.apis.scheduler import DeadlineExceeded, Scheduler, TokenBucket
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Records the waits of the scheduler instead of sleeping
+    recorded = []
+    monkeypatch.setattr(scheduler_module.time, "sleep", recorded.append)
+    return recorded
+
+
+def test_token_bucket_overdraws_in_order():
+    bucket = TokenBucket(60)
+    assert bucket.reserve(60) == 0.0
+    # The bucket refills at one unit per second, so later reservations queue up behind each other
+    assert bucket.reserve(30) == pytest.approx(30, abs=0.1)
+    assert bucket.reserve(30) == pytest.approx(60, abs=0.1)
+
+
+def test_token_bucket_caps_amount_at_capacity():
+    bucket = TokenBucket(60)
+    bucket.reserve(60)
+    assert bucket.reserve(1000) == pytest.approx(60, abs=0.1)
+
+
+def test_token_bucket_floor_keeps_reserve():
+    bucket = TokenBucket(60)
+    # A batch caller leaving 20% of the capacity to others waits once the level would drop below it
+    assert bucket.reserve(48, floor=0.2) == 0.0
+    assert bucket.reserve(1, floor=0.2) == pytest.approx(1, abs=0.1)
+    assert TokenBucket(60).reserve(60, floor=0.2) == 0.0
+
+
+def test_token_bucket_charge_delays_next_reservation():
+    bucket = TokenBucket(60)
+    bucket.charge(90)
+    assert bucket.reserve(1) == pytest.approx(31, abs=0.1)
+
+
+def test_scheduler_batch_priority_waits_for_reserve():
+    scheduler = Scheduler(requests_per_minute=10, batch_reserve=0.5)
+    waits = [scheduler._acquire(0, "batch") for _ in range(6)]
+    assert waits[:5] == [0.0] * 5
+    assert waits[5] > 0
+    # Interactive calls can still use the reserve
+    assert scheduler._acquire(0, "interactive") == 0.0
+    with pytest.raises(ValueError):
+        scheduler._acquire(0, "urgent")
+
+
+def test_scheduler_retries_with_backoff(sleeps):
+    errors = [StatusError(529), StatusError(500)]
+
+    def call(remaining):
+        if errors:
+            raise errors.pop(0)
+        return "done"
+
+    assert Scheduler(initial_backoff=1.0).run(call) == "done"
+    assert len(sleeps) == 2
+    # Jittered exponential backoff: at most 1s, then at most 2s
+    assert 0 <= sleeps[0] <= 1.0 and 0 <= sleeps[1] <= 2.0
+
+
+def test_scheduler_backoff_respects_retry_after(sleeps):
+    errors = [StatusError(429, {"retry-after": "7"})]
+
+    def call(remaining):
+        if errors:
+            raise errors.pop(0)
+        return "done"
+
+    scheduler = Scheduler(initial_backoff=1.0)
+    assert scheduler.run(call) == "done"
+    assert sleeps[0] == 7.0
+    # A rate-limit response pauses the other callers too
+    assert scheduler._acquire(0, "interactive") == pytest.approx(7, abs=0.1)
+
+
+def test_scheduler_does_not_retry_permanent_errors(sleeps):
+    calls = []
+
+    def call(remaining):
+        calls.append(remaining)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        Scheduler().run(call)
+    assert len(calls) == 1 and sleeps == []
+
+
+def test_scheduler_gives_up_after_max_retries(sleeps):
+    calls = []
+
+    def call(remaining):
+        calls.append(remaining)
+        raise ConnectionError("reset")
+
+    with pytest.raises(ConnectionError):
+        Scheduler(max_retries=2).run(call)
+    assert len(calls) == 3 and len(sleeps) == 2
+
+
+def test_scheduler_deadline(sleeps):
+    def call(remaining):
+        raise StatusError(503, {"retry-after": "60"})
+
+    with pytest.raises(DeadlineExceeded):
+        Scheduler(timeout=5).run(call)
+    assert sleeps == []
+
+
+def test_scheduler_passes_remaining_time():
+    remaining = []
+    Scheduler(timeout=30).run(lambda left: remaining.append(left))
+    assert 29 < remaining[0] <= 30
@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+from benchmarks.fake_engine import FakeEngine
+from review_feedback_agent.agents import FeedbackAgent
+from review_feedback_agent.apis import LLM
+
+PAPER = "We propose a method and evaluate it on three benchmarks. " * 200
+REVIEWS = [f"**Weaknesses**: Comment {i} about the experiments." for i in range(3)]
+
+
+def paper_tokens(agent: FeedbackAgent) -> int:
+    # Tokens of the system prompt and paper block, the prefix a review shares with the other reviews of the paper
+    message = agent.components[0]._build_prefixed_message(PAPER, REVIEWS[0])
+    return (len(agent.components[0].system_prompt) + len(str(message[0]["text"]))) // 4
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_other_reviews_read_the_paper_prefix_of_the_lead(asynchronous):
+    engine = FakeEngine(latency=0.02, prompt_cache=True)
+    agent = FeedbackAgent(LLM("sonnet-3.5", engine=engine), shared_prefix=True)
+    if asynchronous:
+        results = asyncio.run(agent.acall_reviews(PAPER, REVIEWS))
+    else:
+        results = agent.call_reviews(PAPER, REVIEWS)
+    assert all(result["formatted feedback"] for result in results)
+
+    paper_prompts = {component.system_prompt for component in agent.components if component.uses_paper}
+    paper_calls = [call for call in engine.calls if call.system_prompt in paper_prompts]
+    # Actor(2), Aggregator and FeedbackCritic take the paper: the lead writes their prefixes, which the 2 other
+    # reviews read, and the replicas of the lead run side by side, so each writes it
+    assert len(engine.calls) == 15 and len(paper_calls) == 12
+    reads = [call for call in paper_calls if call.cache_read_tokens]
+    assert len(reads) == 8
+    assert all(call.cache_read_tokens >= paper_tokens(agent) for call in reads)
+
+
+def test_reviews_are_not_ordered_without_shared_prefix():
+    agent = FeedbackAgent(LLM("sonnet-3.5", engine=FakeEngine(latency=0)))
+    session = agent.session(PAPER)
+    with session._warmup() as warmup:
+        assert warmup is None
+    assert len(agent.call_reviews(PAPER, REVIEWS)) == 3
+
+
+class RecordingSemaphore:
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.entered = 0
+
+    def __enter__(self):
+        self.entered += 1
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def test_streamed_steps_take_their_group_limit():
+    agent = FeedbackAgent(LLM("sonnet-3.5", engine=FakeEngine(latency=0)), "Actor(2)->Aggregator->FeedbackCritic->Formatter[concurrency=1]")
+    limits = {}
+
+    def group_limits(semaphore_type):
+        limits.update({node.group: RecordingSemaphore(1) for node in agent.plan.nodes if node.option("concurrency")})
+        return limits
+
+    agent._group_limits = group_limits
+    events = list(agent.stream(PAPER, REVIEWS[0]))
+    assert any(event["event"] == "token" for event in events)
+    assert [limit.entered for limit in limits.values()] == [1]